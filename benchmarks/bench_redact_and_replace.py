@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Times redact_and_replace on a single synthetic page with many redactions, comparing the
+batched page.apply_redactions() call against applying after every redaction annotation.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import fitz
+from faker import Faker
+
+from highlighter import Highlighter, PageResult, Position
+
+WORD_WIDTH = 40
+LINE_HEIGHT = 14
+
+
+def make_page(n_words: int, pdf_path: str) -> PageResult:
+    """
+    Write a one page PDF with n_words words and return its prediction_positions entry
+    """
+    doc = fitz.open()
+    page = doc.newPage(width=612, height=792)
+    result = PageResult([612, 792], 0)
+    per_line = int((612 - 72) / (WORD_WIDTH + 4))
+    for i in range(n_words):
+        x = 36 + (i % per_line) * (WORD_WIDTH + 4)
+        y = 36 + (i // per_line) * LINE_HEIGHT
+        page.insertText((x, y + 10), f"w{i:05d}", fontsize=9)
+        result.labels["name"] += 1
+        result.positions.append(
+            Position(
+                bbTop=y,
+                bbBot=y + 12,
+                bbLeft=x,
+                bbRight=x + WORD_WIDTH,
+                label=("name", 6),
+            )
+        )
+    doc.save(pdf_path)
+    return result
+
+
+def replace_per_redaction(highlighter: Highlighter, pdf_path: str, output_path: str):
+    """
+    Previous redact_and_replace behaviour: apply_redactions after every annotation
+    """
+    fake = Faker()
+    doc = fitz.open(pdf_path)
+    for preds in highlighter.prediction_positions:
+        page = doc[preds.page_num]
+        rects = highlighter._page_rects(page, preds)
+        for token, annotation in zip(preds.positions, rects):
+            page.addRedactAnnot(
+                highlighter._inflate(annotation),
+                text=fake.name(),
+                fill=(1, 1, 1),
+                fontsize=15,
+            )
+            page.apply_redactions()
+    doc.save(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--words", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "source.pdf")
+        output_path = os.path.join(tmp, "output.pdf")
+        for n_words in args.words:
+            highlighter = Highlighter([])
+            highlighter.prediction_positions = [make_page(n_words, pdf_path)]
+            timings = {}
+            for name, run in (
+                ("per_redaction", replace_per_redaction),
+                (
+                    "batched",
+                    lambda h, src, out: h.redact_and_replace(
+                        src, out, fill_text=dict(name="name")
+                    ),
+                ),
+            ):
+                best = float("inf")
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    run(highlighter, pdf_path, output_path)
+                    best = min(best, time.perf_counter() - start)
+                timings[name] = best
+            print(
+                f"{n_words:>6} redactions: per_redaction {timings['per_redaction']:.3f}s, "
+                f"batched {timings['batched']:.3f}s, "
+                f"speedup {timings['per_redaction'] / timings['batched']:.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
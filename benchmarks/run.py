@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for the matching and rendering hot paths. Generates synthetic documents of
+each requested size, times collect_positions (also on an OnDoc loaded from a cache file and
+with cache misses and hits), collect_page_wise_positions, highlight_pdf, redact_pdf,
+redact_and_replace and the OnDoc properties, records the peak Python heap of each step with
+tracemalloc and writes everything to JSON.
+
+    python benchmarks/run.py --pages 1 10 100 --tokens 100 400 --predictions 0.05 --output bench.json
+    python benchmarks/run.py --pages 10 --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fitz
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import make_ocr, make_pdf, make_predictions  # noqa: E402
+
+from highlighter import Highlighter, MemoryCache, OnDoc  # noqa: E402
+
+
+def measure(func, repeat: int) -> dict:
+    """
+    Best and mean wall time over repeat runs, then one extra run under tracemalloc for the peak
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(best=min(timings), mean=sum(timings) / len(timings), peak_bytes=peak)
+
+
+def quiet(func):
+    """
+    Silence the redaction warnings printed by the render methods
+    """
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+
+    return run
+
+
+def page_wise(ocr, predictions):
+    """
+    Split full-document predictions into page-wise predictions with page offsets
+    """
+    bounds = [page["tokens"][0]["doc_offset"]["start"] for page in ocr]
+    page_preds = [[] for _ in ocr]
+    for pred in predictions[0]:
+        page_idx = int(np.searchsorted(bounds, pred["start"], side="right")) - 1
+        shift = bounds[page_idx]
+        page_preds[page_idx].append(
+            dict(pred, start=pred["start"] - shift, end=pred["end"] - shift)
+        )
+    return page_preds
+
+
+def benchmark_case(n_pages, n_tokens, prediction_rate, repeat, render, tmp):
+    ocr = make_ocr(n_pages, n_tokens)
+    n_predictions = max(1, int(n_pages * n_tokens * prediction_rate))
+    predictions = make_predictions(ocr, n_predictions)
+    page_predictions = page_wise(ocr, predictions)
+    labels = {pred["label"] for pred in predictions[0]}
+    case = dict(pages=n_pages, tokens_per_page=n_tokens, predictions=n_predictions)
+
+    steps = dict()
+    for prop in ("full_text", "page_text", "page_results", "block_text"):
+        steps[f"OnDoc.{prop}"] = lambda prop=prop: getattr(OnDoc(ocr), prop)
+    steps["OnDoc.ocr_confidence"] = lambda: OnDoc(ocr).ocr_confidence()
+    steps["OnDoc.token_store"] = lambda: OnDoc(ocr).token_store
+    for engine in ("loop", "vectorized"):
+        # a new OnDoc per run, so the vectorized engine pays for building the token store
+        steps[f"collect_positions[{engine}]"] = lambda engine=engine: (
+            Highlighter(ocr).collect_positions(predictions, engine=engine)
+        )
+        steps[f"collect_page_wise_positions[{engine}]"] = lambda engine=engine: (
+            Highlighter(ocr).collect_page_wise_positions(page_predictions, engine=engine)
+        )
+    # the same OnDoc reused, e.g. loaded with OnDoc.load or kept between re-renders
+    ondoc = OnDoc(ocr)
+    ondoc.token_store
+    steps["collect_positions[vectorized, built store]"] = lambda: Highlighter(
+        ondoc
+    ).collect_positions(predictions, engine="vectorized")
+
+    # a new OnDoc memory-mapped from a cache file per run, as batch jobs load them
+    cache_path = os.path.join(tmp, f"ocr_{n_pages}_{n_tokens}.ondoc")
+    OnDoc(ocr).save(cache_path)
+    steps["OnDoc.full_text[loaded]"] = lambda: OnDoc.load(cache_path, verify=False).full_text
+    for engine in ("loop", "vectorized"):
+        steps[f"collect_positions[{engine}, loaded]"] = lambda engine=engine: Highlighter(
+            OnDoc.load(cache_path, verify=False)
+        ).collect_positions(predictions, engine=engine)
+
+    # a cache hit on a new OnDoc, as for a new Highlighter per request, against a miss and no cache
+    json_path = os.path.join(tmp, f"ocr_{n_pages}_{n_tokens}.json")
+    with open(json_path, "w") as f:
+        json.dump(ocr, f)
+    cache = MemoryCache()
+    Highlighter(ocr, cache=cache).collect_positions(predictions)
+    Highlighter(ocr, cache=cache, document_key="doc").collect_positions(predictions)
+    Highlighter(OnDoc.from_stream(json_path), cache=cache).collect_positions(predictions)
+    steps["collect_positions[no cache]"] = lambda: Highlighter(ocr).collect_positions(
+        predictions
+    )
+    steps["collect_positions[cache miss]"] = lambda: Highlighter(
+        ocr, cache=MemoryCache()
+    ).collect_positions(predictions)
+    steps["collect_positions[cache hit, fingerprint]"] = lambda: Highlighter(
+        ocr, cache=cache
+    ).collect_positions(predictions)
+    steps["collect_positions[cache hit, document_key]"] = lambda: Highlighter(
+        ocr, cache=cache, document_key="doc"
+    ).collect_positions(predictions)
+    steps["collect_positions[cache hit, streamed]"] = lambda: Highlighter(
+        OnDoc.from_stream(json_path), cache=cache
+    ).collect_positions(predictions)
+
+    if render:
+        pdf_path = os.path.join(tmp, f"source_{n_pages}_{n_tokens}.pdf")
+        output_path = os.path.join(tmp, "output.pdf")
+        make_pdf(ocr, pdf_path)
+        highlighter = Highlighter(ocr)
+        highlighter.collect_positions(predictions)
+        steps["highlight_pdf"] = lambda: highlighter.highlight_pdf(pdf_path, output_path)
+        steps["redact_pdf"] = quiet(lambda: highlighter.redact_pdf(pdf_path, output_path))
+        steps["redact_and_replace"] = quiet(
+            lambda: highlighter.redact_and_replace(
+                pdf_path, output_path, fill_text=dict.fromkeys(labels, "numerify")
+            )
+        )
+
+    results = []
+    for name, func in steps.items():
+        result = dict(case, benchmark=name, **measure(func, repeat))
+        print(
+            f"{n_pages:>5}p {n_tokens:>5}t {n_predictions:>6}pr  {name:<42}"
+            f"{result['best'] * 1000:>10.2f} ms {result['peak_bytes'] / 2 ** 20:>9.2f} MiB",
+            flush=True,
+        )
+        results.append(result)
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {
+            (r["pages"], r["tokens_per_page"], r["predictions"], r["benchmark"]): r
+            for r in json.load(f)["results"]
+        }
+    print(f"\ncompared to {baseline_path} (best time ratio, >1 is slower)")
+    for result in results:
+        key = (result["pages"], result["tokens_per_page"], result["predictions"], result["benchmark"])
+        if key in baseline:
+            ratio = result["best"] / baseline[key]["best"]
+            print(f"  {key}: {ratio:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--tokens", type=int, nargs="+", default=[100, 400], help="tokens per page")
+    parser.add_argument(
+        "--predictions", type=float, nargs="+", default=[0.05], help="predictions per token"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-render", action="store_true", help="skip the PyMuPDF benchmarks")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="previous output JSON to compare against")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_pages, n_tokens, rate in itertools.product(args.pages, args.tokens, args.predictions):
+            results.extend(
+                benchmark_case(n_pages, n_tokens, rate, args.repeat, not args.no_render, tmp)
+            )
+    meta = dict(
+        time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        pymupdf=fitz.VersionBind,
+        platform=platform.platform(),
+        args=vars(args),
+    )
+    with open(args.output, "w") as f:
+        json.dump(dict(meta=meta, results=results), f, indent=2)
+    print(f"\nwrote {len(results)} results to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Synthetic ondocument OCR results, predictions and matching PDFs for benchmarks. Pages follow
+the SAMPLE_OCR shape in tests/conftest.py, with page text, blocks and character confidences
+added so every OnDoc property has something to work on.
+"""
+from typing import List
+import random
+
+import fitz
+
+PAGE_WIDTH, PAGE_HEIGHT = 2550, 3300
+PDF_WIDTH, PDF_HEIGHT = 612, 792
+LINE_HEIGHT = 60
+TOKEN_GAP = 22
+CHAR_WIDTH = 24
+MARGIN = 150
+
+
+def make_ocr(n_pages: int, tokens_per_page: int, seed: int = 0) -> List[dict]:
+    """
+    Build an ondocument-shaped OCR result with tokens_per_page tokens laid out in lines
+    """
+    rng = random.Random(seed)
+    ocr, doc_offset = [], 0
+    for page_num in range(n_pages):
+        tokens, chars, words = [], [], []
+        page_offset, left, top = 0, MARGIN, MARGIN
+        for _ in range(tokens_per_page):
+            word = "".join(rng.choice("abcdefghij0123456789") for _ in range(rng.randint(2, 10)))
+            width = len(word) * CHAR_WIDTH
+            if left + width > PAGE_WIDTH - MARGIN:
+                left, top = MARGIN, top + LINE_HEIGHT + 20
+            position = dict(
+                bbBot=top + LINE_HEIGHT, bbTop=top, bbLeft=left, bbRight=left + width
+            )
+            tokens.append(
+                dict(
+                    block_offset=dict(start=page_offset, end=page_offset + len(word)),
+                    page_num=page_num,
+                    doc_offset=dict(start=doc_offset, end=doc_offset + len(word)),
+                    text=word,
+                    position=position,
+                    page_offset=dict(start=page_offset, end=page_offset + len(word)),
+                )
+            )
+            chars.extend(
+                dict(text=char, page_num=page_num, confidence=rng.uniform(60, 100))
+                for char in word
+            )
+            words.append(word)
+            left += width + TOKEN_GAP
+            doc_offset += len(word) + 1
+            page_offset += len(word) + 1
+        text = " ".join(words)
+        ocr.append(
+            dict(
+                pages=[
+                    dict(
+                        page_num=page_num,
+                        size=dict(height=PAGE_HEIGHT, width=PAGE_WIDTH),
+                        text=text,
+                    )
+                ],
+                tokens=tokens,
+                chars=chars,
+                blocks=[dict(text=text)],
+            )
+        )
+        doc_offset += 1
+    return ocr
+
+
+def make_predictions(
+    ocr: List[dict],
+    n_predictions: int,
+    max_tokens: int = 6,
+    labels=("name", "date", "amount", "company"),
+    seed: int = 0,
+) -> List[List[dict]]:
+    """
+    Build full-document predictions, each spanning 1 to max_tokens consecutive tokens of a page
+    """
+    rng = random.Random(seed)
+    predictions = []
+    for _ in range(n_predictions):
+        tokens = rng.choice(ocr)["tokens"]
+        first = rng.randrange(len(tokens))
+        span = tokens[first : first + rng.randint(1, max_tokens)]
+        predictions.append(
+            dict(
+                start=span[0]["doc_offset"]["start"],
+                end=span[-1]["doc_offset"]["end"],
+                label=rng.choice(labels),
+                text=" ".join(token["text"] for token in span),
+            )
+        )
+    return [predictions]
+
+
+def make_pdf(ocr: List[dict], pdf_path: str):
+    """
+    Write a PDF with a text line wherever the synthetic OCR has one
+    """
+    xnorm, ynorm = PDF_WIDTH / PAGE_WIDTH, PDF_HEIGHT / PAGE_HEIGHT
+    doc = fitz.open()
+    for page_ocr in ocr:
+        page = doc.newPage(width=PDF_WIDTH, height=PDF_HEIGHT)
+        lines = dict()
+        for token in page_ocr["tokens"]:
+            lines.setdefault(token["position"]["bbTop"], []).append(token)
+        # one text insertion per line keeps generation fast, glyphs only roughly match the boxes
+        for top, tokens in lines.items():
+            page.insertText(
+                (tokens[0]["position"]["bbLeft"] * xnorm, (top + LINE_HEIGHT) * ynorm),
+                " ".join(token["text"] for token in tokens),
+                fontsize=LINE_HEIGHT * ynorm,
+            )
+    doc.save(pdf_path)
@@ -1,2 +1,10 @@
 from .highlighter import Highlighter
-from .ondoc import OnDoc
\ No newline at end of file
+from .ondoc import OnDoc
+from .tokens import TokenStore
+from .batch import BatchJob, BatchResult, batch_label_summary, highlight_batch
+from .stream import PageStream, iter_ondoc_pages
+from .cache import DiskCache, MemoryCache, PositionCache
+from .instrumentation import Instrumentation, Recorder
+from .labels import LabelIndex
+from .records import PageResult, Position
+from .replace import FakerProvider, ReplacementText, TextProvider
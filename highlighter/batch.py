@@ -0,0 +1,178 @@
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from pathlib import Path
+import json
+import os
+import time
+import traceback
+from .highlighter import Highlighter, RENDER_MODES
+from .labels import LabelIndex
+from .ondoc import OnDoc
+from .storage import MAGIC
+
+
+class BatchJob(NamedTuple):
+    """
+    One document to render in a batch
+
+    ocr_result {List[dict]}: ondocument OCR result (or OnDoc) of the document, or the path of its JSON
+                             file or of an OnDoc.save cache file, loaded in the worker (see load_ocr)
+    predictions {List[List[dict]]}: prediction output from ModelGroupPredict, or the path of its JSON file
+    pdf_path {str}: path to source PDF, or its bytes
+    output_path {str}: path of labeled PDF copy to create
+    mode {str}: "highlight", "redact" or "replace"
+    options {dict}: keyword arguments of the render output (e.g. color_map, include_toc, fill_text),
+                    plus "page_wise" to use collect_page_wise_positions, "engine" for the matcher and
+                    "include_pred_text" (default: True for replace, so the same original text gets the
+                    same fake value, else False)
+    """
+
+    ocr_result: List[dict]
+    predictions: List[List[dict]]
+    pdf_path: str
+    output_path: str
+    mode: str = "highlight"
+    options: Optional[dict] = None
+
+
+class BatchResult(NamedTuple):
+    """
+    Outcome of one BatchJob, error holds the formatted traceback if the job failed and labels
+    the document's label counts (LabelIndex.totals) if it succeeded
+    """
+
+    index: int
+    output_path: str
+    seconds: float
+    error: Optional[str] = None
+    labels: Optional[Dict[str, int]] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def load_ocr(ocr_result: Union[str, Path, List[dict], OnDoc]) -> Union[List[dict], OnDoc]:
+    """
+    Return ocr_result, loading it first if it is a path: a cache file written by OnDoc.save is
+    memory-mapped without hashing its data section (that would read every array of every job) and
+    a JSON file is streamed page by page (see OnDoc.from_stream)
+    """
+    if not isinstance(ocr_result, (str, Path)):
+        return ocr_result
+    with open(ocr_result, "rb") as f:
+        is_cache = f.read(len(MAGIC)) == MAGIC
+    return OnDoc.load(ocr_result, verify=False) if is_cache else OnDoc.from_stream(ocr_result)
+
+
+def load_predictions(predictions: Union[str, Path, List[List[dict]]]) -> List[List[dict]]:
+    """
+    Return predictions, reading them from a JSON file first if they are a path
+    """
+    if not isinstance(predictions, (str, Path)):
+        return predictions
+    with open(predictions) as f:
+        return json.load(f)
+
+
+def run_job(job: BatchJob) -> LabelIndex:
+    """
+    Match and render a single job in the current process
+
+    Returns:
+        LabelIndex -- label counts of the document
+    """
+    if job.mode not in RENDER_MODES:
+        raise Exception(f"Job mode must be one of {RENDER_MODES}, not '{job.mode}'")
+    options = dict(job.options or {})
+    page_wise = options.pop("page_wise", False)
+    engine = options.pop("engine", "loop")
+    include_pred_text = options.pop("include_pred_text", job.mode == "replace")
+    highlight = Highlighter(load_ocr(job.ocr_result))
+    predictions = load_predictions(job.predictions)
+    if page_wise:
+        highlight.collect_page_wise_positions(
+            predictions, include_pred_text=include_pred_text, engine=engine
+        )
+    else:
+        highlight.collect_positions(
+            predictions, include_pred_text=include_pred_text, engine=engine
+        )
+    highlight.render(
+        job.pdf_path, [dict(options, mode=job.mode, output_path=job.output_path)]
+    )
+    return highlight.label_index
+
+
+def _run_chunk(chunk: List[Tuple[int, BatchJob]]) -> List[BatchResult]:
+    results = []
+    for index, job in chunk:
+        start = time.perf_counter()
+        labels, error = None, None
+        try:
+            labels = dict(run_job(job).totals)
+        except Exception:
+            error = traceback.format_exc()
+        results.append(
+            BatchResult(index, job.output_path, time.perf_counter() - start, error, labels)
+        )
+    return results
+
+
+def highlight_batch(
+    jobs: Iterable[BatchJob],
+    max_workers: Optional[int] = None,
+    chunksize: int = 1,
+) -> Iterator[BatchResult]:
+    """
+    Highlight, redact or redact and replace many documents across a pool of worker processes.
+    Results are yielded as soon as their chunk finishes (not in job order) and a failing job
+    only produces a BatchResult with an error instead of stopping the batch.
+
+    Arguments:
+        jobs {Iterable[BatchJob]} -- BatchJob (or plain (ocr_result, predictions, pdf_path, output_path, mode)
+                                     tuples), consumed lazily so that only a few chunks are held in memory
+        max_workers {int} -- number of worker processes (default: number of CPUs)
+        chunksize {int} -- number of jobs sent to a worker at once, raise for many small documents
+
+    Returns:
+        Iterator[BatchResult] -- one result per job, BatchResult.index is the job's position in jobs
+
+    Example:
+        jobs = [BatchJob(ocr, preds, 'a.pdf', 'a_highlighted.pdf', 'highlight')]
+        for result in highlight_batch(jobs, max_workers=8):
+            if not result.ok:
+                print(result.output_path, result.error)
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    indexed_jobs = ((i, BatchJob(*job)) for i, job in enumerate(jobs))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = dict()
+        while True:
+            chunk = list(islice(indexed_jobs, chunksize))
+            if chunk:
+                pending[executor.submit(_run_chunk, chunk)] = chunk
+            # keep every worker busy with one queued chunk without buffering the whole batch
+            if pending and (not chunk or len(pending) >= 2 * max_workers):
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from _chunk_results(future, pending.pop(future))
+            if not chunk and not pending:
+                break
+
+
+def _chunk_results(future, chunk: List[Tuple[int, BatchJob]]) -> List[BatchResult]:
+    try:
+        return future.result()
+    except Exception:
+        # the worker process itself died, e.g. BrokenProcessPool
+        error = traceback.format_exc()
+        return [BatchResult(index, job.output_path, 0.0, error) for index, job in chunk]
+
+
+def batch_label_summary(results: Iterable[BatchResult]) -> dict:
+    """
+    Aggregate the label counts of the successful results of a batch (see LabelIndex.aggregate)
+    """
+    return LabelIndex.aggregate(result.labels for result in results if result.ok)
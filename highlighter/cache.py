@@ -0,0 +1,115 @@
+from typing import List, Optional, Union
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+
+def cache_key(fingerprint: str, predictions: list, **params) -> str:
+    """
+    Content address of a collect_positions result: a hash of the OCR document fingerprint
+    (OnDoc.fingerprint), the predictions and any matching parameters that change the output
+    """
+    digest = hashlib.sha256(fingerprint.encode("utf-8"))
+    digest.update(json.dumps(predictions, sort_keys=True, default=str).encode("utf-8"))
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PositionCache(ABC):
+    """
+    Base class for prediction_positions caches. Values are stored pickled so callers always
+    get their own copy; subclasses only implement _load and _store of the pickled bytes.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        """
+        Return the cached prediction_positions for key, None on a miss
+        """
+        data = self._load(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(data)
+
+    def set(self, key: str, prediction_positions: List[dict]):
+        self._store(key, pickle.dumps(prediction_positions, pickle.HIGHEST_PROTOCOL))
+
+    @property
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses)
+
+    @abstractmethod
+    def _load(self, key: str) -> Optional[bytes]:
+        """
+        Return the pickled bytes stored under key, None if there are none
+        """
+
+    @abstractmethod
+    def _store(self, key: str, data: bytes):
+        """
+        Store the pickled bytes under key
+        """
+
+
+class MemoryCache(PositionCache):
+    """
+    In-process LRU cache holding at most maxsize results
+    """
+
+    def __init__(self, maxsize: int = 128):
+        super().__init__()
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self, key: str) -> Optional[bytes]:
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def _store(self, key: str, data: bytes):
+        self._entries[key] = data
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class DiskCache(PositionCache):
+    """
+    Cache persisted as one pickle file per key in a directory, shareable between processes
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        super().__init__()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.p"
+
+    def _load(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _store(self, key: str, data: bytes):
+        # write then rename so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
@@ -0,0 +1,210 @@
+"""
+Highlight, redact or redact and replace every document of a manifest across a pool of worker processes,
+from local PDF, OCR and prediction files only (no Indico calls).
+
+The manifest is a JSONL file with one document per line:
+
+    {"pdf": "a.pdf", "ocr": "a_ocr.json", "predictions": "a_preds.json", "mode": "redact"}
+
+"ocr" is an ondocument OCR result as JSON or a cache file written by OnDoc.save, "predictions" the
+ModelGroupPredict output as JSON. Optional keys are "mode" (default: highlight), "output" (default:
+<output-dir>/<pdf name>_<mode>.pdf) and "options", keyword arguments of the render output (e.g.
+include_toc, fill_text, seed) plus "page_wise" and "engine" (see BatchJob). Relative paths are relative
+to the manifest. Lines with the same output are rejected, e.g. a/invoice.pdf and b/invoice.pdf need
+an "output" each.
+
+Finished documents are appended to a progress log, so running the same command again skips them
+and only retries failed or missing outputs.
+
+    pdf-highlighter manifest.jsonl --workers 8 --output-dir out --summary summary.json
+"""
+from typing import List, Optional, Set
+from pathlib import Path
+import argparse
+import json
+import os
+import time
+from .batch import BatchJob, BatchResult, batch_label_summary, highlight_batch
+from .highlighter import RENDER_MODES
+
+
+def read_manifest(manifest_path: str, output_dir: str = ".") -> List[BatchJob]:
+    """
+    Read a JSONL manifest into BatchJobs whose OCR and predictions are loaded by the workers
+
+    Arguments:
+        manifest_path {str} -- path of the manifest
+        output_dir {str} -- directory of the outputs of entries without an "output"
+
+    Returns:
+        List[BatchJob] -- one job per manifest line, an exception is raised if two lines have the same
+                          output (e.g. a/invoice.pdf and b/invoice.pdf without an "output")
+    """
+    root = Path(manifest_path).parent
+    jobs = []
+    # line of the entry writing each output, two entries must never overwrite each other's output
+    outputs = dict()
+    with open(manifest_path) as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            missing = [key for key in ("pdf", "ocr", "predictions") if key not in entry]
+            if missing:
+                raise Exception(f"{manifest_path}:{line_num}: missing {', '.join(missing)}")
+            mode = entry.get("mode", "highlight")
+            if mode not in RENDER_MODES:
+                raise Exception(
+                    f"{manifest_path}:{line_num}: mode must be one of {RENDER_MODES}, not '{mode}'"
+                )
+            pdf_path = root / entry["pdf"]
+            output = entry.get("output")
+            if output is None:
+                output_path = Path(output_dir) / f"{pdf_path.stem}_{mode}.pdf"
+            else:
+                output_path = root / output
+            resolved = os.path.abspath(output_path)
+            if resolved in outputs:
+                raise Exception(
+                    f"{manifest_path}:{line_num}: output {output_path} is also written by line "
+                    f"{outputs[resolved]}, set a different \"output\" for one of them"
+                )
+            outputs[resolved] = line_num
+            jobs.append(
+                BatchJob(
+                    str(root / entry["ocr"]),
+                    str(root / entry["predictions"]),
+                    str(pdf_path),
+                    str(output_path),
+                    mode,
+                    entry.get("options"),
+                )
+            )
+    return jobs
+
+
+def read_progress(progress_path: str) -> Set[str]:
+    """
+    Return the outputs recorded as finished in a progress log that still exist
+    """
+    if not os.path.exists(progress_path):
+        return set()
+    done = set()
+    with open(progress_path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record["ok"]:
+                    done.add(record["output_path"])
+    return {output_path for output_path in done if os.path.exists(output_path)}
+
+
+def run_manifest(
+    manifest_path: str,
+    output_dir: str = ".",
+    workers: Optional[int] = None,
+    chunksize: int = 1,
+    progress_path: Optional[str] = None,
+    restart: bool = False,
+) -> dict:
+    """
+    Render every job of a manifest that is not finished yet and return the throughput summary
+
+    Arguments:
+        manifest_path {str} -- path of the JSONL manifest (see module docstring)
+        output_dir {str} -- directory of the outputs of entries without an "output"
+        workers {int} -- number of worker processes (default: number of CPUs)
+        chunksize {int} -- number of documents sent to a worker at once
+        progress_path {str} -- progress log (default: the manifest path + ".progress.jsonl")
+        restart {bool} -- if True, render every document again and start a new progress log
+
+    Returns:
+        dict -- document counts (total, skipped, rendered, failed), wall and worker seconds,
+                documents per second, the failed outputs and the label counts (see batch_label_summary)
+    """
+    jobs = read_manifest(manifest_path, output_dir)
+    progress_path = progress_path or f"{manifest_path}.progress.jsonl"
+    if restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+    done = read_progress(progress_path)
+    pending = [job for job in jobs if job.output_path not in done]
+    for directory in {os.path.dirname(job.output_path) for job in pending}:
+        os.makedirs(directory or ".", exist_ok=True)
+
+    results: List[BatchResult] = []
+    start = time.perf_counter()
+    with open(progress_path, "a") as progress:
+        for result in highlight_batch(pending, max_workers=workers, chunksize=chunksize):
+            results.append(result)
+            # recorded once the output is written, an interrupted run redoes unrecorded documents
+            progress.write(json.dumps(dict(result._asdict(), ok=result.ok)) + "\n")
+            progress.flush()
+            status = "ok" if result.ok else "FAILED"
+            print(
+                f"[{len(results)}/{len(pending)}] {status} {result.output_path} "
+                f"({result.seconds:.2f}s)"
+            )
+    seconds = time.perf_counter() - start
+
+    rendered = [result for result in results if result.ok]
+    return dict(
+        documents=len(jobs),
+        skipped=len(jobs) - len(pending),
+        rendered=len(rendered),
+        failed=len(results) - len(rendered),
+        seconds=seconds,
+        worker_seconds=sum(result.seconds for result in results),
+        documents_per_second=len(rendered) / seconds if seconds else 0.0,
+        failures=sorted(result.output_path for result in results if not result.ok),
+        labels=batch_label_summary(results),
+    )
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="pdf-highlighter",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("manifest", help="JSONL manifest of the documents")
+    parser.add_argument(
+        "--output-dir", default=".", help="directory of outputs not named in the manifest"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=1, help="documents sent to a worker at once"
+    )
+    parser.add_argument(
+        "--progress", help="progress log (default: <manifest>.progress.jsonl)"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore the progress log and render everything"
+    )
+    parser.add_argument("--summary", help="write the throughput summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    summary = run_manifest(
+        args.manifest,
+        args.output_dir,
+        args.workers,
+        args.chunksize,
+        args.progress,
+        args.restart,
+    )
+    print(
+        f"{summary['rendered']} rendered, {summary['skipped']} skipped, {summary['failed']} failed "
+        f"of {summary['documents']} documents in {summary['seconds']:.1f}s "
+        f"({summary['documents_per_second']:.2f} documents/s)"
+    )
+    for output_path in summary["failures"]:
+        print(f"failed: {output_path} (see the progress log for the error)")
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
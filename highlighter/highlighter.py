@@ -1,26 +1,88 @@
-from typing import List
+from typing import Iterator, List, Optional, Tuple, Union
 from collections import defaultdict
+from bisect import bisect_left, bisect_right
+import copy
+import numpy as np
 import fitz
 from fitz.utils import getColor
-from faker import Faker
-import copy
+import os
 from .ondoc import OnDoc
+from .tokens import BOX_KEYS, TokenStore
+from .records import RESULT_FORMAT, PageResult, Position
+from .parallel import MIN_PARALLEL_PAGES, render_outputs_parallel
+from .cache import PositionCache, cache_key
+from .rasterize import DEFAULT_DPI, rasterize_pages
+from .pdfio import PdfSource, is_path, read_pdf, source_name
+from .labels import LabelIndex
+from .toc import format_counts, has_toc, insert_toc
+from .replace import ReplacementText, TextProvider
+from .instrumentation import NULL_INSTRUMENTATION, Instrumentation
+
+ENGINES = ("loop", "vectorized")
+RENDER_MODES = ("highlight", "redact", "replace")
+# title set on every highlight annotation so update_highlights can tell them from other annotations
+ANNOTATION_TITLE = "pdf-highlighter"
 
 
 class Highlighter:
-    def __init__(self, ocr_result: List[dict]):
+    def __init__(
+        self,
+        ocr_result: List[dict],
+        cache: PositionCache = None,
+        instrumentation: Instrumentation = None,
+        document_key: str = None,
+    ):
         """
         Map annotation predictions to pdf token positions from 'ondocument' OCR and highlight onto 
         the source pdf.
         
         Arguments:
             ondoc {List[dict]} -- ocr output from DocumentExtraction w/ ondocument preset
+            cache {PositionCache} -- optional MemoryCache or DiskCache of collected positions, keyed by
+                                     a hash of the OCR document and the predictions
+            instrumentation {Instrumentation} -- optional Recorder (or other Instrumentation subclass) timing
+                                                 the matching and rendering stages and counting tokens,
+                                                 positions, annotations and redactions; off by default
+            document_key {str} -- optional identifier of the OCR document for the cache key (e.g. its storage
+                                  URL or a content hash the caller already has). Without it, a streamed OnDoc
+                                  is keyed by a hash of its raw JSON (OnDoc.source_key) and any other by
+                                  OnDoc.fingerprint, which is cheap once the token store is built (OnDoc.load)
+                                  but costs a pass over every token of a new OnDoc, about as much as matching:
+                                  caching in-memory OCR results only pays off with document_key or when the
+                                  same OnDoc is reused
         """
         if isinstance(ocr_result, OnDoc):
             self.ocr_result = ocr_result
         else:
             self.ocr_result = OnDoc(ocr_result)
-        self.prediction_positions: List[dict] = None
+        self.cache = cache
+        self.document_key = document_key
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.prediction_positions: List[PageResult] = None
+        # (collect method, copy of the predictions, include_pred_text, engine, prediction_positions) of
+        # the last collect, so update_highlights can diff against it
+        self._last_collect: tuple = None
+        # (prediction_positions it was built from, index)
+        self._label_index: tuple = (None, None)
+
+    @staticmethod
+    def _build_offset_index(
+        tokens: List[dict], offset_text: str = "doc_offset"
+    ) -> Tuple[List[int], List[int]]:
+        """
+        Sort a page's tokens by their start offset once so that predictions can bisect into
+        the tokens they cover instead of scanning the whole page
+
+        Arguments:
+            tokens {List[dict]} -- token objects of a single ondocument page
+            offset_text {str} -- "doc_offset" or "page_offset"
+
+        Returns:
+            Tuple[List[int], List[int]] -- sorted token start offsets and the token indices in that order
+        """
+        order = sorted(range(len(tokens)), key=lambda i: tokens[i][offset_text]["start"])
+        starts = [tokens[i][offset_text]["start"] for i in order]
+        return starts, order
 
     @staticmethod
     def _match_page_predict(
@@ -28,48 +90,190 @@ class Highlighter:
         page_ocr: dict,
         include_pred_text: bool = False,
         offset_text: str = "doc_offset",
-    ) -> dict:
+        instrumentation: Instrumentation = NULL_INSTRUMENTATION,
+        continued: int = 0,
+    ) -> PageResult:
         """
-        Use doc_offset or page_offset to get bounding boxes for each token of page's predictions
+        Use doc_offset or page_offset to get bounding boxes for each token of page's predictions.
+        The first continued predictions started on an earlier page: their spans are matched, but
+        their labels were already counted there.
         """
-        result = defaultdict(list)
+        tokens = page_ocr["tokens"]
+        starts, order = Highlighter._build_offset_index(tokens, offset_text)
         meta = page_ocr["pages"][0]
-        result["dimensions"].extend([meta["size"]["width"], meta["size"]["height"]])
-        result["page_num"] = meta["page_num"]
-        result["labels"] = defaultdict(int)
+        result = PageResult(
+            [meta["size"]["width"], meta["size"]["height"]], meta["page_num"]
+        )
+        positions = result.positions
+        for pred in predictions[continued:]:
+            result.labels[pred["label"]] += 1
+        scanned = 0
         for pred in predictions:
-            result["labels"][pred["label"]] += 1
             start, end = (
                 pred["start"] - 1,
                 pred["end"] + 1,
             )
-            new_prediction = True
-            position = dict()
-            for token in page_ocr["tokens"]:
-                if (
-                    token[offset_text]["start"] >= start
-                    and token[offset_text]["end"] <= end
-                ):
-                    if new_prediction:
-                        position = copy.deepcopy(token["position"])
-                        if include_pred_text:
-                            position["full_text"] = pred["text"]
-                        position["label"] = (
-                            pred["label"],
-                            len(pred["text"]),
-                        )  # length for spoofing
-                        new_prediction = False
-                    elif token["position"]["bbTop"] > position["bbBot"]:
-                        result["positions"].append(position)
-                        position = copy.deepcopy(token["position"])
-                        position["label"] = (
-                            pred["label"],
-                            len(pred["text"]),
+            label = (pred["label"], len(pred["text"]))  # length for spoofing
+            position = None
+            # only tokens starting inside the span can be contained by it, keep page order
+            candidates = sorted(
+                order[bisect_left(starts, start) : bisect_right(starts, end)]
+            )
+            scanned += len(candidates)
+            for token in (tokens[i] for i in candidates):
+                if token[offset_text]["end"] <= end:
+                    if position is None:
+                        position = Position.from_token(
+                            token["position"],
+                            label,
+                            pred["text"] if include_pred_text else None,
                         )
+                    elif token["position"]["bbTop"] > position.bbBot:
+                        positions.append(position)
+                        position = Position.from_token(token["position"], label)
                     else:
-                        position["bbRight"] = token["position"]["bbRight"]
-            if position:
-                result["positions"].append(position)
+                        position.bbRight = token["position"]["bbRight"]
+            if position is not None:
+                positions.append(position)
+        instrumentation.count("tokens_scanned", scanned, page=result.page_num)
+        return result
+
+    @staticmethod
+    def _match_page_predict_vectorized(
+        predictions: List[dict],
+        store: TokenStore,
+        page_idx: int,
+        include_pred_text: bool = False,
+        offset_text: str = "doc_offset",
+        instrumentation: Instrumentation = NULL_INSTRUMENTATION,
+        continued: int = 0,
+    ) -> PageResult:
+        """
+        Batched equivalent of _match_page_predict that works on the columnar token store: the
+        candidate tokens of all of the page's predictions are gathered into one flat array (one
+        searchsorted for the spans, np.repeat / cumsum for the ranges) and line breaks are found
+        for all predictions at once, so the only Python loop left builds the Position records
+        """
+        result = PageResult(
+            store.dimensions[page_idx].tolist(), int(store.page_nums[page_idx])
+        )
+        for pred in predictions[continued:]:
+            result.labels[pred["label"]] += 1
+        if not predictions:
+            return result
+        starts, ends = store.offsets(page_idx, offset_text)
+        positions = store.positions[store.page_slice(page_idx)]
+        keys = store.position_keys
+        box = [keys.index(key) for key in BOX_KEYS]
+        top, bot, _, right = box
+        extra = [i for i, key in enumerate(keys) if i not in box]
+        extra_keys = tuple(keys[i] for i in extra)
+
+        order = np.argsort(starts, kind="stable")
+        pred_starts = np.array([pred["start"] for pred in predictions]) - 1
+        pred_ends = np.array([pred["end"] for pred in predictions]) + 1
+        lows = np.searchsorted(starts[order], pred_starts, side="left")
+        highs = np.searchsorted(starts[order], pred_ends, side="right")
+        counts = highs - lows
+        instrumentation.count("tokens_scanned", int(counts.sum()), page=result.page_num)
+
+        # candidate tokens of every prediction back to back, each prediction's in page order
+        owner = np.repeat(np.arange(len(predictions)), counts)
+        ranks = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+        tokens = order[np.repeat(lows, counts) + ranks]
+        in_page_order = np.argsort(owner * len(starts) + tokens, kind="stable")
+        owner, tokens = owner[in_page_order], tokens[in_page_order]
+        contained = ends[tokens] <= pred_ends[owner]
+        owner, tokens = owner[contained], tokens[contained]
+        if not len(tokens):
+            return result
+
+        # a new line starts at the first token below the *first* token of the current line, so
+        # each round adds the next line start of every prediction (rounds = most lines of one prediction)
+        tops, bots = positions[tokens, top], positions[tokens, bot]
+        line_start = np.ones(len(tokens), dtype=bool)
+        line_start[1:] = owner[1:] != owner[:-1]
+        first_line = line_start.copy()
+        index = np.arange(len(tokens))
+        while True:
+            current = np.maximum.accumulate(np.where(line_start, index, 0))
+            below = np.flatnonzero((tops > bots[current]) & ~line_start)
+            if not len(below):
+                break
+            first_below = np.ones(len(below), dtype=bool)
+            first_below[1:] = current[below[1:]] != current[below[:-1]]
+            line_start[below[first_below]] = True
+
+        # a line is its first token's position with the bbRight of its last token
+        line_firsts = np.flatnonzero(line_start)
+        line_lasts = np.append(line_firsts[1:], len(tokens)) - 1
+        lines = positions[tokens[line_firsts]]
+        lines[:, right] = positions[tokens[line_lasts], right]
+        labels = [(pred["label"], len(pred["text"])) for pred in predictions]
+        texts = [
+            pred["text"] if include_pred_text else None for pred in predictions
+        ]
+        result.positions.extend(
+            Position(
+                *line[:4],
+                labels[pred_idx],
+                texts[pred_idx] if is_first else None,
+                extra_keys,
+                tuple(line[4:]),
+            )
+            for line, pred_idx, is_first in zip(
+                lines[:, box + extra].tolist(),
+                owner[line_firsts].tolist(),
+                first_line[line_firsts].tolist(),
+            )
+        )
+        return result
+
+    @staticmethod
+    def _check_engine(engine: str):
+        if engine not in ENGINES:
+            raise Exception(f"Engine must be one of {ENGINES}, not '{engine}'")
+
+    def _match_page(
+        self,
+        engine: str,
+        predictions: List[dict],
+        page_idx: int,
+        page_ocr: Optional[dict],
+        include_pred_text: bool,
+        offset_text: str,
+        continued: int = 0,
+    ) -> PageResult:
+        """
+        Dispatch a page's predictions to the requested matching engine (see _match_page_predict
+        for continued). page_ocr is None when the predictions were routed from the token store,
+        the page is then only built if the loop engine needs it.
+        """
+        instrumentation = self.instrumentation
+        with instrumentation.stage("match", page=page_idx, engine=engine):
+            if engine == "vectorized":
+                result = self._match_page_predict_vectorized(
+                    predictions,
+                    self.ocr_result.token_store,
+                    page_idx,
+                    include_pred_text,
+                    offset_text,
+                    instrumentation,
+                    continued,
+                )
+            else:
+                if page_ocr is None:
+                    page_ocr = self.ocr_result.ondoc[page_idx]
+                result = self._match_page_predict(
+                    predictions,
+                    page_ocr,
+                    include_pred_text,
+                    offset_text,
+                    instrumentation,
+                    continued,
+                )
+        instrumentation.count("predictions", len(predictions), page=result.page_num)
+        instrumentation.count("positions", len(result.positions), page=result.page_num)
         return result
 
     def collect_positions(
@@ -77,6 +281,7 @@ class Highlighter:
         predictions: List[List[dict]],
         inplace: bool = True,
         include_pred_text: bool = False,
+        engine: str = "loop",
     ) -> List[dict]:
         """
         Gets the predicted tokens positions from a full document prediction output json
@@ -84,201 +289,784 @@ class Highlighter:
         Arguments:
             predictions {List[List[dict]]} -- prediction output from ModelGroupPredict
             include_pred_text {bool} -- whether to include the text of the prediction with the positional data
+            engine {str} -- "loop" to match token dicts one by one or "vectorized" to match all of a page's
+                            predictions at once against the OnDoc token store
         
         Returns:
-            List[dict] -- locations of predictions
+            List[PageResult] -- locations of predictions
         """
-        prediction_positions = []
-        sorted_preds = sorted(predictions[0], key=lambda x: x["start"])
-
-        for page_ocr in self.ocr_result.ondoc:
-            max_page_offset = page_ocr["tokens"][-1]["doc_offset"]["end"]
-            if max_page_offset < sorted_preds[0]["start"]:
-                continue
-            page_preds = []
-            for i, pred in enumerate(sorted_preds):
-                if pred["start"] > max_page_offset:
-                    sorted_preds = sorted_preds[i:]
-                    break
-                else:
-                    page_preds.append(pred)
-            if not page_preds:
-                continue
-            result = self._match_page_predict(page_preds, page_ocr, include_pred_text)
-            prediction_positions.append(result)
-
+        self._check_engine(engine)
+        prediction_positions = self._cached(
+            self._collect_positions, predictions, include_pred_text, engine
+        )
         if not inplace:
             return prediction_positions
         self.prediction_positions = prediction_positions
+        self._remember_collect(
+            self._collect_positions, predictions, include_pred_text, engine
+        )
+
+    def _remember_collect(
+        self, collect, predictions: List[List[dict]], include_pred_text: bool, engine: str
+    ):
+        # a copy, so that predictions edited in place still differ from the ones behind the highlights
+        self._last_collect = (
+            collect,
+            copy.deepcopy(predictions),
+            include_pred_text,
+            engine,
+            self.prediction_positions,
+        )
+
+    def _page_num(self, page_idx: int, page_ocr: Optional[dict]) -> int:
+        """
+        Return the page number of a routed page (see _page_spans for a page_ocr of None)
+        """
+        if page_ocr is None:
+            return int(self.ocr_result.token_store.page_nums[page_idx])
+        return page_ocr["pages"][0]["page_num"]
+
+    @staticmethod
+    def _token_span(page_ocr: dict) -> Optional[Tuple[int, int]]:
+        """
+        Return the first start and last end doc_offset of a page's tokens, None for a page without tokens
+        """
+        offsets = [token["doc_offset"] for token in page_ocr["tokens"]]
+        if not offsets:
+            return None
+        return (
+            min(offset["start"] for offset in offsets),
+            max(offset["end"] for offset in offsets),
+        )
+
+    def _page_spans(self) -> Iterator[Tuple[int, Optional[dict], int, int]]:
+        """
+        Yield (page index, page ocr, first start, last end doc_offset) for every page with tokens.
+        Page ocr is None when the spans are read from the token store (see OnDoc.token_spans).
+        """
+        spans = self.ocr_result.token_spans()
+        if spans is not None:
+            for page_idx, first, last in spans:
+                yield page_idx, None, first, last
+            return
+        for page_idx, page_ocr in enumerate(self.ocr_result.ondoc):
+            span = self._token_span(page_ocr)
+            if span is not None:
+                yield (page_idx, page_ocr) + span
+
+    def _route_predictions(
+        self, predictions: List[List[dict]]
+    ) -> Iterator[Tuple[int, Optional[dict], List[dict], int]]:
+        """
+        Yield (page index, page ocr, page predictions, continued) for every page that full document
+        predictions are sent to, in a single sweep over the pages and the predictions sorted by start.
+        A prediction is sent to every page whose tokens it overlaps and one falling between two pages'
+        tokens to the next page. Each page's predictions stay sorted by start, so the first continued
+        of them are the spans crossing over from an earlier page: they are highlighted on every page
+        but their labels are only counted on the page where they start. Page ocr is None for pages
+        routed from the token store.
+        """
+        sorted_preds = sorted(predictions[0] if predictions else [], key=lambda x: x["start"])
+        # predictions of the previous pages running past the last token of the page before
+        carried = []
+        i = 0
+        for page_idx, page_ocr, first, last in self._page_spans():
+            if i == len(sorted_preds) and not carried:
+                break
+            page_preds = [pred for pred in carried if pred["end"] >= first]
+            continued = len(page_preds)
+            start = i
+            while i < len(sorted_preds) and sorted_preds[i]["start"] <= last:
+                i += 1
+            page_preds.extend(sorted_preds[start:i])
+            carried = [pred for pred in page_preds if pred["end"] > last]
+            if page_preds:
+                yield page_idx, page_ocr, page_preds, continued
+
+    def _route_page_wise_predictions(
+        self, predictions: List[List[dict]]
+    ) -> Iterator[Tuple[int, Optional[dict], List[dict], int]]:
+        pages = self.ocr_result.ondoc
+        if self.ocr_result.token_spans() is not None:
+            # the pages can be indexed, only build the ones the loop engine matches
+            pages = [None] * self.ocr_result.token_store.n_pages
+        for page_idx, (page_ocr, page_preds) in enumerate(zip(pages, predictions)):
+            # pages without predictions get no entry in prediction_positions
+            if page_preds:
+                yield page_idx, page_ocr, sorted(page_preds, key=lambda x: x["start"]), 0
+
+    def _collect_positions(
+        self, predictions: List[List[dict]], include_pred_text: bool, engine: str
+    ) -> List[dict]:
+        return [
+            self._match_page(
+                engine,
+                page_preds,
+                page_idx,
+                page_ocr,
+                include_pred_text,
+                "doc_offset",
+                continued,
+            )
+            for page_idx, page_ocr, page_preds, continued in self._route_predictions(
+                predictions
+            )
+        ]
 
     def collect_page_wise_positions(
         self,
         predictions: List[List[dict]],
         inplace: bool = True,
         include_pred_text: bool = False,
+        engine: str = "loop",
     ) -> List[dict]:
         """
         Gets the predicted tokens positions given page-wise prediection results 
-        (i.e. a document's pages separated and individually sent to the model)
+        (i.e. a document's pages separated and individually sent to the model). Pages without
+        predictions are left out of the result.
         
         Arguments:
             predictions {List[List[dict]]} -- prediction output from ModelGroupPredict
             include_pred_text {bool} -- whether to include the text of the prediction with the positional data
+            engine {str} -- "loop" to match token dicts one by one or "vectorized" to match all of a page's
+                            predictions at once against the OnDoc token store
         
         Returns:
-            List[dict] -- locations of predictions
+            List[PageResult] -- locations of predictions
         """
-        prediction_positions = []
-        for page_ocr, page_preds in zip(self.ocr_result.ondoc, predictions):
-            page_preds = sorted(page_preds, key=lambda x: x["start"])
-            result = self._match_page_predict(
-                page_preds, page_ocr, include_pred_text, "page_offset"
-            )
-            prediction_positions.append(result)
+        self._check_engine(engine)
+        prediction_positions = self._cached(
+            self._collect_page_wise_positions, predictions, include_pred_text, engine
+        )
         if not inplace:
             return prediction_positions
         self.prediction_positions = prediction_positions
+        self._remember_collect(
+            self._collect_page_wise_positions, predictions, include_pred_text, engine
+        )
+
+    def _collect_page_wise_positions(
+        self, predictions: List[List[dict]], include_pred_text: bool, engine: str
+    ) -> List[dict]:
+        return [
+            self._match_page(
+                engine, page_preds, page_idx, page_ocr, include_pred_text, "page_offset"
+            )
+            for page_idx, page_ocr, page_preds, _ in self._route_page_wise_predictions(
+                predictions
+            )
+        ]
+
+    def _cached(
+        self,
+        collect,
+        predictions: List[List[dict]],
+        include_pred_text: bool,
+        engine: str,
+    ) -> List[dict]:
+        """
+        Run a collect method, or return its result from self.cache when this OCR document and these
+        predictions were already matched (engines produce identical output so they share entries)
+        """
+        with self.instrumentation.stage("collect", method=collect.__name__, engine=engine):
+            return self._collect_cached(collect, predictions, include_pred_text, engine)
+
+    def _collect_cached(
+        self,
+        collect,
+        predictions: List[List[dict]],
+        include_pred_text: bool,
+        engine: str,
+    ) -> List[dict]:
+        if self.cache is None:
+            return collect(predictions, include_pred_text, engine)
+        key = cache_key(
+            self.document_key or self.ocr_result.source_key or self.ocr_result.fingerprint,
+            predictions,
+            method=collect.__name__,
+            include_pred_text=include_pred_text,
+            result_format=RESULT_FORMAT,
+        )
+        prediction_positions = self.cache.get(key)
+        if prediction_positions is None:
+            self.instrumentation.count("cache_misses")
+            prediction_positions = collect(predictions, include_pred_text, engine)
+            self.cache.set(key, prediction_positions)
+        else:
+            self.instrumentation.count("cache_hits")
+        return prediction_positions
+
+    @property
+    def label_index(self) -> LabelIndex:
+        """
+        Label counts per page and for the whole document of the current prediction_positions, assembled
+        from the per-page counts made while matching and rebuilt whenever prediction_positions changes
+        """
+        positions, index = self._label_index
+        if positions is not self.prediction_positions:
+            index = LabelIndex.from_positions(self.prediction_positions or [])
+            self._label_index = (self.prediction_positions, index)
+        return index
 
     def highlight_pdf(
-        self, pdf_path: str, output_path: str, include_toc: bool = False, color_map=None
-    ):
+        self,
+        pdf_path: PdfSource,
+        output_path: str = None,
+        include_toc: bool = False,
+        color_map=None,
+        workers: int = None,
+        bulk: bool = False,
+        save_options: dict = None,
+    ) -> Optional[bytes]:
         """
         Highlights predictions onto a copy of source PDF with the option to include a table of contents
         
         Arguments:
-            pdf_path {str} -- path to source PDF
-            output_path {str} -- path of labeled PDF copy to create (set to same as pdf_path to overwrite)
-            include_toc {bool} -- if True, insert a table of contents of what annotations were made and on what page
-        """
-        if not color_map:
-            color_map = defaultdict(lambda: "yellow")
-        doc = fitz.open(pdf_path)
-        for preds in self.prediction_positions:
-            page = doc[preds["page_num"]]
-            xnorm = page.rect[2] / preds["dimensions"][0]
-            ynorm = page.rect[3] / preds["dimensions"][1]
-            for token in preds["positions"]:
-                annotation = fitz.Rect(
-                    token["bbLeft"] * xnorm,
-                    token["bbTop"] * ynorm,
-                    token["bbRight"] * xnorm,
-                    token["bbBot"] * ynorm,
+            pdf_path {str} -- path to source PDF, or its bytes, a memoryview of them or a binary file object
+            output_path {str} -- path of labeled PDF copy to create (set to same as pdf_path to overwrite),
+                                if None the labeled PDF is returned as bytes instead
+            include_toc {bool} -- if True, insert a table of contents of what annotations were made and on what page,
+                                  with a link to each page (spread over several pages for long documents)
+            workers {int} -- if > 1, render chunks of pages in this many worker processes (see render)
+            bulk {bool} -- if True, write one multi-line highlight annotation per label and page instead of one
+                           annotation per line of each prediction; much faster and smaller for heavily labeled
+                           documents, but a label's highlights on a page can only be selected or deleted together
+            save_options {dict} -- keyword arguments of fitz.Document.save, e.g. garbage=3, deflate=True, linear=True
+
+        Returns:
+            Optional[bytes] -- the labeled PDF if output_path is None
+        """
+        return self.render(
+            pdf_path,
+            [
+                dict(
+                    mode="highlight",
+                    output_path=output_path,
+                    include_toc=include_toc,
+                    color_map=color_map,
+                    bulk=bulk,
+                    save_options=save_options,
                 )
-                if not "label" in token:
-                    raise AssertionError("All tokens must have a label attribute")
-                color = color_map[token["label"][0]]
-                ann = page.addHighlightAnnot(annotation)
-                ann.setOpacity(0.5)
-                ann.setColors(stroke=getColor(color))
-                ann.update()
+            ],
+            workers=workers,
+        )[0]
+
+    def update_highlights(
+        self,
+        predictions: List[List[dict]],
+        pdf_path: str,
+        color_map=None,
+        bulk: bool = False,
+    ) -> List[int]:
+        """
+        Re-highlight a PDF written by highlight_pdf (without a table of contents) after the predictions
+        changed. The new predictions are diffed page by page against the ones behind the current
+        prediction_positions, only pages whose predictions changed are matched again and have their
+        highlights replaced, and the PDF is saved incrementally so untouched pages are not rewritten.
+        collect_positions (or collect_page_wise_positions) must have been called first and
+        prediction_positions must still be the list it set.
+
+        Arguments:
+            predictions {List[List[dict]]} -- new predictions, in the same layout as the last collect call
+            pdf_path {str} -- path to the highlighted PDF to update in place
+            color_map {dict} -- same as for highlight_pdf
+            bulk {bool} -- same as for highlight_pdf
+
+        Returns:
+            List[int] -- page numbers whose highlights were updated
+        """
+        if self._last_collect is None:
+            raise Exception("collect_positions must be called before update_highlights")
+        collect, old_predictions, include_pred_text, engine, collected = self._last_collect
+        if self.prediction_positions is not collected:
+            raise Exception(
+                "prediction_positions was replaced since the last collect, collect the predictions "
+                "behind the highlights again before calling update_highlights"
+            )
+        if collect == self._collect_positions:
+            route, offset_text = self._route_predictions, "doc_offset"
+        else:
+            route, offset_text = self._route_page_wise_predictions, "page_offset"
+        old_routes = {
+            self._page_num(page_idx, page_ocr): page_preds
+            for page_idx, page_ocr, page_preds, _ in route(old_predictions)
+        }
+        old_results = {
+            result.page_num: result
+            for result in map(PageResult.coerce, self.prediction_positions)
+        }
+
+        prediction_positions, changed = [], []
+        for page_idx, page_ocr, page_preds, continued in route(predictions):
+            page_num = self._page_num(page_idx, page_ocr)
+            if (
+                page_num in old_routes
+                and old_routes.pop(page_num) == page_preds
+                and page_num in old_results
+            ):
+                prediction_positions.append(old_results[page_num])
+                continue
+            result = self._match_page(
+                engine,
+                page_preds,
+                page_idx,
+                page_ocr,
+                include_pred_text,
+                offset_text,
+                continued,
+            )
+            prediction_positions.append(result)
+            changed.append(result.page_num)
+        # pages that no longer receive any prediction
+        changed.extend(old_routes)
 
-        if include_toc:
-            toc_text = self.get_toc_text(pdf_path)
-            doc.insertPage(0, text=toc_text, fontsize=13)
-        doc.save(output_path)
+        if changed:
+            if not color_map:
+                color_map = defaultdict(lambda: "yellow")
+            instrumentation = self.instrumentation
+            with instrumentation.stage("open"):
+                doc = fitz.open(pdf_path)
+            if has_toc(doc):
+                doc.close()
+                # every page moved back by the TOC pages, page numbers no longer match the PDF
+                raise Exception(
+                    f"{pdf_path} has table of contents pages, update_highlights only supports PDFs "
+                    "written by highlight_pdf with include_toc=False"
+                )
+            for page_num in changed:
+                page = doc[page_num]
+                annots = []
+                annot = page.firstAnnot
+                while annot:
+                    if annot.info.get("title") == ANNOTATION_TITLE:
+                        annots.append(annot)
+                    annot = annot.next
+                for annot in annots:
+                    page.deleteAnnot(annot)
+            for preds in prediction_positions:
+                if preds.page_num in changed:
+                    page = doc[preds.page_num]
+                    with instrumentation.stage("annotate", page=preds.page_num):
+                        rects = self._page_rects(page, preds)
+                        n_annots = self._highlight_page(
+                            page, preds, rects, color_map, bulk
+                        )
+                    instrumentation.count("annotations", n_annots, page=preds.page_num)
+            with instrumentation.stage("save"):
+                doc.saveIncr()
+        self.prediction_positions = prediction_positions
+        self._remember_collect(collect, predictions, include_pred_text, engine)
+        return sorted(set(changed))
 
-    def redact_pdf(self, pdf_path: str, output_path: str, color_black: bool = True):
+    def redact_pdf(
+        self,
+        pdf_path: PdfSource,
+        output_path: str = None,
+        color_black: bool = True,
+        workers: int = None,
+        rasterize: bool = False,
+        dpi: int = DEFAULT_DPI,
+        save_options: dict = None,
+    ) -> Optional[bytes]:
         """
         Redact predicted text from a copy of a source PDF. Currently, you still need to convert 
         your PDF to image files afterward to ensure PI is fully removed from the underlying data.
         
         Arguments:
-            pdf_path {str} -- path to source PDF
-            output_path {str} -- path of labeled PDF copy to create (set to same as pdf_path to overwrite)
+            pdf_path {str} -- path to source PDF, or its bytes, a memoryview of them or a binary file object
+            output_path {str} -- path of labeled PDF copy to create (set to same as pdf_path to overwrite),
+                                if None the labeled PDF is returned as bytes instead
             color_black {bool} -- if True, redactions are made with a black mark, else they are made with a white mark
+            workers {int} -- if > 1, render chunks of pages in this many worker processes (see render)
+            rasterize {bool} -- if True, replace every redacted page with an image of itself so no underlying
+                                data is left in the output; pages without redactions are kept as they are
+            dpi {int} -- resolution of the rasterized pages
+            save_options {dict} -- keyword arguments of fitz.Document.save, e.g. garbage=3, deflate=True, linear=True
+
+        Returns:
+            Optional[bytes] -- the redacted PDF if output_path is None
         """
-        if color_black:
-            color = (0, 0, 0)
-        else:
-            color = (1, 1, 1)
-        doc = fitz.open(pdf_path)
-        for preds in self.prediction_positions:
-            page = doc[preds["page_num"]]
-            xnorm = page.rect[2] / preds["dimensions"][0]
-            ynorm = page.rect[3] / preds["dimensions"][1]
-            for token in preds["positions"]:
-                annotation = fitz.Rect(
-                    token["bbLeft"] * xnorm,
-                    token["bbTop"] * ynorm,
-                    token["bbRight"] * xnorm,
-                    token["bbBot"] * ynorm,
-                )
-                inflater = annotation.height * 0.1
-                annotation.x0, annotation.y0 = (
-                    annotation.x0 - inflater,
-                    annotation.y0 - inflater,
-                )
-                annotation.x1, annotation.y1 = (
-                    annotation.x1 + inflater,
-                    annotation.y1 + inflater,
+        return self.render(
+            pdf_path,
+            [
+                dict(
+                    mode="redact",
+                    output_path=output_path,
+                    color_black=color_black,
+                    rasterize=rasterize,
+                    dpi=dpi,
+                    save_options=save_options,
                 )
-                page.addRedactAnnot(annotation, fill=color)
-            page.apply_redactions()
-        doc.save(output_path)
-        print(
-            f"*Important* to ensure that underlying data can't be recovered, convert {output_path} to a png, tif, or scanned pdf file"
-        )
+            ],
+            workers=workers,
+        )[0]
 
-    def redact_and_replace(self, pdf_path: str, output_path: str, fill_text: dict):
+    def redact_and_replace(
+        self,
+        pdf_path: PdfSource,
+        output_path: str = None,
+        fill_text: Union[dict, ReplacementText] = None,
+        workers: int = None,
+        rasterize: bool = False,
+        dpi: int = DEFAULT_DPI,
+        save_options: dict = None,
+        seed: int = None,
+        text_provider: TextProvider = None,
+    ) -> Optional[bytes]:
         """
         Redact predicted text from a copy of a source PDF and replace if with fake values based on 
         label keys. For a full list of fake data options, see: https://github.com/joke2k/faker). 
         
         Arguments:
-            pdf_path {str} -- path to source PDF
-            output_path {str} -- path of labeled PDF copy to create (set to same as pdf_path to overwrite)
+            pdf_path {str} -- path to source PDF, or its bytes, a memoryview of them or a binary file object
+            output_path {str} -- path of labeled PDF copy to create (set to same as pdf_path to overwrite),
+                                if None the labeled PDF is returned as bytes instead
             fill_text {dict} -- a dictionary where the keys are your labels and the val is an option from the 
                                 faker library. Possible options include 'text', 'company', 'currency', 'numerify', 
                                 'address', 'name', 'company_email', 'date' and many more. With 'numerify' and 
-                                'text', fake data will match the length of the redacted data.
+                                'text', fake data will match the length of the redacted data. Values can also be
+                                callables taking the length of the redacted text. Pass a ReplacementText instead
+                                to share its original -> fake value mapping between documents.
+            workers {int} -- if > 1, render chunks of pages in this many worker processes (see render)
+            rasterize {bool} -- if True, replace every redacted page with an image of itself (see redact_pdf)
+            dpi {int} -- resolution of the rasterized pages
+            save_options {dict} -- keyword arguments of fitz.Document.save, e.g. garbage=3, deflate=True, linear=True
+            seed {int} -- if set, the fake values are reproducible and the same original text gets the
+                          same value in every document (original text is known if positions were
+                          collected with include_pred_text=True)
+            text_provider {TextProvider} -- generator of the fill_text kinds (default: FakerProvider())
+
+        Returns:
+            Optional[bytes] -- the redacted PDF if output_path is None
 
         Example:
             # add a key to fill_text for each label in your extraction task w/ allowed fake data method
             fill_text = dict(member='name', birthday='date', invoice_number='numerify')
             highlight.redact_and_replace('source.pdf', 'redacted.pdf', fill_text=fill_text)
         """
-        fake = Faker()
-        doc = fitz.open(pdf_path)
-        for preds in self.prediction_positions:
-            page = doc[preds["page_num"]]
-            xnorm = page.rect[2] / preds["dimensions"][0]
-            ynorm = page.rect[3] / preds["dimensions"][1]
-            for token in preds["positions"]:
-                annotation = fitz.Rect(
-                    token["bbLeft"] * xnorm,
-                    token["bbTop"] * ynorm,
-                    token["bbRight"] * xnorm,
-                    token["bbBot"] * ynorm,
+        if fill_text is None:
+            raise Exception("fill_text is required to replace redacted text")
+        return self.render(
+            pdf_path,
+            [
+                dict(
+                    mode="replace",
+                    output_path=output_path,
+                    fill_text=fill_text,
+                    seed=seed,
+                    text_provider=text_provider,
+                    rasterize=rasterize,
+                    dpi=dpi,
+                    save_options=save_options,
+                )
+            ],
+            workers=workers,
+        )[0]
+
+    def render(
+        self, pdf_path: PdfSource, outputs: List[dict], workers: int = None
+    ) -> List[Optional[bytes]]:
+        """
+        Write several outputs of the source PDF from a single open: the source is read once, the 
+        normalized rectangles of every prediction are computed once per page and each output is 
+        drawn on an in-memory clone of the source.
+        
+        Arguments:
+            pdf_path {str} -- path to source PDF, or its bytes, a memoryview of them or a binary file object
+            outputs {List[dict]} -- one dict per output to create, each with a "mode" of "highlight", "redact"
+                                    or "replace", an "output_path" (None or missing to get the PDF bytes back) 
+                                    and optionally that mode's arguments ("color_map" and "bulk" for highlight, 
+                                    "color_black" for redact, "fill_text", "seed" and "text_provider" for replace), "include_toc" to insert 
+                                    a table of contents, "rasterize" (with an optional "dpi") to turn the pages 
+                                    with predictions into images and "save_options" for fitz.Document.save
+            workers {int} -- if > 1, split the pages with predictions into chunks that are drawn in this
+                             many worker processes and merged back into one document; documents with
+                             fewer than MIN_PARALLEL_PAGES such pages are still drawn in this process.
+                             Arguments of the outputs (e.g. color_map) must then be picklable. Rasterized
+                             pages are also rendered in this many worker processes.
+
+        Example:
+            highlight.render('source.pdf', [
+                dict(mode='highlight', output_path='review.pdf', include_toc=True),
+                dict(mode='redact', output_path='redacted.pdf'),
+            ])
+
+        Returns:
+            List[Optional[bytes]] -- per output, the PDF bytes if it has no output_path, else None
+        """
+        for output in outputs:
+            if output.get("mode") not in RENDER_MODES:
+                raise Exception(
+                    f"Output mode must be one of {RENDER_MODES}, not '{output.get('mode')}'"
                 )
-                inflater = annotation.height * 0.1
-                annotation.x0, annotation.y0 = (
-                    annotation.x0 - inflater,
-                    annotation.y0 - inflater,
+        instrumentation = self.instrumentation
+        # file objects and memoryviews are read once, paths are opened by whoever needs them
+        if not is_path(pdf_path):
+            pdf_path = read_pdf(pdf_path)
+        # positions set by hand in the original dict format are converted once
+        pages = [
+            PageResult.coerce(preds) for preds in self.prediction_positions if preds.get("positions")
+        ]
+        page_nums = [preds.page_num for preds in pages]
+        parallel = workers and workers > 1 and len(page_nums) >= MIN_PARALLEL_PAGES
+        in_place = [
+            not parallel and self._saves_in_place(pdf_path, output) for output in outputs
+        ]
+        # replacement values are drawn here, in page order, so workers write the same ones
+        fill_texts = []
+        for output in outputs:
+            if output["mode"] != "replace":
+                fill_texts.append(None)
+                continue
+            with instrumentation.stage("fill_text"):
+                fill_texts.append(self._replacement_texts(pages, output))
+        if parallel:
+            # stages inside the worker processes are not recorded, only their total
+            with instrumentation.stage(
+                "draw_parallel", pages=len(page_nums), workers=workers
+            ):
+                docs = render_outputs_parallel(
+                    pdf_path, pages, outputs, workers, fill_texts
                 )
-                annotation.x1, annotation.y1 = (
-                    annotation.x1 + inflater,
-                    annotation.y1 + inflater,
+        else:
+            docs = self._draw_outputs(pdf_path, pages, outputs, in_place, fill_texts)
+        results = []
+        for doc, output, incremental in zip(docs, outputs, in_place):
+            if instrumentation.enabled:
+                self._count_marks(pages, output)
+            if output.get("rasterize"):
+                with instrumentation.stage("rasterize", pages=len(page_nums)):
+                    rasterize_pages(
+                        doc, page_nums, output.get("dpi", DEFAULT_DPI), workers
+                    )
+            if output.get("include_toc"):
+                with instrumentation.stage("toc"):
+                    insert_toc(doc, self.label_index, source_name(pdf_path))
+            save_options = dict(output.get("save_options") or {})
+            if output.get("rasterize"):
+                # drop the objects of the replaced pages from the file
+                save_options = dict(dict(garbage=3, deflate=True), **save_options)
+            output_path = output.get("output_path")
+            with instrumentation.stage("save", mode=output["mode"]):
+                if output_path is None:
+                    results.append(doc.write(**save_options))
+                    continue
+                if incremental:
+                    # only the new annotations are appended to the file
+                    doc.saveIncr()
+                else:
+                    doc.save(output_path, **save_options)
+                results.append(None)
+            if output["mode"] != "highlight" and not output.get("rasterize"):
+                print(
+                    f"*Important* to ensure that underlying data can't be recovered, convert {output_path or 'the output'} to a png, tif, or scanned pdf file"
                 )
-                if "label" in token:
-                    label_type = fill_text[token["label"][0]]
-                    if label_type == "numerify":
-                        text = getattr(fake, label_type)(token["label"][1] * "#")
-                    elif label_type == "text":
-                        text = getattr(fake, label_type)(token["label"][1])
-                    else:
-                        text = getattr(fake, label_type)()
-                    page.addRedactAnnot(
-                        annotation, text=text, fill=(1, 1, 1), fontsize=15
+        return results
+
+    @staticmethod
+    def _saves_in_place(pdf_path: PdfSource, output: dict) -> bool:
+        """
+        Whether an output overwrites its own source and can be saved incrementally: only highlights,
+        as redacted content would stay recoverable from the earlier revision kept in the file
+        """
+        output_path = output.get("output_path")
+        if not (is_path(pdf_path) and output_path and os.path.exists(output_path)):
+            return False
+        return (
+            output["mode"] == "highlight"
+            and not output.get("rasterize")
+            and not output.get("save_options")
+            and os.path.samefile(pdf_path, output_path)
+        )
+
+    def _count_marks(self, pages: List[PageResult], output: dict):
+        """
+        Report the annotations or redactions written on each page for one render output
+        """
+        for preds in pages:
+            positions = preds.positions
+            if output["mode"] != "highlight":
+                self.instrumentation.count(
+                    "redactions", len(positions), page=preds.page_num
+                )
+                continue
+            if output.get("bulk"):
+                n_annots = len({token.label[0] for token in positions})
+            else:
+                n_annots = len(positions)
+            self.instrumentation.count("annotations", n_annots, page=preds.page_num)
+
+    def _draw_outputs(
+        self,
+        pdf_path: PdfSource,
+        pages: List[PageResult],
+        outputs: List[dict],
+        in_place: List[bool],
+        fill_texts: List[Optional[List[List[Optional[str]]]]],
+    ):
+        """
+        Yield each output drawn on its own in-memory copy of the source PDF, or on the source file
+        itself for outputs saved in place. Only the given pages (those with positions) are loaded.
+        fill_texts holds the replacement values of each replace output (see _replacement_texts).
+        """
+        instrumentation = self.instrumentation
+        with instrumentation.stage("open"):
+            pdf_bytes = read_pdf(pdf_path)
+            source = fitz.open(stream=pdf_bytes, filetype="pdf")
+        page_rects = [self._page_rects(source[preds.page_num], preds) for preds in pages]
+        for i, output in enumerate(outputs):
+            if in_place[i]:
+                with instrumentation.stage("open"):
+                    doc = fitz.open(str(pdf_path))
+            # the source document itself is drawn on last so only the other outputs need a clone
+            elif i == len(outputs) - 1:
+                doc = source
+            else:
+                with instrumentation.stage("open"):
+                    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            self._draw_output(doc, output, pages, page_rects, fill_texts[i])
+            yield doc
+
+    def _draw_output(
+        self,
+        doc: fitz.Document,
+        output: dict,
+        pages: List[PageResult],
+        page_rects: List[List[fitz.Rect]],
+        fill_text: List[List[Optional[str]]] = None,
+    ):
+        """
+        Draw every page's predictions onto doc as requested by a single render output. fill_text is
+        the replacement of every position of a replace output (see _replacement_texts).
+        """
+        mode = output["mode"]
+        if mode == "highlight":
+            color_map = output.get("color_map") or defaultdict(lambda: "yellow")
+        elif mode == "redact":
+            color = (0, 0, 0) if output.get("color_black", True) else (1, 1, 1)
+        instrumentation = self.instrumentation
+        for i, (preds, rects) in enumerate(zip(pages, page_rects)):
+            page = doc[preds.page_num]
+            with instrumentation.stage("annotate", page=preds.page_num, mode=mode):
+                if mode == "highlight":
+                    self._highlight_page(
+                        page, preds, rects, color_map, output.get("bulk", False)
                     )
+                elif mode == "redact":
+                    self._redact_page(page, rects, color)
                 else:
-                    # second line of single prediction redacted
-                    page.addRedactAnnot(annotation, fill=(1, 1, 1))
-                page.apply_redactions()
-        doc.save(output_path)
-        print(
-            f"*Important* to ensure that underlying data can't be recovered, convert {output_path} to a png, tif, or scanned pdf file"
+                    self._replace_page(page, rects, fill_text[i])
+            # _redact_page and _replace_page only add the annotations so this is timed on its own
+            if mode != "highlight":
+                with instrumentation.stage("apply_redactions", page=preds.page_num):
+                    page.apply_redactions()
+
+    @staticmethod
+    def _page_rects(page: fitz.Page, preds: PageResult) -> List[fitz.Rect]:
+        """
+        Scale a page's prediction positions from OCR pixels to PDF coordinates
+        """
+        xnorm = page.rect[2] / preds.dimensions[0]
+        ynorm = page.rect[3] / preds.dimensions[1]
+        return [
+            fitz.Rect(
+                token.bbLeft * xnorm,
+                token.bbTop * ynorm,
+                token.bbRight * xnorm,
+                token.bbBot * ynorm,
+            )
+            for token in preds.positions
+        ]
+
+    @staticmethod
+    def _inflate(rect: fitz.Rect) -> fitz.Rect:
+        """
+        Return a copy of rect grown by 10% of its height on every side so redactions cover the glyphs
+        """
+        inflater = rect.height * 0.1
+        return fitz.Rect(
+            rect.x0 - inflater, rect.y0 - inflater, rect.x1 + inflater, rect.y1 + inflater
         )
 
+    @staticmethod
+    def _highlight_page(
+        page: fitz.Page,
+        preds: PageResult,
+        rects: List[fitz.Rect],
+        color_map: dict,
+        bulk: bool = False,
+    ) -> int:
+        """
+        Add the page's highlight annotations, one per line fragment or, if bulk, one multi-quad
+        annotation per label so each label's appearance stream is generated once
+
+        Returns:
+            int -- number of annotations added
+        """
+        groups = defaultdict(list)
+        for token, annotation in zip(preds.positions, rects):
+            if token.label is None:
+                raise AssertionError("All tokens must have a label attribute")
+            if bulk:
+                groups[token.label[0]].append(annotation)
+            else:
+                Highlighter._add_highlight(page, annotation, color_map[token.label[0]])
+        for label, annotations in groups.items():
+            Highlighter._add_highlight(page, annotations, color_map[label])
+        return len(groups) if bulk else len(rects)
+
+    @staticmethod
+    def _add_highlight(page: fitz.Page, annotation, color: str):
+        """
+        Add one highlight annotation covering a rect or a list of rects
+        """
+        ann = page.addHighlightAnnot(annotation)
+        ann.setInfo(dict(title=ANNOTATION_TITLE))
+        ann.setOpacity(0.5)
+        ann.setColors(stroke=getColor(color))
+        ann.update()
+
+    @staticmethod
+    def _redact_page(page: fitz.Page, rects: List[fitz.Rect], color: tuple):
+        for annotation in rects:
+            page.addRedactAnnot(Highlighter._inflate(annotation), fill=color)
+
+    @staticmethod
+    def _replacement_texts(
+        pages: List[PageResult], output: dict
+    ) -> List[List[Optional[str]]]:
+        """
+        Draw the replacement of every position of the pages for a replace output, None for the
+        continuation lines of a prediction. A ReplacementText passed as fill_text gets its mapping filled.
+        """
+        replacements = output["fill_text"]
+        if not isinstance(replacements, ReplacementText):
+            replacements = ReplacementText(
+                replacements, output.get("text_provider"), output.get("seed")
+            )
+        replacements.start_document()
+        return [
+            [
+                None
+                if token.label is None
+                else replacements(token.label[0], token.label[1], token.full_text)
+                for token in preds.positions
+            ]
+            for preds in pages
+        ]
+
+    @staticmethod
+    def _replace_page(
+        page: fitz.Page, rects: List[fitz.Rect], fill_text: List[Optional[str]]
+    ):
+        for annotation, text in zip(rects, fill_text):
+            annotation = Highlighter._inflate(annotation)
+            if text is not None:
+                page.addRedactAnnot(annotation, text=text, fill=(1, 1, 1), fontsize=15)
+            else:
+                # second line of single prediction redacted
+                page.addRedactAnnot(annotation, fill=(1, 1, 1))
+
     def get_toc_text(self, filename: str):
         """
         If a table of contents is requested, formats and returns the page text
@@ -289,12 +1077,8 @@ class Highlighter:
             {str} -- page text for the table of contents
         """
         base_text = f"File: {filename}\n\nPages w/ Extractions found:\n\n"
-        page_strings = list()
-        for page in self.prediction_positions:
-            if page["labels"]:
-                start = f"Page {page['page_num'] + 1}: "
-                content = ", ".join(
-                    f"{key} ({val})" for key, val in page["labels"].items()
-                )
-                page_strings.append(start + content)
+        page_strings = [
+            f"Page {page_num + 1}: {format_counts(counts)}"
+            for page_num, counts in self.label_index.pages.items()
+        ]
         return base_text + "\n".join(page_strings)
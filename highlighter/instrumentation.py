@@ -0,0 +1,158 @@
+from typing import Callable, Dict, List
+from collections import defaultdict
+import time
+
+
+class _NullStage:
+    """
+    Context manager that does nothing, shared by every stage of a disabled Instrumentation
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Instrumentation:
+    """
+    Hooks called by Highlighter around its hot paths. This base class is the disabled default:
+    stage returns a shared no-op context manager and count returns immediately, so leaving
+    instrumentation off costs one method call per hook. Subclass it (or use Recorder) to collect
+    timings and counters.
+
+    Stages: "collect", "match" (per page), "open", "annotate" (per page), "apply_redactions"
+    (per page), "rasterize", "toc", "save" and "draw_parallel" (pages drawn in worker processes).
+    Counters: "tokens_scanned", "positions" and "predictions" (per page, while matching),
+    "annotations" and "redactions" (per page, per output), "cache_hits" and "cache_misses".
+    Page-level hooks get a page=<page number> tag.
+    """
+
+    enabled = False
+
+    def stage(self, name: str, **tags):
+        """
+        Context manager timing the stage name
+        """
+        return _NULL_STAGE
+
+    def count(self, name: str, value: int = 1, **tags):
+        """
+        Add value to the counter name
+        """
+
+
+# default used by Highlighter when no instrumentation is given
+NULL_INSTRUMENTATION = Instrumentation()
+
+
+class _Stage:
+    __slots__ = ("recorder", "name", "tags", "start")
+
+    def __init__(self, recorder: "Recorder", name: str, tags: dict):
+        self.recorder = recorder
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.record(self.name, time.perf_counter() - self.start, **self.tags)
+        return False
+
+
+class Recorder(Instrumentation):
+    """
+    Instrumentation that keeps every stage duration and counter in memory and optionally
+    forwards each event to a callback, e.g. to export them to a metrics system
+
+    Example:
+        recorder = Recorder(callback=lambda kind, name, value, tags: statsd.gauge(name, value, tags))
+        highlight = Highlighter(ocr_result, instrumentation=recorder)
+        highlight.collect_positions(predictions)
+        highlight.redact_pdf('source.pdf', 'redacted.pdf')
+        print(recorder.report())
+    """
+
+    enabled = True
+
+    def __init__(self, callback: Callable[[str, str, float, dict], None] = None):
+        """
+        callback {Callable} -- called as callback(kind, name, value, tags) with kind "stage" (value in
+                               seconds) or "count"
+        """
+        self.callback = callback
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.page_counters: Dict[str, Dict[int, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+
+    def stage(self, name: str, **tags):
+        return _Stage(self, name, tags)
+
+    def record(self, name: str, seconds: float, **tags):
+        """
+        Add a stage duration measured elsewhere
+        """
+        self.timings[name].append(seconds)
+        if self.callback is not None:
+            self.callback("stage", name, seconds, tags)
+
+    def count(self, name: str, value: int = 1, **tags):
+        self.counters[name] += value
+        if "page" in tags:
+            self.page_counters[name][tags["page"]] += value
+        if self.callback is not None:
+            self.callback("count", name, value, tags)
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict -- per stage call count, total, mean and max seconds, and the counter totals
+        """
+        return dict(
+            stages={
+                name: dict(
+                    calls=len(durations),
+                    total=sum(durations),
+                    mean=sum(durations) / len(durations),
+                    max=max(durations),
+                )
+                for name, durations in self.timings.items()
+            },
+            counters=dict(self.counters),
+        )
+
+    def report(self) -> str:
+        """
+        Format the summary as a plain text table, stages sorted by total time
+        """
+        summary = self.summary()
+        lines = [f"{'stage':<20}{'calls':>8}{'total ms':>12}{'mean ms':>12}{'max ms':>12}"]
+        for name, stats in sorted(
+            summary["stages"].items(), key=lambda item: -item[1]["total"]
+        ):
+            lines.append(
+                f"{name:<20}{stats['calls']:>8}{stats['total'] * 1000:>12.2f}"
+                f"{stats['mean'] * 1000:>12.2f}{stats['max'] * 1000:>12.2f}"
+            )
+        if summary["counters"]:
+            lines.append("")
+            lines.append(f"{'counter':<20}{'total':>8}")
+            for name, value in sorted(summary["counters"].items()):
+                lines.append(f"{name:<20}{value:>8}")
+        return "\n".join(lines)
+
+    def reset(self):
+        self.timings.clear()
+        self.counters.clear()
+        self.page_counters.clear()
@@ -0,0 +1,77 @@
+from typing import Dict, Iterable, List
+from collections import Counter
+
+
+class LabelIndex:
+    """
+    Label counts of one document, per page and in total. It is assembled from the per-page "labels"
+    counts made while matching, so building it never goes over the positions again.
+    """
+
+    def __init__(self, pages: Dict[int, Dict[str, int]] = None):
+        """
+        pages {Dict[int, Dict[str, int]]}: label counts by page number
+        """
+        self.pages: Dict[int, Counter] = dict()
+        self.totals = Counter()
+        for page_num, counts in sorted((pages or {}).items()):
+            self.add(page_num, counts)
+
+    @classmethod
+    def from_positions(cls, prediction_positions: List[dict]) -> "LabelIndex":
+        """
+        Build the index of Highlighter.prediction_positions
+        """
+        index = cls()
+        for page in sorted(prediction_positions, key=lambda page: page["page_num"]):
+            if page["labels"]:
+                index.add(page["page_num"], page["labels"])
+        return index
+
+    def add(self, page_num: int, counts: Dict[str, int]):
+        self.pages.setdefault(page_num, Counter()).update(counts)
+        self.totals.update(counts)
+
+    def __len__(self) -> int:
+        """
+        Number of pages with predictions
+        """
+        return len(self.pages)
+
+    def pages_with(self, label: str) -> List[int]:
+        """
+        Return the page numbers where label was predicted
+        """
+        return [page_num for page_num, counts in self.pages.items() if label in counts]
+
+    def to_dict(self) -> dict:
+        """
+        Return the index as plain JSON-serializable data
+        """
+        return dict(
+            totals=dict(self.totals),
+            pages={page_num: dict(counts) for page_num, counts in self.pages.items()},
+        )
+
+    @staticmethod
+    def aggregate(documents: Iterable[Dict[str, int]]) -> dict:
+        """
+        Combine the document totals of many documents (e.g. of a batch) into corpus statistics
+
+        Arguments:
+            documents {Iterable[Dict[str, int]]} -- LabelIndex.totals (or BatchResult.labels) per document
+
+        Returns:
+            dict -- "documents": number of documents, "totals": count of each label across documents and
+                    "document_counts": number of documents in which each label was predicted
+        """
+        n_documents, totals, document_counts = 0, Counter(), Counter()
+        for counts in documents:
+            n_documents += 1
+            totals.update(counts)
+            document_counts.update(label for label, count in counts.items() if count)
+        return dict(
+            documents=n_documents,
+            totals=dict(totals),
+            document_counts=dict(document_counts),
+        )
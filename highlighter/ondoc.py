@@ -1,11 +1,34 @@
-from typing import List, Tuple
+from typing import Callable, Dict, IO, List, Optional, Sequence, Tuple, Union
+from bisect import bisect_right
+from pathlib import Path
+import hashlib
 import numpy as np
+from .tokens import BOX_KEYS, TokenStore
+from .stream import PageStream
+from .storage import CachedPages, load_ondoc, save_ondoc
+from .records import PageResult
+from .quality import DEFAULT_PERCENTILES, CharLayout, low_confidence_regions, segment_stats
+
+
+def _fingerprint(pages: np.ndarray, tokens: np.ndarray, position_keys: Tuple[str, ...]) -> str:
+    """
+    Hash (page_num, width, height, token count) page rows and (doc_offset start, end, page_offset
+    start, end, position values) token rows, independently of how they were gathered
+    """
+    digest = hashlib.sha256(",".join(position_keys).encode("utf-8"))
+    for array in (pages, tokens):
+        # integer and float columns are compared by value whatever their width
+        dtype = np.int64 if np.issubdtype(array.dtype, np.integer) else np.float64
+        digest.update(str(array.shape).encode("utf-8"))
+        digest.update(np.ascontiguousarray(array, dtype=dtype).tobytes())
+    return digest.hexdigest()
 
 
 class OnDoc:
     """
     OnDoc is a helper class for the raw ondocument OCR result. Enables easy extraction
-    of common datapoints into usable objects. 
+    of common datapoints into usable objects. Derived values (text, page results, token store,
+    fingerprint) are computed on first access and kept until ondoc is replaced.
     """
 
     def __init__(self, ondoc: List[dict]):
@@ -14,33 +37,224 @@ class OnDoc:
         """
         self.ondoc = ondoc
 
+    @property
+    def ondoc(self) -> List[dict]:
+        return self._ondoc
+
+    @ondoc.setter
+    def ondoc(self, ondoc: List[dict]):
+        # everything derived from the previous result is stale
+        self._ondoc = ondoc
+        self._token_store = None
+        self._fingerprint = None
+        self._derived = dict()
+
+    def _memoized(self, name: str, build: Callable):
+        if name not in self._derived:
+            self._derived[name] = build()
+        return self._derived[name]
+
+    @classmethod
+    def from_stream(
+        cls, source: Union[str, Path, bytes, IO], keep_text: bool = True
+    ) -> "OnDoc":
+        """
+        Wrap an ondocument JSON file (or bytes / file object) without loading it into memory. Pages are
+        parsed one at a time, stripped to the fields used for matching and rendering, every time the
+        document is iterated, e.g. by Highlighter.collect_positions.
+
+        source {str, Path, bytes or file}: ondocument OCR result serialized as a JSON array of pages
+        keep_text {bool}: if False, also drop page, block and token text
+        """
+        return cls(PageStream(source, keep_text=keep_text))
+
+    def save(self, path: Union[str, Path]):
+        """
+        Write the OCR result to a compact binary cache file: NumPy arrays for token offsets, boxes and
+        confidences plus utf-8 text blobs with page, block and token indexes, under a versioned header
+        with a sha256 checksum. Reload it with OnDoc.load.
+
+        path {str}: path of the cache file to create
+        """
+        save_ondoc(self, path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], verify: bool = True) -> "OnDoc":
+        """
+        Memory-map a cache file written by OnDoc.save. The token store is used in place and page dicts
+        are only rebuilt from the arrays when the ondoc pages are accessed.
+
+        path {str}: path of the cache file
+        verify {bool}: if True, check the checksum of the file before using it
+        """
+        store, pages = load_ondoc(path, verify)
+        ondoc = cls(pages)
+        ondoc._token_store = store
+        return ondoc
+
+    @property
+    def token_store(self) -> TokenStore:
+        """
+        Return a columnar NumPy view of token offsets, boxes, page numbers and character
+        confidences, built on first access
+        """
+        if self._token_store is None:
+            self._token_store = TokenStore.from_ondoc(self.ondoc)
+        return self._token_store
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Return a sha256 hex digest of everything positions are matched from (page numbers and sizes,
+        token offsets and positions), computed once. Unless the token store was already built (e.g.
+        by OnDoc.load), it is hashed from the token dicts in one pass, without building the store.
+        """
+        if self._fingerprint is None:
+            if self._token_store is not None:
+                store = self._token_store
+                pages = np.column_stack(
+                    [store.page_nums, store.dimensions, np.diff(store.token_bounds)]
+                )
+                tokens = np.concatenate(
+                    [store.doc_offsets, store.page_offsets, store.positions], axis=1
+                )
+                position_keys = store.position_keys
+            else:
+                pages, tokens, position_keys = self._fingerprint_values()
+            self._fingerprint = _fingerprint(pages, tokens, position_keys)
+        return self._fingerprint
+
+    @property
+    def source_key(self) -> Optional[str]:
+        """
+        Return a sha256 hex digest of the raw JSON a streamed OnDoc (OnDoc.from_stream) reads its pages
+        from, computed once without parsing it. None for pages held in memory, and for OnDoc.load, whose
+        fingerprint is hashed from the memory-mapped arrays and is just as cheap.
+        """
+        if not isinstance(self.ondoc, PageStream):
+            return None
+        return self._memoized("source_key", self.ondoc.digest)
+
+    def _fingerprint_values(self) -> Tuple[np.ndarray, np.ndarray, Tuple[str, ...]]:
+        # the columns of the token store, gathered without keeping per-page or per-token objects
+        pages, values = [], []
+        position_keys = None
+        extend = values.extend
+        for page in self.ondoc:
+            meta = page["pages"][0]
+            tokens = page["tokens"]
+            size = meta["size"]
+            pages.append((meta["page_num"], size["width"], size["height"], len(tokens)))
+            for token in tokens:
+                doc_offset, page_offset = token["doc_offset"], token["page_offset"]
+                extend((doc_offset["start"], doc_offset["end"]))
+                extend((page_offset["start"], page_offset["end"]))
+                extend(token["position"].values())
+            if position_keys is None and tokens:
+                position_keys = tuple(tokens[0]["position"])
+        position_keys = position_keys or BOX_KEYS
+        tokens = np.array(values).reshape(-1, 4 + len(position_keys))
+        return np.array(pages).reshape(-1, 4), tokens, position_keys
+
     @property
     def full_text(self) -> str:
         """
         Return full document text as string
         """
-        return "\n".join(page["pages"][0]["text"] for page in self.ondoc)
+        return self._memoized("full_text", lambda: "\n".join(self.page_text))
 
     @property
     def page_text(self) -> List[str]:
         """
-        Return list of page-level text
+        Return list of page-level text (shared between calls, do not modify it)
         """
-        return [page["pages"][0]["text"] for page in self.ondoc]
+        if isinstance(self.ondoc, CachedPages):
+            return self._memoized("page_text", self.ondoc.page_text)
+        return self._memoized(
+            "page_text", lambda: [page["pages"][0]["text"] for page in self.ondoc]
+        )
 
     @property
     def page_results(self) -> List[dict]:
         """
-        Return list of page-level dictionary result objects
+        Return list of page-level dictionary result objects (shared between calls, do not modify it)
         """
-        return [page["pages"][0] for page in self.ondoc]
+        if isinstance(self.ondoc, CachedPages):
+            return self._memoized("page_results", self.ondoc.page_results)
+        return self._memoized(
+            "page_results", lambda: [page["pages"][0] for page in self.ondoc]
+        )
 
     @property
     def block_text(self) -> List[str]:
         """
-        Return list of block-level text
+        Return list of block-level text (shared between calls, do not modify it)
+        """
+        if isinstance(self.ondoc, CachedPages):
+            return self._memoized("block_text", self.ondoc.block_text)
+        return self._memoized(
+            "block_text",
+            lambda: [block["text"] for page in self.ondoc for block in page["blocks"]],
+        )
+
+    @property
+    def page_starts(self) -> List[int]:
+        """
+        Return the offset in full_text where each page's text starts, followed by len(full_text) + 1
+        """
+
+        def build():
+            starts = [0]
+            for text in self.page_text:
+                # pages are joined with one newline
+                starts.append(starts[-1] + len(text) + 1)
+            return starts
+
+        return self._memoized("page_starts", build)
+
+    def page_index(self, doc_offset: int) -> int:
+        """
+        Return the index of the page whose text contains a full_text (doc_offset) position, in O(log n).
+        The newline after a page counts as part of that page.
+
+        doc_offset {int}: character offset into full_text
+        """
+        length = self.page_starts[-1] - 1
+        if not 0 <= doc_offset < length:
+            raise Exception(
+                f"Offset {doc_offset} is outside of the document text (length {length})"
+            )
+        return bisect_right(self.page_starts, doc_offset) - 1
+
+    def page_span(self, page_idx: int) -> Tuple[int, int]:
+        """
+        Return the (start, end) offsets of a page's text in full_text, so that
+        full_text[start:end] == page_text[page_idx] without rebuilding any string
+
+        page_idx {int}: index of the page
+        """
+        starts = self.page_starts
+        if not 0 <= page_idx < len(starts) - 1:
+            raise IndexError(page_idx)
+        return starts[page_idx], starts[page_idx + 1] - 1
+
+    def token_spans(self) -> Optional[List[Tuple[int, int, int]]]:
+        """
+        Return (page index, first token start, last token end doc_offset) of every page with tokens,
+        read from the token store, so that predictions can be routed without touching the pages.
+        None when the store is not built yet or the pages are streamed: the spans are then cheaper
+        to take from the pages while they are iterated anyway.
+        """
+        if self._token_store is None or isinstance(self.ondoc, PageStream):
+            return None
+        return self._memoized("token_spans", self._token_store.page_spans)
+
+    def to_page_offset(self, doc_offset: int) -> Tuple[int, int]:
+        """
+        Convert a doc_offset into (page index, page_offset)
         """
-        return [block["text"] for page in self.ondoc for block in page["blocks"]]
+        page_idx = self.page_index(doc_offset)
+        return page_idx, doc_offset - self.page_starts[page_idx]
 
     def ocr_confidence(self, metric="mean") -> float:
         """
@@ -53,14 +267,80 @@ class OnDoc:
                 f"Metric value must be either mean or median, not '{metric}'"
             )
 
-        if "confidence" not in self.ondoc[0]["chars"][0].keys():
-            raise Exception("You are using an old SDK version, confidence is not included")
-        
-        confidence = [
-            character["confidence"]
-            for page in self.ondoc
-            for character in page["chars"]
-        ]
+        confidence = self._confidences()
         if metric == "mean":
             return np.mean(confidence)
         return np.median(confidence)
+
+    def _confidences(self) -> np.ndarray:
+        confidence = self.token_store.confidences()
+        if confidence is None:
+            raise Exception("You are using an old SDK version, confidence is not included")
+        return confidence
+
+    @property
+    def char_layout(self) -> CharLayout:
+        """
+        Return a columnar NumPy view of character offsets, boxes and blocks, built on first access
+        """
+        return self._memoized("char_layout", lambda: CharLayout.from_ondoc(self.ondoc))
+
+    def confidence_stats(
+        self, level: str = "page", percentiles: Sequence[float] = DEFAULT_PERCENTILES
+    ) -> Dict[str, np.ndarray]:
+        """
+        Return OCR confidence statistics (scale: 0 - 100) of every page or every block, computed for all of
+        them at once from the character confidences. Block statistics need character positions, so they
+        are not available for streamed or cached OCR results.
+
+        level {str}: "page" or "block"
+        percentiles {Sequence[float]}: percentiles to compute
+
+        Returns one array per statistic, with an entry per page or block: "page" (page index), "block"
+        (index in block_text, block level only), "count" (number of characters), "mean", "min", "max"
+        and "p<percentile>" (e.g. "p5"). Pages or blocks without characters get NaN statistics.
+        """
+        if level not in ("page", "block"):
+            raise Exception(f"Level must be either page or block, not '{level}'")
+        confidence = self._confidences()
+        store = self.token_store
+        if level == "page":
+            char_pages = np.repeat(np.arange(store.n_pages), np.diff(store.char_bounds))
+            stats = segment_stats(confidence, char_pages, store.n_pages, percentiles)
+            return dict(page=np.arange(store.n_pages), **stats)
+        layout = self.char_layout
+        n_blocks = int(layout.block_bounds[-1])
+        in_block = layout.block_ids >= 0
+        stats = segment_stats(
+            confidence[in_block], layout.block_ids[in_block], n_blocks, percentiles
+        )
+        block_pages = np.repeat(
+            np.arange(len(layout.block_bounds) - 1), np.diff(layout.block_bounds)
+        )
+        return dict(page=block_pages, block=np.arange(n_blocks), **stats)
+
+    def low_confidence_regions(
+        self, threshold: float = 50, min_chars: int = 1, label: str = "low_confidence"
+    ) -> List[PageResult]:
+        """
+        Return the boxes of runs of consecutive characters on one line with an OCR confidence below
+        threshold, in the format of Highlighter.prediction_positions so that they can be rendered like
+        predictions, e.g.
+
+            highlight.prediction_positions = highlight.ocr_result.low_confidence_regions(60)
+            highlight.highlight_pdf('source.pdf', 'review.pdf', color_map={'low_confidence': 'RED'})
+
+        threshold {float}: characters with a lower confidence (scale: 0 - 100) are selected
+        min_chars {int}: shorter runs are ignored
+        label {str}: label of the regions, each Position label is (label, number of characters)
+        """
+        store = self.token_store
+        return low_confidence_regions(
+            self.char_layout,
+            self._confidences(),
+            store.dimensions,
+            store.page_nums,
+            threshold,
+            min_chars,
+            label,
+        )
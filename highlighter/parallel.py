@@ -0,0 +1,137 @@
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+from .pdfio import PdfSource, open_pdf
+from .records import PageResult
+
+# below this many pages with predictions, starting worker processes costs more than it saves
+MIN_PARALLEL_PAGES = 16
+
+
+def split_pages(page_nums: List[int], n_chunks: int) -> List[List[int]]:
+    """
+    Split sorted page numbers into at most n_chunks contiguous, evenly sized chunks
+    """
+    n_chunks = max(1, min(n_chunks, len(page_nums)))
+    size, extra = divmod(len(page_nums), n_chunks)
+    chunks, start = [], 0
+    for i in range(n_chunks):
+        end = start + size + (i < extra)
+        chunks.append(page_nums[start:end])
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+
+def _render_chunk(
+    pdf_path: PdfSource,
+    page_nums: List[int],
+    pages: List[PageResult],
+    output: dict,
+    fill_text: Optional[List[List[Optional[str]]]],
+) -> bytes:
+    """
+    Worker: open the source, keep only the owned pages, draw their predictions (with the replacement
+    values drawn by the parent for a replace output) and return the chunk as PDF bytes
+    """
+    from .highlighter import Highlighter
+
+    doc = open_pdf(pdf_path)
+    doc.select(page_nums)
+    local = {page_num: i for i, page_num in enumerate(page_nums)}
+    pages = [
+        PageResult(preds.dimensions, local[preds.page_num], preds.labels, preds.positions)
+        for preds in pages
+    ]
+    page_rects = [Highlighter._page_rects(doc[preds.page_num], preds) for preds in pages]
+    Highlighter([])._draw_output(doc, output, pages, page_rects, fill_text)
+    return doc.write()
+
+
+def render_outputs_parallel(
+    pdf_path: PdfSource,
+    pages: List[PageResult],
+    outputs: List[dict],
+    workers: int,
+    fill_texts: List[Optional[List[List[Optional[str]]]]] = None,
+) -> List[fitz.Document]:
+    """
+    Draw each output's pages in worker processes, each opening its own copy of the source and
+    owning a contiguous chunk of the pages with predictions, then merge the chunks and the
+    untouched source pages back in page order with insertPDF, keeping the source's metadata and outline
+
+    Arguments:
+        pdf_path {str} -- path to source PDF or its bytes
+        pages {List[PageResult]} -- pages of Highlighter.prediction_positions with positions
+        outputs {List[dict]} -- render output specs (see Highlighter.render)
+        workers {int} -- number of worker processes
+        fill_texts {list} -- per output, the replacement of every position of pages for a replace output
+                             (see Highlighter._replacement_texts), None otherwise
+
+    Returns:
+        List[fitz.Document] -- one merged, unsaved document per output
+    """
+    if fill_texts is None:
+        fill_texts = [None] * len(outputs)
+    # workers only need the drawn values, fill_text may hold e.g. unpicklable callables
+    outputs = [
+        output if fill_text is None else dict(output, fill_text=None, text_provider=None)
+        for output, fill_text in zip(outputs, fill_texts)
+    ]
+    # indexes in pages of the entries of each page number
+    by_page: Dict[int, List[int]] = {}
+    for i, preds in enumerate(pages):
+        by_page.setdefault(preds.page_num, []).append(i)
+    chunks = split_pages(sorted(by_page), workers)
+    owned = [[i for page_num in chunk for i in by_page[page_num]] for chunk in chunks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        futures = [
+            [
+                executor.submit(
+                    _render_chunk,
+                    pdf_path,
+                    chunk,
+                    [pages[i] for i in indexes],
+                    output,
+                    None if fill_text is None else [fill_text[i] for i in indexes],
+                )
+                for chunk, indexes in zip(chunks, owned)
+            ]
+            for output, fill_text in zip(outputs, fill_texts)
+        ]
+        source = open_pdf(pdf_path)
+        return [
+            _merge_chunks(
+                source,
+                chunks,
+                [fitz.open(stream=f.result(), filetype="pdf") for f in output_futures],
+            )
+            for output_futures in futures
+        ]
+
+
+def _merge_chunks(
+    source: fitz.Document, chunks: List[List[int]], chunk_docs: List[fitz.Document]
+) -> fitz.Document:
+    """
+    Assemble a document in source page order, taking owned pages from their chunk document
+    and every other page from the source, with the source's metadata and outline
+    """
+    owner: Dict[int, Tuple[fitz.Document, int]] = {}
+    for chunk, chunk_doc in zip(chunks, chunk_docs):
+        for i, page_num in enumerate(chunk):
+            owner[page_num] = (chunk_doc, i)
+    # consecutive pages coming from the same document are copied with one insertPDF call
+    runs = []
+    for page_num in range(len(source)):
+        doc, i = owner.get(page_num, (source, page_num))
+        if runs and runs[-1][0] is doc and runs[-1][2] == i - 1:
+            runs[-1][2] = i
+        else:
+            runs.append([doc, i, i])
+    merged = fitz.open()
+    for doc, start, end in runs:
+        merged.insertPDF(doc, from_page=start, to_page=end)
+    # insertPDF only copies pages, document-level data would differ from a serial render
+    merged.setMetadata(source.metadata)
+    merged.setToC(source.getToC(simple=False))
+    return merged
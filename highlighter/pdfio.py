@@ -0,0 +1,46 @@
+from typing import IO, Union
+from pathlib import Path
+import fitz
+
+# a path, the PDF's bytes (bytes, bytearray or memoryview) or a binary file object
+PdfSource = Union[str, Path, bytes, bytearray, memoryview, IO[bytes]]
+
+
+def is_path(source: PdfSource) -> bool:
+    return isinstance(source, (str, Path))
+
+
+def read_pdf(source: PdfSource) -> bytes:
+    """
+    Return the bytes of a PDF source, without copying sources that already are bytes
+    """
+    if is_path(source):
+        with open(source, "rb") as f:
+            return f.read()
+    if isinstance(source, (bytes, bytearray)):
+        return source
+    if isinstance(source, memoryview):
+        return source.tobytes()
+    if hasattr(source, "read"):
+        return source.read()
+    raise Exception(
+        f"PDF source must be a path, bytes, memoryview or file object, not {type(source).__name__}"
+    )
+
+
+def open_pdf(source: PdfSource) -> fitz.Document:
+    """
+    Open a PDF source with PyMuPDF, paths are opened directly and anything else from memory
+    """
+    if is_path(source):
+        return fitz.open(str(source))
+    return fitz.open(stream=read_pdf(source), filetype="pdf")
+
+
+def source_name(source: PdfSource) -> str:
+    """
+    Name of a PDF source for display, e.g. in the table of contents
+    """
+    if is_path(source):
+        return str(source)
+    return getattr(source, "name", None) or "in-memory PDF"
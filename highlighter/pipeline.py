@@ -0,0 +1,178 @@
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor
+import asyncio
+import traceback
+from .batch import BatchJob, run_job
+from .ondoc import OnDoc
+
+# statuses after which JobStatus(wait=True) stops polling
+TERMINAL_STATUSES = ("SUCCESS", "FAILURE", "REJECTED", "REVOKED", "IGNORED", "RETRY")
+
+
+class PipelineResult(NamedTuple):
+    """
+    Outcome of one document, error holds the formatted traceback if any step failed
+    """
+
+    pdf_path: str
+    output_path: str
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class AsyncPipeline:
+    """
+    Asyncio version of example_pipeline.py: OCRs many PDFs, gets their predictions and highlights
+    them concurrently. Blocking client calls run in threads, job statuses are polled with
+    asyncio.sleep in between instead of JobStatus(wait=True), and the CPU-bound matching and
+    rendering is sent to a process pool.
+    """
+
+    def __init__(
+        self,
+        client,
+        model_id: int,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+        executor: Executor = None,
+        queries=None,
+    ):
+        """
+        client {IndicoClient}: any object with a blocking call(request) method, e.g. a fake client in tests
+        model_id {int}: model ID for your trained extraction model
+        concurrency {int}: maximum number of documents in flight at once
+        poll_interval {float}: seconds between job status checks
+        executor {Executor}: executor for highlighting (default: a ProcessPoolExecutor per run)
+        queries: module or namespace providing DocumentExtraction, JobStatus, ModelGroupPredict and
+                 RetrieveStorageObject (default: indico.queries)
+        """
+        if queries is None:
+            import indico.queries as queries
+        self.client = client
+        self.model_id = model_id
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.executor = executor
+        self.queries = queries
+
+    async def _call(self, request):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.client.call, request)
+
+    async def wait_for_job(self, job_id):
+        """
+        Poll a job without blocking the event loop and return it with its result once finished
+        """
+        while True:
+            job = await self._call(self.queries.JobStatus(id=job_id, wait=False))
+            if job.status in TERMINAL_STATUSES and (job.ready or job.status != "SUCCESS"):
+                break
+            await asyncio.sleep(self.poll_interval)
+        # the job is done, so this returns right away with the result attached
+        job = await self._call(self.queries.JobStatus(id=job_id, wait=True))
+        if job.status != "SUCCESS":
+            raise Exception(f"Job {job_id} failed with status {job.status}: {job.result}")
+        return job
+
+    async def ocr(self, pdf_path: str) -> List[dict]:
+        """
+        OCR a PDF with the ondocument preset and return the ondocument result
+        """
+        jobs = await self._call(
+            self.queries.DocumentExtraction(
+                files=[pdf_path], json_config=dict(preset_config="ondocument")
+            )
+        )
+        job = await self.wait_for_job(jobs[0].id)
+        return await self._call(self.queries.RetrieveStorageObject(job.result))
+
+    async def predict(self, doc_text: List[str]) -> List[List[dict]]:
+        """
+        Get predicted annotations for the document text
+        """
+        job = await self._call(
+            self.queries.ModelGroupPredict(model_id=self.model_id, data=doc_text)
+        )
+        job = await self.wait_for_job(job.id)
+        return job.result
+
+    async def process(
+        self,
+        pdf_path: str,
+        output_path: str,
+        mode: str = "highlight",
+        options: dict = None,
+        executor: Executor = None,
+    ) -> PipelineResult:
+        """
+        OCR, predict and render a single document, capturing any failure in the result
+        """
+        try:
+            ocr_result = await self.ocr(pdf_path)
+            predictions = await self.predict([OnDoc(ocr_result).full_text])
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                executor or self.executor,
+                run_job,
+                BatchJob(ocr_result, predictions, pdf_path, output_path, mode, options),
+            )
+            return PipelineResult(pdf_path, output_path)
+        except Exception:
+            return PipelineResult(pdf_path, output_path, traceback.format_exc())
+
+    async def run(
+        self,
+        documents: Iterable[Tuple[str, str]],
+        mode: str = "highlight",
+        options: dict = None,
+    ) -> List[PipelineResult]:
+        """
+        Process (pdf_path, output_path) pairs with at most self.concurrency documents in flight
+
+        Returns:
+            List[PipelineResult] -- one result per document, in input order
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        executor = self.executor or ProcessPoolExecutor()
+
+        async def limited(pdf_path, output_path):
+            async with semaphore:
+                return await self.process(pdf_path, output_path, mode, options, executor)
+
+        try:
+            return await asyncio.gather(
+                *(limited(pdf_path, output_path) for pdf_path, output_path in documents)
+            )
+        finally:
+            if executor is not self.executor:
+                executor.shutdown()
+
+
+def run_pipeline(
+    client,
+    model_id: int,
+    documents: Iterable[Tuple[str, str]],
+    mode: str = "highlight",
+    options: dict = None,
+    **kwargs,
+) -> List[PipelineResult]:
+    """
+    Blocking entry point: run an AsyncPipeline over documents in a fresh event loop
+
+    Arguments:
+        client {IndicoClient} -- your account client
+        model_id {int} -- model ID for your trained extraction model
+        documents {Iterable[Tuple[str, str]]} -- (pdf_path, output_path) pairs
+        mode {str} -- "highlight", "redact" or "replace"
+        options {dict} -- render arguments for mode (e.g. include_toc, color_map, fill_text)
+        kwargs -- passed to AsyncPipeline (concurrency, poll_interval, executor, queries)
+    """
+    pipeline = AsyncPipeline(client, model_id, **kwargs)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(pipeline.run(documents, mode, options))
+    finally:
+        loop.close()
@@ -0,0 +1,206 @@
+from typing import Dict, Iterable, List, Sequence, Tuple
+from collections import defaultdict
+from operator import itemgetter
+import numpy as np
+from .tokens import BOX_KEYS
+from .records import PageResult, Position
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def segment_stats(
+    values: np.ndarray,
+    segment_ids: np.ndarray,
+    n_segments: int,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+) -> Dict[str, np.ndarray]:
+    """
+    Summarize values per segment (e.g. the character confidences of each page) without a loop over the
+    segments: values are sorted once by (segment, value) and every percentile is interpolated between
+    two order statistics like np.percentile does
+
+    Arguments:
+        values {np.ndarray} -- (n,) values
+        segment_ids {np.ndarray} -- (n,) segment of each value, in range(n_segments)
+        n_segments {int} -- number of segments, segments without values get NaN statistics
+        percentiles {Sequence[float]} -- percentiles to compute, between 0 and 100
+
+    Returns:
+        Dict[str, np.ndarray] -- (n_segments,) "count", "mean", "min", "max" and "p<percentile>" arrays
+    """
+    counts = np.bincount(segment_ids, minlength=n_segments)
+    # one argsort of segment * (value range + 1) + value is several times faster than np.lexsort,
+    # values less than ~1e-8 apart may swap places, which changes no statistic by more than that
+    minimum, span = (values.min(), np.ptp(values)) if len(values) else (0, 0)
+    sorted_values = values[np.argsort((values - minimum) + segment_ids * (span + 1.0))]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    empty = counts == 0
+    last = np.maximum(counts - 1, 0)
+
+    def at(index: np.ndarray) -> np.ndarray:
+        if not len(sorted_values):
+            return np.full(n_segments, np.nan)
+        # empty segments read a valid index and are masked
+        return np.where(empty, np.nan, sorted_values[np.minimum(index, len(sorted_values) - 1)])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats = dict(
+            count=counts,
+            mean=np.bincount(segment_ids, weights=values, minlength=n_segments) / counts,
+            min=at(starts),
+            max=at(starts + last),
+        )
+    for percentile in percentiles:
+        rank = last * percentile / 100
+        low = np.floor(rank).astype(np.int64)
+        lower, upper = at(starts + low), at(starts + np.ceil(rank).astype(np.int64))
+        stats[f"p{percentile:g}"] = lower + (upper - lower) * (rank - low)
+    return stats
+
+
+class CharLayout:
+    """
+    Columnar view of the characters of an ondocument OCR result, gathered with a single pass over the
+    pages: the doc_offset and bounding box of every character and the block it belongs to. Blocks are
+    assigned from the block doc_offsets, characters before a page's first block belong to that block.
+    """
+
+    def __init__(
+        self,
+        char_bounds: np.ndarray,
+        doc_index: np.ndarray,
+        boxes: np.ndarray,
+        block_bounds: np.ndarray,
+        block_ids: np.ndarray,
+    ):
+        """
+        char_bounds {np.ndarray}: (pages + 1,) cumulative character count
+        doc_index {np.ndarray}: (chars,) doc_offset of each character
+        boxes {np.ndarray}: (chars, 4) bbTop, bbBot, bbLeft, bbRight of each character
+        block_bounds {np.ndarray}: (pages + 1,) cumulative block count
+        block_ids {np.ndarray}: (chars,) document-wide index of the block of each character, -1 on pages
+                                without blocks
+        """
+        self.char_bounds = char_bounds
+        self.doc_index = doc_index
+        self.boxes = boxes
+        self.block_bounds = block_bounds
+        self.block_ids = block_ids
+
+    @classmethod
+    def from_ondoc(cls, ondoc: Iterable[dict]) -> "CharLayout":
+        char_bounds, block_bounds = [0], [0]
+        doc_index, boxes, block_starts = [], [], []
+        get_box = itemgetter(*BOX_KEYS)
+        for page in ondoc:
+            for char in page.get("chars", []):
+                if "position" not in char or "doc_index" not in char:
+                    raise Exception(
+                        "Character positions are not included in this OCR result, "
+                        "e.g. it was streamed or loaded from a cache file"
+                    )
+                doc_index.append(char["doc_index"])
+                boxes.append(get_box(char["position"]))
+            char_bounds.append(len(doc_index))
+            blocks = page.get("blocks", [])
+            if blocks and "doc_offset" not in blocks[0]:
+                raise Exception("Block offsets are not included in this OCR result")
+            block_starts.extend(block["doc_offset"]["start"] for block in blocks)
+            block_bounds.append(len(block_starts))
+        char_bounds = np.array(char_bounds, dtype=np.int64)
+        block_bounds = np.array(block_bounds, dtype=np.int64)
+        doc_index = np.array(doc_index, dtype=np.int64)
+
+        # blocks are searched within the character's own page
+        char_pages = np.repeat(np.arange(len(char_bounds) - 1), np.diff(char_bounds))
+        first, end = block_bounds[char_pages], block_bounds[char_pages + 1]
+        block_ids = np.searchsorted(np.array(block_starts, dtype=np.int64), doc_index, "right") - 1
+        block_ids = np.where(first == end, -1, np.clip(block_ids, first, end - 1))
+        return cls(
+            char_bounds=char_bounds,
+            doc_index=doc_index,
+            boxes=np.array(boxes, dtype=np.int64).reshape(-1, 4),
+            block_bounds=block_bounds,
+            block_ids=block_ids,
+        )
+
+    @property
+    def char_pages(self) -> np.ndarray:
+        """
+        Return the page index of every character
+        """
+        return np.repeat(np.arange(len(self.char_bounds) - 1), np.diff(self.char_bounds))
+
+    def runs(self, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Split the characters selected by mask into runs of consecutive characters on one line of one
+        page and block, a new line starts at a character below or left of the previous one
+
+        Arguments:
+            mask {np.ndarray} -- (chars,) bool
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray] -- first character, last character and page index
+                                                         of each run
+        """
+        index = np.flatnonzero(mask)
+        if not len(index):
+            return index, index, index
+        pages = self.char_pages[index]
+        top, bot, left = (self.boxes[index, column] for column in range(3))
+        breaks = np.ones(len(index), dtype=bool)
+        breaks[1:] = (
+            (np.diff(index) != 1)
+            | (np.diff(pages) != 0)
+            | (np.diff(self.block_ids[index]) != 0)
+            | (top[1:] > bot[:-1])
+            | (left[1:] < left[:-1])
+        )
+        starts = np.flatnonzero(breaks)
+        ends = np.append(starts[1:], len(index)) - 1
+        return index[starts], index[ends], pages[starts]
+
+
+def low_confidence_regions(
+    layout: CharLayout,
+    confidence: np.ndarray,
+    dimensions: np.ndarray,
+    page_nums: np.ndarray,
+    threshold: float,
+    min_chars: int,
+    label: str,
+) -> List[PageResult]:
+    """
+    Boxes of the runs of at least min_chars characters with a confidence below threshold, as
+    prediction_positions (see OnDoc.low_confidence_regions)
+    """
+    first, last, pages = layout.runs(confidence < threshold)
+    keep = last - first + 1 >= min_chars
+    first, last, pages = first[keep], last[keep], pages[keep]
+    if not len(first):
+        return []
+    # union of the character boxes of each run: gather the characters of all runs back to back
+    # and reduce each run's slice
+    lengths = last - first + 1
+    run_starts = np.cumsum(lengths) - lengths
+    chars = np.arange(lengths.sum()) - np.repeat(run_starts - first, lengths)
+    top, bot, left, right = layout.boxes[chars].T
+    boxes = np.stack(
+        [
+            np.minimum.reduceat(top, run_starts),
+            np.maximum.reduceat(bot, run_starts),
+            np.minimum.reduceat(left, run_starts),
+            np.maximum.reduceat(right, run_starts),
+        ],
+        axis=1,
+    ).tolist()
+    results: Dict[int, PageResult] = dict()
+    for page_idx, box, length in zip(pages.tolist(), boxes, lengths.tolist()):
+        result = results.get(page_idx)
+        if result is None:
+            result = results[page_idx] = PageResult(
+                dimensions[page_idx].tolist(), int(page_nums[page_idx]), defaultdict(int)
+            )
+        result.labels[label] += 1
+        result.positions.append(Position(*box, label=(label, length)))
+    return list(results.values())
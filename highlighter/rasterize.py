@@ -0,0 +1,71 @@
+from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+from .parallel import split_pages
+
+DEFAULT_DPI = 150
+# rendering a page to an image is slow enough that a few pages already pay for a worker pool
+MIN_PARALLEL_RASTER_PAGES = 4
+
+
+def _page_images(
+    doc: fitz.Document, page_nums: List[int], dpi: int
+) -> List[Tuple[int, bytes]]:
+    """
+    Render pages of a document to PNG images
+
+    Returns:
+        List[Tuple[int, bytes]] -- (page number, PNG data) per page
+    """
+    zoom = fitz.Matrix(dpi / 72, dpi / 72)
+    return [
+        (page_num, doc[page_num].getPixmap(matrix=zoom, alpha=False).getPNGData())
+        for page_num in page_nums
+    ]
+
+
+def _rasterize_chunk(
+    pdf_bytes: bytes, page_nums: List[int], dpi: int
+) -> List[Tuple[int, bytes]]:
+    """
+    Worker: open a copy of the document and render its share of the pages
+    """
+    return _page_images(fitz.open(stream=pdf_bytes, filetype="pdf"), page_nums, dpi)
+
+
+def rasterize_pages(
+    doc: fitz.Document, page_nums: List[int], dpi: int = DEFAULT_DPI, workers: int = None
+) -> fitz.Document:
+    """
+    Replace pages of doc by an image of themselves so that no text, vector graphics or hidden content
+    of those pages is left in the file. Other pages are kept as they are. Save the document with
+    garbage collection (garbage >= 1) so the objects of the replaced pages are dropped from the file.
+
+    Arguments:
+        doc {fitz.Document} -- document to modify in place, e.g. after apply_redactions
+        page_nums {List[int]} -- pages to rasterize
+        dpi {int} -- resolution of the page images
+        workers {int} -- if > 1, render chunks of the pages in this many worker processes
+
+    Returns:
+        fitz.Document -- doc, for chaining
+    """
+    page_nums = sorted(set(page_nums))
+    if not page_nums:
+        return doc
+    if workers and workers > 1 and len(page_nums) >= MIN_PARALLEL_RASTER_PAGES:
+        pdf_bytes = doc.write()
+        chunks = split_pages(page_nums, workers)
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = [
+                executor.submit(_rasterize_chunk, pdf_bytes, chunk, dpi) for chunk in chunks
+            ]
+            images = [image for future in futures for image in future.result()]
+    else:
+        images = _page_images(doc, page_nums, dpi)
+    for page_num, png in images:
+        rect = doc[page_num].rect
+        doc.deletePage(page_num)
+        page = doc.newPage(page_num, width=rect.width, height=rect.height)
+        page.insertImage(page.rect, stream=png)
+    return doc
@@ -0,0 +1,190 @@
+"""
+Compact records for Highlighter.prediction_positions. Both are read-only mappings, so code written
+against the original nested dicts (page["positions"], position["bbRight"], "label" in position)
+keeps working, while the render methods use plain attribute access.
+"""
+from typing import Dict, Iterator, List, Sequence, Tuple
+from collections import defaultdict
+from collections.abc import Mapping
+from .tokens import BOX_KEYS
+
+# version of the prediction_positions format, part of the cache keys of collect results
+RESULT_FORMAT = 3
+
+_OPTIONAL_KEYS = ("full_text", "label")
+_RESERVED_KEYS = frozenset(BOX_KEYS + _OPTIONAL_KEYS)
+
+
+class Position(Mapping):
+    """
+    Box of one line fragment of a prediction in OCR pixels. label is (label name, prediction text
+    length), full_text the prediction text if requested. Any other keys of the OCR token position
+    (e.g. top, bottom) are kept as parallel extra_keys / extra_values tuples.
+    """
+
+    __slots__ = BOX_KEYS + _OPTIONAL_KEYS + ("extra_keys", "extra_values")
+
+    def __init__(
+        self,
+        bbTop: int,
+        bbBot: int,
+        bbLeft: int,
+        bbRight: int,
+        label: Tuple[str, int] = None,
+        full_text: str = None,
+        extra_keys: Tuple[str, ...] = (),
+        extra_values: tuple = (),
+    ):
+        self.bbTop = bbTop
+        self.bbBot = bbBot
+        self.bbLeft = bbLeft
+        self.bbRight = bbRight
+        self.label = label
+        self.full_text = full_text
+        self.extra_keys = extra_keys
+        self.extra_values = extra_values
+
+    @classmethod
+    def from_token(
+        cls, position: dict, label: Tuple[str, int] = None, full_text: str = None
+    ) -> "Position":
+        """
+        Build a record from an OCR token position dict (or a position dict in the original format)
+        """
+        extra_keys = tuple(key for key in position if key not in _RESERVED_KEYS)
+        return cls(
+            position["bbTop"],
+            position["bbBot"],
+            position["bbLeft"],
+            position["bbRight"],
+            label,
+            full_text,
+            extra_keys,
+            tuple(position[key] for key in extra_keys),
+        )
+
+    @classmethod
+    def coerce(cls, position) -> "Position":
+        if isinstance(position, cls):
+            return position
+        label = position.get("label")
+        return cls.from_token(
+            position, tuple(label) if label is not None else None, position.get("full_text")
+        )
+
+    def _keys(self) -> Iterator[str]:
+        yield from BOX_KEYS
+        yield from self.extra_keys
+        for key in _OPTIONAL_KEYS:
+            if getattr(self, key) is not None:
+                yield key
+
+    def __getitem__(self, key: str):
+        if key in _RESERVED_KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif key in self.extra_keys:
+            return self.extra_values[self.extra_keys.index(key)]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return self._keys()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._keys())
+
+    def __repr__(self) -> str:
+        return f"Position({self.to_dict()})"
+
+    def __reduce__(self):
+        return (
+            Position,
+            (
+                self.bbTop,
+                self.bbBot,
+                self.bbLeft,
+                self.bbRight,
+                self.label,
+                self.full_text,
+                self.extra_keys,
+                self.extra_values,
+            ),
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Return the position as a dict in the original format
+        """
+        return {key: self[key] for key in self._keys()}
+
+
+class PageResult(Mapping):
+    """
+    Matching result of one page: OCR page dimensions (width, height), page number, prediction count
+    per label and the Position records of the page
+    """
+
+    __slots__ = ("dimensions", "page_num", "labels", "positions")
+
+    def __init__(
+        self,
+        dimensions: Sequence[int],
+        page_num: int,
+        labels: Dict[str, int] = None,
+        positions: List[Position] = None,
+    ):
+        self.dimensions = dimensions
+        self.page_num = page_num
+        self.labels = labels if labels is not None else defaultdict(int)
+        self.positions = positions if positions is not None else []
+
+    @classmethod
+    def coerce(cls, page) -> "PageResult":
+        """
+        Return page as a PageResult, converting a page in the original dict format
+        """
+        if isinstance(page, cls):
+            return page
+        return cls(
+            list(page["dimensions"]),
+            page["page_num"],
+            defaultdict(int, page.get("labels", {})),
+            [Position.coerce(position) for position in page.get("positions", [])],
+        )
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __repr__(self) -> str:
+        return (
+            f"PageResult(page_num={self.page_num}, dimensions={self.dimensions}, "
+            f"labels={dict(self.labels)}, positions={len(self.positions)})"
+        )
+
+    def __reduce__(self):
+        return (
+            PageResult,
+            (self.dimensions, self.page_num, self.labels, self.positions),
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Return the page in the original format: a defaultdict(list) whose "positions" key is only
+        set when the page has positions
+        """
+        result = defaultdict(list)
+        result["dimensions"].extend(self.dimensions)
+        result["page_num"] = self.page_num
+        result["labels"] = defaultdict(int, self.labels)
+        if self.positions:
+            result["positions"] = [position.to_dict() for position in self.positions]
+        return result
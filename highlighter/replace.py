@@ -0,0 +1,168 @@
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from abc import ABC, abstractmethod
+from functools import lru_cache
+import hashlib
+from faker import Faker
+
+# generates n replacement values for redacted text of the given length
+Generator = Callable[[int, int], List[str]]
+
+DEFAULT_BATCH_SIZE = 16
+
+
+@lru_cache(maxsize=None)
+def _faker(locale: Optional[str]) -> Faker:
+    # Faker setup loads every provider, so one instance per locale is shared by all documents
+    return Faker(locale)
+
+
+class TextProvider(ABC):
+    """
+    Base class of replacement text generators for redact_and_replace. Subclasses resolve the name of a
+    kind of fake data (a value of fill_text) to a generator once per document and may support seeding.
+    """
+
+    def seed(self, seed: int):
+        """
+        Make the values generated from now on reproducible
+        """
+
+    @abstractmethod
+    def resolve(self, kind: str) -> Generator:
+        """
+        Return the generator of a kind of fake data, failing for unknown kinds
+        """
+
+
+class FakerProvider(TextProvider):
+    """
+    Replacement text from the faker library, kinds are the names of Faker methods (e.g. 'name', 'date').
+    With 'numerify' and 'text', fake data matches the length of the redacted data. Unseeded providers
+    share one Faker instance per locale, a seeded provider gets its own so that seeding never changes
+    the values of other documents.
+    """
+
+    def __init__(self, locale: str = None):
+        self.locale = locale
+        self._seeded: Optional[Faker] = None
+
+    def __getstate__(self) -> dict:
+        # the copy in e.g. a worker process creates its own instance when it is seeded
+        return dict(self.__dict__, _seeded=None)
+
+    @property
+    def fake(self) -> Faker:
+        return self._seeded if self._seeded is not None else _faker(self.locale)
+
+    def seed(self, seed: int):
+        if self._seeded is None:
+            self._seeded = Faker(self.locale)
+        self._seeded.seed_instance(seed)
+
+    def resolve(self, kind: str) -> Generator:
+        getattr(self.fake, kind)  # unknown kinds fail here rather than at the first redaction
+
+        def generate(length: int, n: int) -> List[str]:
+            # looked up per batch, the instance changes once the provider is seeded
+            method = getattr(self.fake, kind)
+            if kind == "numerify":
+                return [method(length * "#") for _ in range(n)]
+            if kind == "text":
+                return [method(length) for _ in range(n)]
+            return [method() for _ in range(n)]
+
+        return generate
+
+
+class ReplacementText:
+    """
+    Fake values for the redacted predictions of one or more documents. Generators are resolved once per
+    label and values are drawn from pools per label and length, refilled with twice as many values each time
+    up to batch_size at once, so small documents do not generate values they never use. The same original text of a label
+    always gets the same fake value: within this object through its mapping and, when seeded, across
+    documents, processes and runs because the value is generated from the seed and the original text.
+    The original text of a prediction is only known if positions were collected with include_pred_text.
+    """
+
+    def __init__(
+        self,
+        fill_text: Dict[str, Union[str, Callable[[int], str]]],
+        provider: TextProvider = None,
+        seed: int = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        """
+        fill_text {dict}: kind of fake data per label, the name of a provider kind (e.g. a Faker method)
+                          or a callable taking the length of the redacted text and returning its replacement
+        provider {TextProvider}: generator of the named kinds (default: FakerProvider())
+        seed {int}: if set, every document's fake values are reproducible
+        batch_size {int}: maximum number of values generated at once for a pool
+        """
+        self.fill_text = fill_text
+        self.provider = provider or FakerProvider()
+        self.seed = seed
+        self.batch_size = batch_size
+        self.mapping: Dict[Tuple[str, str], str] = dict()
+        self._generators: Dict[str, Generator] = dict()
+        self._pools: Dict[Tuple[str, int], Tuple[List[str], int]] = dict()
+
+    def __getstate__(self) -> dict:
+        # resolved generators are closures, the copy in e.g. a worker process resolves its own
+        return dict(self.__dict__, _generators=dict())
+
+    def start_document(self):
+        """
+        Reseed the provider and drop the pooled values so that each document's values only depend on
+        the seed and the document, not on the documents replaced before it
+        """
+        if self.seed is not None:
+            self.provider.seed(self.seed)
+            self._pools.clear()
+
+    def _generator(self, label: str) -> Generator:
+        generator = self._generators.get(label)
+        if generator is None:
+            kind = self.fill_text[label]
+            if callable(kind):
+                generator = lambda length, n: [kind(length) for _ in range(n)]
+            else:
+                generator = self.provider.resolve(kind)
+            self._generators[label] = generator
+        return generator
+
+    def _draw(self, label: str, length: int) -> str:
+        key = (label, length)
+        pool, refill = self._pools.get(key, ([], 1))
+        if not pool:
+            pool = list(reversed(self._generator(label)(length, refill)))
+            self._pools[key] = (pool, min(2 * refill, self.batch_size))
+        return pool.pop()
+
+    def _seeded(self, label: str, length: int, original: str) -> str:
+        digest = hashlib.sha256(f"{self.seed}\0{label}\0{original}".encode("utf-8"))
+        self.provider.seed(int.from_bytes(digest.digest()[:8], "big"))
+        return self._generator(label)(length, 1)[0]
+
+    def __call__(self, label: str, length: int, original: str = None) -> str:
+        """
+        Return the replacement of a redacted prediction
+
+        Arguments:
+            label {str} -- label of the prediction
+            length {int} -- length of the prediction text
+            original {str} -- text of the prediction, if known
+
+        Returns:
+            str -- fake value
+        """
+        if original is None:
+            return self._draw(label, length)
+        key = (label, original)
+        value = self.mapping.get(key)
+        if value is None:
+            if self.seed is None:
+                value = self._draw(label, length)
+            else:
+                value = self._seeded(label, length, original)
+            self.mapping[key] = value
+        return value
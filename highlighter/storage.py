@@ -0,0 +1,279 @@
+"""
+Compact binary cache of an ondocument OCR result.
+
+Layout: MAGIC, a little-endian uint16 format version and uint32 header length, a JSON header
+describing every array (dtype, shape, byte offset) plus a sha256 checksum of the data section,
+then the raw arrays, each aligned to ALIGNMENT bytes so they can be memory-mapped in place.
+"""
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from collections.abc import Sequence as SequenceABC
+from pathlib import Path
+import hashlib
+import json
+import struct
+import numpy as np
+from .tokens import TokenStore
+
+MAGIC = b"ONDOC\x00"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<HI")
+_STORE_ARRAYS = (
+    "page_nums",
+    "dimensions",
+    "token_bounds",
+    "doc_offsets",
+    "page_offsets",
+    "positions",
+    "char_bounds",
+)
+
+
+def _pack_strings(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode strings into one utf-8 blob and (len + 1,) cumulative byte offsets
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    bounds = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=bounds[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), bounds
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_ondoc(ondoc, path: Union[str, Path]):
+    """
+    Write an OnDoc to path in the compact cache format (see OnDoc.save)
+    """
+    store = ondoc.token_store
+    arrays = {name: getattr(store, name) for name in _STORE_ARRAYS}
+    if store.char_confidence is not None:
+        arrays["char_confidence"] = store.char_confidence
+    page_text, token_text, block_text, block_bounds = [], [], [], [0]
+    for page in ondoc.ondoc:
+        page_text.append(page["pages"][0].get("text", ""))
+        token_text.extend(token.get("text", "") for token in page["tokens"])
+        block_text.extend(block["text"] for block in page.get("blocks", []))
+        block_bounds.append(len(block_text))
+    for name, strings in (
+        ("page_text", page_text),
+        ("token_text", token_text),
+        ("block_text", block_text),
+    ):
+        arrays[name], arrays[f"{name}_bounds"] = _pack_strings(strings)
+    arrays["page_block_bounds"] = np.array(block_bounds, dtype=np.int64)
+
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    header = dict(
+        version=FORMAT_VERSION,
+        position_keys=list(store.position_keys),
+        arrays=dict(),
+        # fixed width placeholder, rewritten once the data section has been hashed
+        checksum="0" * 64,
+    )
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        header["arrays"][name] = dict(
+            dtype=array.dtype.str, shape=list(array.shape), offset=offset
+        )
+        offset += array.nbytes
+    header_length = len(json.dumps(header).encode("utf-8"))
+    data_start = _align(len(MAGIC) + _PREFIX.size + header_length)
+
+    checksum = hashlib.sha256()
+    with open(path, "wb") as f:
+        f.seek(data_start)
+        position = 0
+        for name, array in arrays.items():
+            padding = b"\x00" * (header["arrays"][name]["offset"] - position)
+            for data in (padding, array.tobytes()):
+                checksum.update(data)
+                f.write(data)
+            position = header["arrays"][name]["offset"] + array.nbytes
+        header["checksum"] = checksum.hexdigest()
+        f.seek(0)
+        f.write(MAGIC)
+        f.write(_PREFIX.pack(FORMAT_VERSION, header_length))
+        f.write(json.dumps(header).encode("utf-8"))
+        f.write(b"\x00" * (data_start - f.tell()))
+
+
+def load_arrays(
+    path: Union[str, Path], verify: bool = True
+) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """
+    Read the header of a cache file and memory-map its arrays read-only
+
+    Arguments:
+        path {str} -- path written by save_ondoc
+        verify {bool} -- if True, check the sha256 checksum of the data section
+
+    Returns:
+        Tuple[dict, Dict[str, np.ndarray]] -- header and memory-mapped arrays by name
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise Exception(f"{path} is not an OnDoc cache file")
+        version, header_length = _PREFIX.unpack(f.read(_PREFIX.size))
+        if version != FORMAT_VERSION:
+            raise Exception(
+                f"OnDoc cache format version {version} is not supported (expected {FORMAT_VERSION})"
+            )
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    data_start = _align(len(MAGIC) + _PREFIX.size + header_length)
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=data_start)
+    if verify:
+        checksum = hashlib.sha256()
+        for start in range(0, len(data), 1 << 24):
+            checksum.update(data[start : start + (1 << 24)])
+        if checksum.hexdigest() != header["checksum"]:
+            raise Exception(f"Checksum mismatch, {path} is corrupted")
+    arrays = dict()
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = (
+            data[spec["offset"] : spec["offset"] + count * dtype.itemsize]
+            .view(dtype)
+            .reshape(spec["shape"])
+        )
+    return header, arrays
+
+
+class CachedChars(SequenceABC):
+    """
+    Read-only sequence of the character dicts of a cached page, each built when it is accessed
+    """
+
+    def __init__(self, n_chars: int, confidence: Optional[np.ndarray]):
+        self.n_chars = n_chars
+        self.confidence = confidence
+
+    def __len__(self) -> int:
+        return self.n_chars
+
+    def _char(self, char_idx: int) -> dict:
+        if self.confidence is None:
+            return dict()
+        return dict(confidence=float(self.confidence[char_idx]))
+
+    def __getitem__(self, char_idx):
+        if isinstance(char_idx, slice):
+            return [self._char(i) for i in range(*char_idx.indices(len(self)))]
+        if char_idx < 0:
+            char_idx += len(self)
+        if not 0 <= char_idx < len(self):
+            raise IndexError(char_idx)
+        return self._char(char_idx)
+
+    def __iter__(self) -> Iterator[dict]:
+        if self.confidence is None:
+            return (dict() for _ in range(len(self)))
+        return (dict(confidence=value) for value in self.confidence.tolist())
+
+
+class CachedPages:
+    """
+    Read-only sequence of ondocument pages backed by the memory-mapped arrays of a cache file.
+    Page dicts (with the fields kept by the cache) are only built when a page is accessed, and
+    their character dicts only when those are. Text is also served straight from the blobs.
+    """
+
+    def __init__(self, store: TokenStore, arrays: Dict[str, np.ndarray]):
+        self.store = store
+        self.arrays = arrays
+
+    def __len__(self) -> int:
+        return self.store.n_pages
+
+    def __iter__(self) -> Iterator[dict]:
+        return (self[i] for i in range(len(self)))
+
+    def page_text(self) -> List[str]:
+        """
+        Return the text of every page without building the pages
+        """
+        return self._strings("page_text", 0, len(self))
+
+    def block_text(self) -> List[str]:
+        """
+        Return the text of every block without building the pages
+        """
+        return self._strings("block_text", 0, len(self.arrays["block_text_bounds"]) - 1)
+
+    def page_results(self) -> List[dict]:
+        """
+        Return the page-level result of every page without building the pages
+        """
+        store = self.store
+        return [
+            dict(page_num=page_num, size=dict(height=height, width=width), text=text)
+            for page_num, (width, height), text in zip(
+                store.page_nums.tolist(), store.dimensions.tolist(), self.page_text()
+            )
+        ]
+
+    def _strings(self, name: str, start: int, end: int) -> List[str]:
+        blob = self.arrays[name]
+        bounds = self.arrays[f"{name}_bounds"][start : end + 1].tolist()
+        base = bounds[0]
+        data = bytes(blob[base : bounds[-1]])
+        return [
+            data[first - base : last - base].decode("utf-8")
+            for first, last in zip(bounds, bounds[1:])
+        ]
+
+    def __getitem__(self, page_idx: int) -> dict:
+        store = self.store
+        if page_idx < 0:
+            page_idx += len(self)
+        if not 0 <= page_idx < len(self):
+            raise IndexError(page_idx)
+        width, height = store.dimensions[page_idx].tolist()
+        meta = dict(
+            page_num=int(store.page_nums[page_idx]),
+            size=dict(height=height, width=width),
+            text=self._strings("page_text", page_idx, page_idx + 1)[0],
+        )
+        token_slice = store.page_slice(page_idx)
+        texts = self._strings("token_text", token_slice.start, token_slice.stop)
+        tokens = [
+            dict(
+                doc_offset=dict(start=doc_start, end=doc_end),
+                page_offset=dict(start=page_start, end=page_end),
+                position=dict(zip(store.position_keys, position)),
+                text=text,
+            )
+            for (doc_start, doc_end), (page_start, page_end), position, text in zip(
+                store.doc_offsets[token_slice].tolist(),
+                store.page_offsets[token_slice].tolist(),
+                store.positions[token_slice].tolist(),
+                texts,
+            )
+        ]
+        block_bounds = self.arrays["page_block_bounds"]
+        blocks = [
+            dict(text=text)
+            for text in self._strings(
+                "block_text", block_bounds[page_idx], block_bounds[page_idx + 1]
+            )
+        ]
+        n_chars = int(store.char_bounds[page_idx + 1] - store.char_bounds[page_idx])
+        chars = CachedChars(n_chars, store.confidences(page_idx))
+        return dict(pages=[meta], tokens=tokens, chars=chars, blocks=blocks)
+
+
+def load_ondoc(path: Union[str, Path], verify: bool = True) -> Tuple[TokenStore, CachedPages]:
+    """
+    Memory-map a cache file written by save_ondoc (see OnDoc.load)
+    """
+    header, arrays = load_arrays(path, verify)
+    store = TokenStore(
+        position_keys=tuple(header["position_keys"]),
+        char_confidence=arrays.get("char_confidence"),
+        **{name: arrays[name] for name in _STORE_ARRAYS},
+    )
+    return store, CachedPages(store, arrays)
@@ -0,0 +1,191 @@
+from typing import IO, Iterator, Union
+from pathlib import Path
+import codecs
+import hashlib
+import io
+import json
+
+CHUNK_SIZE = 1 << 16
+_WHITESPACE = " \t\n\r"
+
+
+def compact_page(page: dict, keep_text: bool = True) -> dict:
+    """
+    Strip an ondocument page down to the fields used for matching, rendering and the OnDoc
+    helpers: page size and number, token offsets and positions, character confidences and,
+    if keep_text, page, block and token text
+
+    Arguments:
+        page {dict} -- one page of an ondocument OCR result
+        keep_text {bool} -- if False, drop all text to save memory (OnDoc text properties become empty)
+    """
+    meta = page["pages"][0]
+    compact_meta = dict(page_num=meta["page_num"], size=meta["size"])
+    if "doc_offset" in meta:
+        compact_meta["doc_offset"] = meta["doc_offset"]
+    if keep_text:
+        compact_meta["text"] = meta.get("text", "")
+    tokens = []
+    for token in page["tokens"]:
+        compact_token = dict(
+            doc_offset=token["doc_offset"],
+            page_offset=token["page_offset"],
+            position=token["position"],
+        )
+        if keep_text:
+            compact_token["text"] = token.get("text", "")
+        tokens.append(compact_token)
+    compact = dict(pages=[compact_meta], tokens=tokens)
+    chars = page.get("chars")
+    if chars is not None:
+        compact["chars"] = [
+            dict(confidence=char["confidence"]) if "confidence" in char else dict()
+            for char in chars
+        ]
+    if keep_text and "blocks" in page:
+        compact["blocks"] = [dict(text=block["text"]) for block in page["blocks"]]
+    return compact
+
+
+def iter_ondoc_pages(
+    source: Union[str, Path, bytes, IO],
+    compact: bool = True,
+    keep_text: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[dict]:
+    """
+    Incrementally parse an ondocument OCR result (a JSON array of pages) and yield its pages one
+    at a time, so that only the page being parsed is ever held as Python objects
+
+    Arguments:
+        source {str, Path, bytes or file} -- path to the JSON file, its raw bytes, or an open file object
+        compact {bool} -- if True, strip each page with compact_page before yielding it
+        keep_text {bool} -- passed to compact_page
+        chunk_size {int} -- number of bytes read from the source at a time
+
+    Returns:
+        Iterator[dict] -- ondocument pages
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as f:
+            yield from iter_ondoc_pages(f, compact, keep_text, chunk_size)
+        return
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos = "", 0
+
+    def fill(size: int) -> bool:
+        nonlocal buffer, pos
+        data = source.read(size)
+        at_end = not data
+        if isinstance(data, bytes):
+            data = text_decoder.decode(data, final=at_end)
+        buffer = buffer[pos:] + data
+        pos = 0
+        return not at_end
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or not fill(chunk_size):
+                return
+
+    skip_whitespace()
+    if buffer[pos : pos + 1] != "[":
+        raise Exception("ondocument OCR result must be a JSON array of pages")
+    pos += 1
+    expect_page = True
+    while True:
+        skip_whitespace()
+        char = buffer[pos : pos + 1]
+        if char == "]":
+            return
+        if char == "," and not expect_page:
+            pos += 1
+            expect_page = True
+            continue
+        if not char or not expect_page:
+            raise Exception(f"Malformed ondocument OCR result near character {pos}")
+        while True:
+            try:
+                page, end = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                # the page is not fully buffered yet, grow the buffer geometrically
+                if not fill(max(chunk_size, len(buffer) - pos)):
+                    raise
+        pos = end
+        expect_page = False
+        yield compact_page(page, keep_text) if compact else page
+
+
+class PageStream:
+    """
+    Re-iterable view of an ondocument OCR result that parses it page by page on every iteration
+    instead of keeping all pages in memory. Used as OnDoc.ondoc by OnDoc.from_stream.
+    """
+
+    def __init__(
+        self,
+        source: Union[str, Path, bytes, IO],
+        compact: bool = True,
+        keep_text: bool = True,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        """
+        source {str, Path, bytes or file}: path to the JSON file, its raw bytes, or a seekable file object
+        """
+        self.source = source
+        self.compact = compact
+        self.keep_text = keep_text
+        self.chunk_size = chunk_size
+        self._start = (
+            None
+            if isinstance(source, (str, Path, bytes, bytearray, memoryview))
+            else source.tell()
+        )
+
+    def __iter__(self) -> Iterator[dict]:
+        if self._start is not None:
+            self.source.seek(self._start)
+        return iter_ondoc_pages(
+            self.source, self.compact, self.keep_text, self.chunk_size
+        )
+
+    def digest(self) -> str:
+        """
+        Return a sha256 hex digest of the raw serialized result, read in chunks without parsing it
+        """
+        checksum = hashlib.sha256()
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            checksum.update(self.source)
+            return checksum.hexdigest()
+        if isinstance(self.source, (str, Path)):
+            f = open(self.source, "rb")
+        else:
+            f = self.source
+            f.seek(self._start)
+        try:
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    break
+                # text file objects are hashed as the utf-8 they were decoded from
+                checksum.update(data.encode("utf-8") if isinstance(data, str) else data)
+        finally:
+            if f is not self.source:
+                f.close()
+        return checksum.hexdigest()
+
+    def __getitem__(self, page_idx: int) -> dict:
+        if page_idx < 0:
+            raise IndexError("PageStream does not support negative indexing")
+        for i, page in enumerate(self):
+            if i == page_idx:
+                return page
+        raise IndexError(page_idx)
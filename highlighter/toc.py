@@ -0,0 +1,88 @@
+from typing import List, Optional, Tuple
+import textwrap
+import fitz
+from .labels import LabelIndex
+
+FONTSIZE = 13
+MARGIN = 72
+LINE_SPACING = 1.5
+# average Helvetica glyph width as a fraction of the font size, used to wrap long lines
+CHAR_WIDTH = 0.5
+# heading of the page entries, also how has_toc recognizes a document with TOC pages
+PAGES_HEADING = "Pages w/ Extractions found:"
+
+
+def format_counts(counts: dict) -> str:
+    return ", ".join(f"{label} ({count})" for label, count in counts.items())
+
+
+def toc_lines(index: LabelIndex, filename: str, width: int) -> List[Tuple[str, Optional[int]]]:
+    """
+    Lines of the table of contents wrapped to width characters, each with the page number it links to
+    """
+    lines = [(f"File: {filename}", None), ("", None)]
+    summary = "Extractions found: " + format_counts(index.totals)
+    lines.extend((line, None) for line in textwrap.wrap(summary, width))
+    lines.extend([("", None), (PAGES_HEADING, None), ("", None)])
+    for page_num, counts in index.pages.items():
+        entry = f"Page {page_num + 1}: {format_counts(counts)}"
+        lines.extend(
+            (line, page_num)
+            for line in textwrap.wrap(entry, width, subsequent_indent="    ")
+        )
+    return lines
+
+
+def has_toc(doc: fitz.Document) -> bool:
+    """
+    Return whether insert_toc added table of contents pages at the front of doc
+    """
+    return bool(len(doc)) and PAGES_HEADING in doc[0].getText("text")
+
+
+def insert_toc(
+    doc: fitz.Document, index: LabelIndex, filename: str, fontsize: int = FONTSIZE
+) -> int:
+    """
+    Insert table of contents pages at the front of doc, sized like its first page, with a link from
+    every page entry to that page. Long documents get as many TOC pages as needed.
+
+    Arguments:
+        doc {fitz.Document} -- rendered document
+        index {LabelIndex} -- label counts of the document
+        filename {str} -- name of the source PDF shown at the top
+        fontsize {int} -- font size of the entries
+
+    Returns:
+        int -- number of pages inserted
+    """
+    rect = doc[0].rect if len(doc) else fitz.Rect(0, 0, 612, 792)
+    line_height = fontsize * LINE_SPACING
+    lines = toc_lines(index, filename, int((rect.width - 2 * MARGIN) / (fontsize * CHAR_WIDTH)))
+    per_page = max(1, int((rect.height - 2 * MARGIN) // line_height))
+    chunks = [lines[start : start + per_page] for start in range(0, len(lines), per_page)]
+    # links point to page objects, so all TOC pages must exist before they are created
+    for toc_page_num in range(len(chunks)):
+        doc.newPage(toc_page_num, width=rect.width, height=rect.height)
+    for toc_page_num, chunk in enumerate(chunks):
+        page = doc[toc_page_num]
+        for i, (text, target) in enumerate(chunk):
+            baseline = MARGIN + (i + 1) * line_height
+            if text:
+                page.insertText((MARGIN, baseline), text, fontsize=fontsize)
+            if target is not None:
+                # document pages moved back by the number of TOC pages
+                page.insertLink(
+                    {
+                        "kind": fitz.LINK_GOTO,
+                        "page": target + len(chunks),
+                        "to": fitz.Point(0, 0),
+                        "from": fitz.Rect(
+                            MARGIN,
+                            baseline - fontsize,
+                            rect.width - MARGIN,
+                            baseline + fontsize * (LINE_SPACING - 1),
+                        ),
+                    }
+                )
+    return len(chunks)
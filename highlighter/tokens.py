@@ -0,0 +1,228 @@
+from typing import Callable, Iterable, List, Optional, Tuple
+from operator import itemgetter
+import numpy as np
+
+BOX_KEYS = ("bbTop", "bbBot", "bbLeft", "bbRight")
+
+
+class TokenStore:
+    """
+    Columnar view of an ondocument OCR result. Token offsets, bounding boxes, page numbers
+    and character confidences are held in contiguous NumPy arrays, with page boundaries
+    stored as cumulative counts so that a page is always a slice of each array. Character
+    columns are only gathered when they are first used, matching never needs them.
+    """
+
+    def __init__(
+        self,
+        page_nums: np.ndarray,
+        dimensions: np.ndarray,
+        token_bounds: np.ndarray,
+        doc_offsets: np.ndarray,
+        page_offsets: np.ndarray,
+        position_keys: Tuple[str, ...],
+        positions: np.ndarray,
+        char_bounds: np.ndarray = None,
+        char_confidence: Optional[np.ndarray] = None,
+        load_chars: Callable[[], Tuple[np.ndarray, Optional[np.ndarray]]] = None,
+    ):
+        """
+        page_nums {np.ndarray}: (pages,) page number of each page
+        dimensions {np.ndarray}: (pages, 2) OCR width and height of each page
+        token_bounds {np.ndarray}: (pages + 1,) cumulative token count, page i is tokens[bounds[i]:bounds[i + 1]]
+        doc_offsets {np.ndarray}: (tokens, 2) start and end doc_offset of each token
+        page_offsets {np.ndarray}: (tokens, 2) start and end page_offset of each token
+        position_keys {Tuple[str]}: names of the columns of positions
+        positions {np.ndarray}: (tokens, len(position_keys)) token position values
+        char_bounds {np.ndarray}: (pages + 1,) cumulative character count
+        char_confidence {np.ndarray}: (chars,) OCR confidence of each character, None for old OCR results
+        load_chars {Callable}: returns (char_bounds, char_confidence) on first access when they are not given
+        """
+        self.page_nums = page_nums
+        self.dimensions = dimensions
+        self.token_bounds = token_bounds
+        self.doc_offsets = doc_offsets
+        self.page_offsets = page_offsets
+        self.position_keys = tuple(position_keys)
+        self.positions = positions
+        self._char_bounds = char_bounds
+        self._char_confidence = char_confidence
+        self._load_chars = load_chars if char_bounds is None else None
+        self._box_columns = [self.position_keys.index(key) for key in BOX_KEYS]
+
+    @classmethod
+    def from_ondoc(cls, ondoc: Iterable[dict]) -> "TokenStore":
+        """
+        Build the columnar view of the tokens with a single pass over the ondocument pages, the
+        character columns with another pass when they are first used
+
+        Arguments:
+            ondoc {Iterable[dict]} -- ondocument result object from indico.queries.DocumentExtraction
+        """
+        page_nums, dimensions = [], []
+        token_bounds = [0]
+        # doc_offset start, end, page_offset start, end and position values of every token, flat
+        values = []
+        extend = values.extend
+        position_keys = get_position = None
+        for page in ondoc:
+            meta = page["pages"][0]
+            page_nums.append(meta["page_num"])
+            dimensions.append((meta["size"]["width"], meta["size"]["height"]))
+            tokens = page["tokens"]
+            if position_keys is None and tokens:
+                position_keys = tuple(tokens[0]["position"])
+                get_position = itemgetter(*position_keys)
+                if len(position_keys) == 1:
+                    get_position = lambda position, key=position_keys[0]: (position[key],)
+            for token in tokens:
+                doc_offset, page_offset = token["doc_offset"], token["page_offset"]
+                extend((doc_offset["start"], doc_offset["end"]))
+                extend((page_offset["start"], page_offset["end"]))
+                extend(get_position(token["position"]))
+            token_bounds.append(token_bounds[-1] + len(tokens))
+        if position_keys is None:
+            position_keys = BOX_KEYS
+        columns = np.array(values).reshape(-1, 4 + len(position_keys))
+        return cls(
+            page_nums=np.array(page_nums, dtype=np.int32),
+            dimensions=np.array(dimensions).reshape(-1, 2),
+            token_bounds=np.array(token_bounds, dtype=np.int64),
+            doc_offsets=columns[:, 0:2].astype(np.int64),
+            page_offsets=columns[:, 2:4].astype(np.int64),
+            position_keys=position_keys,
+            positions=np.ascontiguousarray(columns[:, 4:]),
+            load_chars=lambda: char_columns(ondoc),
+        )
+
+    def _chars(self):
+        if self._load_chars is not None:
+            self._char_bounds, self._char_confidence = self._load_chars()
+            self._load_chars = None
+
+    @property
+    def char_bounds(self) -> np.ndarray:
+        """
+        Return the (pages + 1,) cumulative character count
+        """
+        self._chars()
+        return self._char_bounds
+
+    @property
+    def char_confidence(self) -> Optional[np.ndarray]:
+        """
+        Return the (chars,) OCR confidence of each character, None for old OCR results
+        """
+        self._chars()
+        return self._char_confidence
+
+    def __len__(self) -> int:
+        return len(self.doc_offsets)
+
+    @property
+    def n_pages(self) -> int:
+        return len(self.page_nums)
+
+    @property
+    def token_page_nums(self) -> np.ndarray:
+        """
+        Return the page number of every token
+        """
+        return np.repeat(self.page_nums, np.diff(self.token_bounds))
+
+    def page_slice(self, page_idx: int) -> slice:
+        """
+        Return the slice of the token arrays that belongs to page_idx
+        """
+        return slice(self.token_bounds[page_idx], self.token_bounds[page_idx + 1])
+
+    def page_spans(self) -> List[Tuple[int, int, int]]:
+        """
+        Return (page index, first start, last end doc_offset) of every page with tokens
+        """
+        pages = np.flatnonzero(np.diff(self.token_bounds))
+        if not len(pages):
+            return []
+        # pages without tokens add nothing to the segments, so each one is exactly a page's tokens
+        bounds = self.token_bounds[pages]
+        firsts = np.minimum.reduceat(self.doc_offsets[:, 0], bounds)
+        lasts = np.maximum.reduceat(self.doc_offsets[:, 1], bounds)
+        return list(zip(pages.tolist(), firsts.tolist(), lasts.tolist()))
+
+    def offsets(
+        self, page_idx: Optional[int] = None, offset_text: str = "doc_offset"
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return token start and end offsets for a page (or the whole document)
+
+        Arguments:
+            page_idx {int} -- index of the page in the ondocument result, None for all tokens
+            offset_text {str} -- "doc_offset" or "page_offset"
+        """
+        if offset_text not in ("doc_offset", "page_offset"):
+            raise Exception(
+                f"offset_text must be either doc_offset or page_offset, not '{offset_text}'"
+            )
+        offsets = self.doc_offsets if offset_text == "doc_offset" else self.page_offsets
+        if page_idx is not None:
+            offsets = offsets[self.page_slice(page_idx)]
+        return offsets[:, 0], offsets[:, 1]
+
+    def boxes(self, page_idx: Optional[int] = None) -> np.ndarray:
+        """
+        Return (tokens, 4) bounding boxes as bbTop, bbBot, bbLeft, bbRight columns
+        """
+        positions = self.positions
+        if page_idx is not None:
+            positions = positions[self.page_slice(page_idx)]
+        return positions[:, self._box_columns]
+
+    def normalized_boxes(
+        self, page_idx: int, width: float, height: float
+    ) -> np.ndarray:
+        """
+        Scale a page's token boxes from OCR pixels to a PDF page of the given size
+
+        Arguments:
+            page_idx {int} -- index of the page in the ondocument result
+            width {float} -- width of the target page (e.g. fitz page.rect[2])
+            height {float} -- height of the target page (e.g. fitz page.rect[3])
+
+        Returns:
+            np.ndarray -- (tokens, 4) boxes as x0, y0, x1, y1 in the order fitz.Rect expects
+        """
+        xnorm = width / self.dimensions[page_idx, 0]
+        ynorm = height / self.dimensions[page_idx, 1]
+        top, bot, left, right = self.boxes(page_idx).T
+        return np.stack([left * xnorm, top * ynorm, right * xnorm, bot * ynorm], axis=1)
+
+    def confidences(self, page_idx: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Return character OCR confidences for a page (or the whole document), None if the
+        OCR result predates confidence scores
+        """
+        if self.char_confidence is None or page_idx is None:
+            return self.char_confidence
+        return self.char_confidence[
+            self.char_bounds[page_idx] : self.char_bounds[page_idx + 1]
+        ]
+
+
+def char_columns(ondoc: Iterable[dict]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Gather the cumulative character count of every page and the character confidences (None if the
+    OCR result predates them) with a single pass over the ondocument pages
+    """
+    char_bounds, confidence = [0], []
+    has_confidence = True
+    for page in ondoc:
+        chars = page.get("chars", [])
+        if chars and "confidence" not in chars[0]:
+            has_confidence = False
+        if has_confidence:
+            confidence.extend(char["confidence"] for char in chars)
+        char_bounds.append(char_bounds[-1] + len(chars))
+    return (
+        np.array(char_bounds, dtype=np.int64),
+        np.array(confidence, dtype=np.float64) if has_confidence and char_bounds[-1] else None,
+    )
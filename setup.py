@@ -8,6 +8,7 @@ setuptools.setup(
     author_email="scott.levin@indico.io",
     tests_require=["pytest>=5.2.1"],
     python_requires=">=3.6",
+    entry_points={"console_scripts": ["pdf-highlighter=highlighter.cli:main"]},
     install_requires=[
         "astroid==2.3.3",
         "attrs==19.3.0",
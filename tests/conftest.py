@@ -1,6 +1,13 @@
 import pytest
 import pickle
 from pathlib import Path
+import fitz
+
+# rendering uses the camelCase API of the pinned PyMuPDF release
+requires_fitz_116 = pytest.mark.skipif(
+    not hasattr(fitz.Page, "addHighlightAnnot"),
+    reason="rendering tests need the PyMuPDF API pinned in requirements.txt",
+)
 
 
 @pytest.fixture(scope="session")
@@ -15,6 +22,10 @@ def full_ondoc_ocr(test_dir):
 def full_preds(test_dir):
     return pickle.load(open(test_dir / "invoice_predictions.p", "rb"))
 
+@pytest.fixture(scope="session")
+def invoice_pdf(test_dir):
+    return str(test_dir / "amazon_invoice.pdf")
+
 
 SAMPLE_OCR = [
     {
@@ -86,3 +97,68 @@ SAMPLE_PREDICTION = [
         }
     ]
 ]
+
+
+def ocr_pages(page_words):
+    """
+    Return an ondocument-shaped OCR result with the given words on each page, one line of words
+    per text line and OCR pixels equal to PDF points
+    """
+    ocr, doc_offset = [], 0
+    for page_num, words in enumerate(page_words):
+        tokens, page_offset = [], 0
+        for i, word in enumerate(words):
+            left, top = 72 + (i % 5) * 90, 72 + (i // 5) * 20
+            position = dict(bbTop=top, bbBot=top + 12, bbLeft=left, bbRight=left + 80)
+            tokens.append(
+                dict(
+                    text=word,
+                    position=position,
+                    page_num=page_num,
+                    doc_offset=dict(start=doc_offset, end=doc_offset + len(word)),
+                    page_offset=dict(start=page_offset, end=page_offset + len(word)),
+                )
+            )
+            doc_offset += len(word) + 1
+            page_offset += len(word) + 1
+        text = " ".join(words)
+        ocr.append(
+            dict(
+                pages=[dict(page_num=page_num, size=dict(width=612, height=792), text=text)],
+                tokens=tokens,
+                chars=[],
+                blocks=[dict(text=text)],
+            )
+        )
+        doc_offset += 1
+    return ocr
+
+
+def build_document(pdf_path, page_words):
+    """
+    Write a PDF with the given words on each page and return its OCR result (see ocr_pages)
+    """
+    ocr = ocr_pages(page_words)
+    doc = fitz.open()
+    for page_ocr in ocr:
+        page = doc.newPage(width=612, height=792)
+        for token in page_ocr["tokens"]:
+            position = token["position"]
+            page.insertText(
+                (position["bbLeft"], position["bbTop"] + 10), token["text"], fontsize=10
+            )
+    doc.save(str(pdf_path))
+    return ocr
+
+
+def prediction(ocr, page_idx, first_token, last_token, label):
+    """
+    Build a prediction spanning tokens first_token..last_token of a page from build_document
+    """
+    tokens = ocr[page_idx]["tokens"][first_token : last_token + 1]
+    return dict(
+        start=tokens[0]["doc_offset"]["start"],
+        end=tokens[-1]["doc_offset"]["end"],
+        label=label,
+        text=" ".join(token["text"] for token in tokens),
+    )
@@ -0,0 +1,84 @@
+"""
+Test process-pool batch rendering
+"""
+import fitz
+from highlighter import BatchJob, ReplacementText, highlight_batch
+from .conftest import (
+    SAMPLE_OCR,
+    SAMPLE_PREDICTION,
+    build_document,
+    prediction,
+    requires_fitz_116,
+)
+
+
+def test_batch_reports_errors(tmp_path):
+    missing = str(tmp_path / "missing.pdf")
+    jobs = [
+        BatchJob(SAMPLE_OCR, SAMPLE_PREDICTION, missing, str(tmp_path / "a.pdf")),
+        (SAMPLE_OCR, SAMPLE_PREDICTION, missing, str(tmp_path / "b.pdf"), "blur"),
+    ]
+    results = sorted(highlight_batch(jobs, max_workers=2), key=lambda r: r.index)
+    assert [result.index for result in results] == [0, 1]
+    assert not any(result.ok for result in results)
+    assert "missing.pdf" in results[0].error
+    assert "blur" in results[1].error
+
+
+@requires_fitz_116
+def test_batch_renders_jobs(full_ondoc_ocr, full_preds, invoice_pdf, tmp_path):
+    fill_text = {pred["label"]: "numerify" for pred in full_preds[0]}
+    jobs = [
+        BatchJob(
+            full_ondoc_ocr,
+            full_preds,
+            invoice_pdf,
+            str(tmp_path / f"{mode}.pdf"),
+            mode,
+            options,
+        )
+        for mode, options in (
+            ("highlight", dict(include_toc=True)),
+            ("redact", dict(color_black=False)),
+            ("replace", dict(fill_text=fill_text, engine="vectorized")),
+            ("replace", dict(fill_text={})),
+        )
+    ]
+    results = {
+        result.index: result
+        for result in highlight_batch(jobs, max_workers=2, chunksize=2)
+    }
+    assert len(results) == 4
+    assert results[0].ok and results[1].ok and results[2].ok
+    assert not results[3].ok
+    assert len(fitz.open(str(tmp_path / "highlight.pdf"))) == 3
+
+
+@requires_fitz_116
+def test_batch_replace_is_consistent_across_documents(tmp_path):
+    # the same name in two documents, after a different number of other names
+    page_words = dict(first=["Dear", "Jane", "Doe"], second=["John", "Roe", "and", "Jane", "Doe"])
+    jobs = []
+    for name, words in page_words.items():
+        ocr = build_document(tmp_path / f"{name}.pdf", [words])
+        preds = [
+            prediction(ocr, 0, i, i + 1, "name")
+            for i, word in enumerate(words)
+            if word in ("John", "Jane")
+        ]
+        jobs.append(
+            BatchJob(
+                ocr,
+                [preds],
+                str(tmp_path / f"{name}.pdf"),
+                str(tmp_path / f"{name}_replaced.pdf"),
+                "replace",
+                dict(fill_text=dict(name="name"), seed=5),
+            )
+        )
+    assert all(result.ok for result in highlight_batch(jobs, max_workers=2))
+    # replace jobs collect the prediction text, so the value follows the original text
+    fake = ReplacementText(dict(name="name"), seed=5)("name", 8, "Jane Doe")
+    for name in page_words:
+        replaced = fitz.open(str(tmp_path / f"{name}_replaced.pdf"))[0].getText()
+        assert replaced.splitlines()[-1] == fake
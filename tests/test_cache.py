@@ -0,0 +1,102 @@
+"""
+Test the collect_positions result cache
+"""
+import copy
+import json
+import pytest
+from highlighter import DiskCache, Highlighter, MemoryCache, OnDoc, PositionCache
+
+
+def test_memory_cache(full_ondoc_ocr, full_preds):
+    cache = MemoryCache(maxsize=2)
+    highlighter = Highlighter(full_ondoc_ocr, cache=cache)
+    first = highlighter.collect_positions(full_preds, inplace=False)
+    assert cache.stats == dict(hits=0, misses=1)
+    second = highlighter.collect_positions(full_preds, inplace=False, engine="vectorized")
+    assert cache.stats == dict(hits=1, misses=1)
+    assert second == first and second is not first
+
+    # a different prediction list or matching argument is a different entry
+    fewer_preds = [full_preds[0][:3]]
+    highlighter.collect_positions(fewer_preds, inplace=False)
+    highlighter.collect_positions(full_preds, inplace=False, include_pred_text=True)
+    assert cache.stats == dict(hits=1, misses=3)
+    assert len(cache) == 2
+    # the least recently used entry was evicted
+    highlighter.collect_positions(full_preds, inplace=False)
+    assert cache.stats == dict(hits=1, misses=4)
+
+
+def test_cache_key_follows_ocr_content(full_ondoc_ocr, full_preds, tmp_path):
+    cache = MemoryCache()
+    Highlighter(full_ondoc_ocr, cache=cache).collect_positions(full_preds)
+    Highlighter(copy.deepcopy(full_ondoc_ocr), cache=cache).collect_positions(full_preds)
+    assert cache.hits == 1
+    path = tmp_path / "invoice.ondoc"
+    OnDoc(full_ondoc_ocr).save(path)
+    Highlighter(OnDoc.load(path), cache=cache).collect_positions(full_preds)
+    assert cache.hits == 2
+
+    # hashed from the token dicts, the token store is only built when matching needs it
+    ondoc = OnDoc(full_ondoc_ocr)
+    assert ondoc.fingerprint == OnDoc.load(path).fingerprint
+    assert ondoc._token_store is None
+
+    moved = copy.deepcopy(full_ondoc_ocr)
+    moved[0]["tokens"][0]["position"]["bbTop"] += 1
+    Highlighter(moved, cache=cache).collect_positions(full_preds)
+    assert cache.stats == dict(hits=2, misses=2)
+
+
+def test_disk_cache(full_ondoc_ocr, full_preds, tmp_path):
+    highlighter = Highlighter(full_ondoc_ocr, cache=DiskCache(tmp_path / "cache"))
+    expected = highlighter.collect_positions(full_preds, inplace=False)
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+    cache = DiskCache(tmp_path / "cache")
+    highlighter = Highlighter(full_ondoc_ocr, cache=cache)
+    highlighter.collect_page_wise_positions(full_preds, inplace=False)
+    highlighter.collect_positions(full_preds)
+    assert highlighter.prediction_positions == expected
+    assert cache.stats == dict(hits=1, misses=1)
+
+
+def test_document_key(full_ondoc_ocr, full_preds):
+    cache = MemoryCache()
+    key = "s3://ocr/invoice.json"
+    expected = Highlighter(full_ondoc_ocr, cache=cache, document_key=key).collect_positions(
+        full_preds, inplace=False
+    )
+    ondoc = OnDoc(full_ondoc_ocr)
+    highlighter = Highlighter(ondoc, cache=cache, document_key=key)
+    assert highlighter.collect_positions(full_preds, inplace=False) == expected
+    assert cache.stats == dict(hits=1, misses=1)
+    # a hit neither hashes nor converts the OCR document
+    assert ondoc._fingerprint is None and ondoc._token_store is None
+    Highlighter(full_ondoc_ocr, cache=cache).collect_positions(full_preds)
+    assert cache.stats == dict(hits=1, misses=2)
+
+
+def test_streamed_document_key(full_ondoc_ocr, full_preds, tmp_path):
+    path = tmp_path / "invoice.json"
+    path.write_text(json.dumps(full_ondoc_ocr))
+    cache = MemoryCache()
+    expected = Highlighter(OnDoc.from_stream(path), cache=cache).collect_positions(
+        full_preds, inplace=False
+    )
+    # a hit only hashes the raw JSON, the stream is never parsed
+    ondoc = OnDoc.from_stream(path.read_bytes())
+    assert ondoc.source_key == OnDoc.from_stream(path).source_key
+    assert Highlighter(ondoc, cache=cache).collect_positions(full_preds, inplace=False) == expected
+    assert cache.stats == dict(hits=1, misses=1)
+    assert ondoc._fingerprint is None and ondoc._token_store is None
+    assert OnDoc(full_ondoc_ocr).source_key is None
+
+
+def test_cache_subclass_must_implement_storage():
+    class Incomplete(PositionCache):
+        def _load(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
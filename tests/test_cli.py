@@ -0,0 +1,92 @@
+"""
+Test the manifest command-line tool
+"""
+import json
+import fitz
+import pytest
+from highlighter.cli import main, read_manifest, run_manifest
+from .conftest import requires_fitz_116
+
+
+def write_manifest(path, entries):
+    path.write_text("".join(json.dumps(entry) + "\n" for entry in entries))
+    return str(path)
+
+
+@pytest.fixture
+def local_files(full_ondoc_ocr, full_preds, tmp_path):
+    (tmp_path / "ocr.json").write_text(json.dumps(full_ondoc_ocr))
+    (tmp_path / "preds.json").write_text(json.dumps(full_preds))
+    return tmp_path
+
+
+def test_read_manifest(tmp_path):
+    manifest = write_manifest(
+        tmp_path / "manifest.jsonl",
+        [
+            dict(pdf="docs/a.pdf", ocr="a.json", predictions="a_preds.json"),
+            dict(pdf="b.pdf", ocr="b.ondoc", predictions="b.json", mode="redact", output="b_out.pdf"),
+        ],
+    )
+    first, second = read_manifest(manifest, output_dir="out")
+    assert first.pdf_path == str(tmp_path / "docs" / "a.pdf")
+    assert first.output_path == "out/a_highlight.pdf"
+    assert second.output_path == str(tmp_path / "b_out.pdf") and second.mode == "redact"
+    with pytest.raises(Exception):
+        read_manifest(write_manifest(tmp_path / "bad.jsonl", [dict(pdf="a.pdf")]))
+
+    # two documents with the same name would overwrite each other's default output
+    same_name = [
+        dict(pdf=f"{folder}/invoice.pdf", ocr=f"{folder}/ocr.json", predictions=f"{folder}/preds.json")
+        for folder in ("a", "b")
+    ]
+    with pytest.raises(Exception, match="also written by line 1"):
+        read_manifest(write_manifest(tmp_path / "same.jsonl", same_name), output_dir="out")
+    same_name[1]["output"] = "out/b_invoice.pdf"
+    assert len(read_manifest(write_manifest(tmp_path / "same.jsonl", same_name))) == 2
+    same_name[1]["output"] = "out/../out/./invoice_highlight.pdf"
+    with pytest.raises(Exception):
+        read_manifest(write_manifest(tmp_path / "same.jsonl", same_name), output_dir=tmp_path / "out")
+
+
+def test_failures_are_retried(local_files):
+    manifest = write_manifest(
+        local_files / "manifest.jsonl",
+        [dict(pdf="missing.pdf", ocr="ocr.json", predictions="preds.json")],
+    )
+    for _ in range(2):
+        summary = run_manifest(manifest, str(local_files / "out"), workers=1)
+        assert summary["failed"] == 1 and summary["skipped"] == 0
+
+
+@requires_fitz_116
+def test_resumable_run(local_files, invoice_pdf):
+    manifest = write_manifest(
+        local_files / "manifest.jsonl",
+        [
+            dict(pdf=str(invoice_pdf), ocr="ocr.json", predictions="preds.json"),
+            dict(
+                pdf=str(invoice_pdf),
+                ocr="ocr.json",
+                predictions="preds.json",
+                mode="redact",
+                options=dict(include_toc=True),
+            ),
+        ],
+    )
+    args = [manifest, "--output-dir", str(local_files / "out"), "--workers", "2"]
+    summary_path = str(local_files / "summary.json")
+    assert main(args + ["--summary", summary_path]) == 0
+    with open(summary_path) as f:
+        summary = json.load(f)
+    assert summary["rendered"] == 2 and summary["skipped"] == 0
+    assert summary["labels"]["documents"] == 2
+    highlighted = fitz.open(str(local_files / "out" / "amazon_invoice_highlight.pdf"))
+    assert sum(len(list(page.annots())) for page in highlighted) > 0
+
+    # finished outputs are skipped, deleted ones rendered again
+    (local_files / "out" / "amazon_invoice_redact.pdf").unlink()
+    summary = run_manifest(manifest, str(local_files / "out"))
+    assert summary["rendered"] == 1 and summary["skipped"] == 1
+    summary = run_manifest(manifest, str(local_files / "out"), restart=True)
+    assert summary["rendered"] == 2
@@ -1,7 +1,16 @@
+import copy
 import pytest
 import pickle
 from highlighter import Highlighter
-from .conftest import SAMPLE_OCR, SAMPLE_PREDICTION
+import fitz
+from .conftest import (
+    SAMPLE_OCR,
+    SAMPLE_PREDICTION,
+    build_document,
+    ocr_pages,
+    prediction,
+    requires_fitz_116,
+)
 
 
 def test_collect_positions():
@@ -29,6 +38,308 @@ def test_collect_positions_multi_page(test_dir):
         inplace=False,
         include_pred_text=True,
     )
-    assert len(prediction_positions) == 2
+    # all predictions are on the first page
+    assert len(prediction_positions) == 1
     assert len(prediction_positions[0]["positions"]) == 10
     assert prediction_positions[0]["positions"][1]["full_text"] == "Amazon Web Services, Inc"
+
+
+def test_match_page_predict_unsorted_tokens():
+    page_ocr = dict(SAMPLE_OCR[0], tokens=SAMPLE_OCR[0]["tokens"][::-1])
+    starts, order = Highlighter._build_offset_index(page_ocr["tokens"])
+    assert starts == [125, 132, 136, 146]
+    assert order == [3, 2, 1, 0]
+    result = Highlighter._match_page_predict(SAMPLE_PREDICTION[0], page_ocr)
+    assert len(result["positions"]) == 1
+    # tokens are still visited in page order, so the last token on the page sets bbRight
+    assert result["positions"][0]["bbLeft"] == 1781
+    assert result["positions"][0]["bbRight"] == 1310
+
+
+@pytest.mark.parametrize("include_pred_text", [True, False])
+def test_vectorized_engine_parity(full_ondoc_ocr, full_preds, include_pred_text):
+    for ocr, preds in ((SAMPLE_OCR, SAMPLE_PREDICTION), (full_ondoc_ocr, full_preds)):
+        highlighter = Highlighter(ocr)
+        loop = highlighter.collect_positions(
+            preds, inplace=False, include_pred_text=include_pred_text
+        )
+        vectorized = highlighter.collect_positions(
+            preds,
+            inplace=False,
+            include_pred_text=include_pred_text,
+            engine="vectorized",
+        )
+        assert vectorized == loop
+
+    page_wise_preds = [full_preds[0][:5], full_preds[0][5:]]
+    highlighter = Highlighter(full_ondoc_ocr)
+    loop = highlighter.collect_page_wise_positions(
+        page_wise_preds, inplace=False, include_pred_text=include_pred_text
+    )
+    vectorized = highlighter.collect_page_wise_positions(
+        page_wise_preds,
+        inplace=False,
+        include_pred_text=include_pred_text,
+        engine="vectorized",
+    )
+    assert vectorized == loop
+
+
+def test_vectorized_engine_multiline_parity():
+    ocr = ocr_pages([[f"word{i}" for i in range(23)]] * 2)
+    # a tall token: the next line starts below the first token of a line, not the previous one
+    ocr[0]["tokens"][9]["position"]["bbBot"] += 30
+    preds = [
+        prediction(ocr, 0, 3, 17, "name"),
+        prediction(ocr, 0, 5, 12, "date"),
+        prediction(ocr, 0, 22, 22, "name"),
+        prediction(ocr, 1, 0, 22, "total"),
+    ]
+    highlighter = Highlighter(ocr)
+    loop = highlighter.collect_positions([preds], inplace=False, include_pred_text=True)
+    vectorized = highlighter.collect_positions(
+        [preds], inplace=False, include_pred_text=True, engine="vectorized"
+    )
+    assert vectorized == loop
+    assert [len(page.positions) for page in loop] == [7, 5]
+
+
+def test_unknown_engine():
+    with pytest.raises(Exception):
+        Highlighter(SAMPLE_OCR).collect_positions(SAMPLE_PREDICTION, engine="gpu")
+
+
+@requires_fitz_116
+def test_render_multiple_outputs(full_ondoc_ocr, full_preds, invoice_pdf, tmp_path):
+    highlighter = Highlighter(full_ondoc_ocr)
+    highlighter.collect_positions(full_preds)
+    highlighter.render(
+        invoice_pdf,
+        [
+            dict(mode="highlight", output_path=str(tmp_path / "hl.pdf"), include_toc=True),
+            dict(mode="redact", output_path=str(tmp_path / "redacted.pdf")),
+        ],
+    )
+    source = fitz.open(invoice_pdf)
+    highlighted = fitz.open(str(tmp_path / "hl.pdf"))
+    assert len(highlighted) == len(source) + 1
+    n_positions = sum(len(page["positions"]) for page in highlighter.prediction_positions)
+    assert sum(len(list(page.annots())) for page in highlighted) == n_positions
+    redacted = fitz.open(str(tmp_path / "redacted.pdf"))
+    assert len(redacted) == len(source)
+    assert "650838019941" in source[0].getText()
+    assert "650838019941" not in redacted[0].getText()
+    with pytest.raises(Exception):
+        highlighter.render(invoice_pdf, [dict(mode="blur", output_path="x.pdf")])
+
+
+@requires_fitz_116
+def test_bulk_highlight(full_ondoc_ocr, full_preds, invoice_pdf, tmp_path):
+    highlighter = Highlighter(full_ondoc_ocr)
+    highlighter.collect_positions(full_preds)
+    output_path = str(tmp_path / "bulk.pdf")
+    highlighter.highlight_pdf(invoice_pdf, output_path, bulk=True)
+    highlighted = fitz.open(output_path)
+    for preds in highlighter.prediction_positions:
+        page = highlighted[preds["page_num"]]
+        labels = {token["label"][0] for token in preds["positions"]}
+        annots = list(page.annots())
+        assert len(annots) == len(labels)
+        # every line fragment is still covered by its label's annotation
+        covered = fitz.Rect()
+        for annot in annots:
+            covered |= annot.rect
+        for rect in highlighter._page_rects(page, preds):
+            assert covered.contains(rect)
+
+
+@requires_fitz_116
+def test_in_memory_input_output(full_ondoc_ocr, full_preds, invoice_pdf, tmp_path):
+    highlighter = Highlighter(full_ondoc_ocr)
+    highlighter.collect_positions(full_preds)
+    with open(invoice_pdf, "rb") as f:
+        pdf_bytes = f.read()
+    output_path = str(tmp_path / "hl.pdf")
+    assert highlighter.highlight_pdf(invoice_pdf, output_path) is None
+    with open(output_path, "rb") as f:
+        expected = [len(list(page.annots())) for page in fitz.open(stream=f.read(), filetype="pdf")]
+    with open(invoice_pdf, "rb") as source:
+        for pdf in (pdf_bytes, memoryview(pdf_bytes), source):
+            output = highlighter.highlight_pdf(pdf, save_options=dict(garbage=3, deflate=True))
+            assert isinstance(output, bytes)
+            highlighted = fitz.open(stream=output, filetype="pdf")
+            assert [len(list(page.annots())) for page in highlighted] == expected
+    redacted, highlighted = highlighter.render(
+        pdf_bytes,
+        [dict(mode="redact"), dict(mode="highlight", output_path=output_path)],
+    )
+    assert highlighted is None
+    assert "650838019941" not in fitz.open(stream=redacted, filetype="pdf")[0].getText()
+    with pytest.raises(Exception):
+        highlighter.highlight_pdf(12)
+
+
+@requires_fitz_116
+def test_redact_and_replace(full_ondoc_ocr, full_preds, invoice_pdf, tmp_path):
+    highlighter = Highlighter(full_ondoc_ocr)
+    highlighter.collect_positions(full_preds)
+    labels = {pred["label"] for pred in full_preds[0]}
+    output_path = str(tmp_path / "replaced.pdf")
+    highlighter.redact_and_replace(
+        invoice_pdf, output_path, fill_text=dict.fromkeys(labels, "numerify")
+    )
+    replaced = fitz.open(output_path)
+    assert "650838019941" not in replaced[0].getText()
+    assert not list(replaced[0].annots())
+
+
+def test_page_wise_skips_empty_pages():
+    words = [f"word{i}" for i in range(10)]
+    ocr = [
+        dict(
+            pages=[dict(page_num=page_num, size=dict(width=612, height=792), text=" ".join(words))],
+            tokens=[
+                dict(
+                    text=word,
+                    page_offset=dict(start=6 * i, end=6 * i + 5),
+                    doc_offset=dict(start=6 * i, end=6 * i + 5),
+                    position=dict(bbTop=0, bbBot=10, bbLeft=30 * i, bbRight=30 * i + 25),
+                )
+                for i, word in enumerate(words)
+            ],
+        )
+        for page_num in range(3)
+    ]
+    preds = [[], [dict(start=6, end=11, label="a", text="word1")], []]
+    for engine in ("loop", "vectorized"):
+        positions = Highlighter(ocr).collect_page_wise_positions(
+            preds, inplace=False, engine=engine
+        )
+        assert [page["page_num"] for page in positions] == [1]
+        assert len(positions[0]["positions"]) == 1
+
+
+@pytest.mark.parametrize("engine", ["loop", "vectorized"])
+def test_cross_page_predictions(engine):
+    words = [f"word{i}" for i in range(10)]
+    # the middle page has no tokens
+    ocr = ocr_pages([words, [], words, words])
+    span = dict(
+        prediction(ocr, 0, 8, 9, "name"),
+        end=ocr[2]["tokens"][1]["doc_offset"]["end"],
+    )
+    preds = [prediction(ocr, 0, 0, 1, "date"), span, prediction(ocr, 2, 5, 5, "date")]
+    highlighter = Highlighter(ocr)
+    routes = [
+        (page_idx, [pred["label"] for pred in page_preds], continued)
+        for page_idx, _, page_preds, continued in highlighter._route_predictions([preds])
+    ]
+    assert routes == [(0, ["date", "name"], 0), (2, ["name", "date"], 1)]
+    highlighter.collect_positions([preds], engine=engine)
+    positions = highlighter.prediction_positions
+    assert [page.page_num for page in positions] == [0, 2]
+    # the span is highlighted on both of its pages, but only counted on the page where it starts
+    assert [len(page.positions) for page in positions] == [2, 2]
+    assert positions[1].positions[0].bbLeft == 72
+    assert dict(positions[0].labels) == dict(name=1, date=1)
+    assert dict(positions[1].labels) == dict(date=1)
+    assert dict(highlighter.label_index.totals) == dict(name=1, date=2)
+    assert highlighter.collect_positions([[]], inplace=False, engine=engine) == []
+
+
+@requires_fitz_116
+def test_highlight_in_place(tmp_path):
+    pdf_path = str(tmp_path / "source.pdf")
+    ocr = build_document(pdf_path, [[f"word{i}" for i in range(10)]] * 3)
+    with open(pdf_path, "rb") as f:
+        original = f.read()
+    highlighter = Highlighter(ocr)
+    highlighter.collect_positions([[prediction(ocr, 1, 2, 4, "name")]])
+    highlighter.highlight_pdf(pdf_path, pdf_path)
+    with open(pdf_path, "rb") as f:
+        updated = f.read()
+    # saved incrementally, the original file is kept as is and the changes appended
+    assert updated.startswith(original) and len(updated) > len(original)
+    assert [len(list(page.annots())) for page in fitz.open(pdf_path)] == [0, 1, 0]
+
+
+@requires_fitz_116
+def test_update_highlights(tmp_path):
+    words = [f"word{i}" for i in range(20)]
+    ocr = build_document(tmp_path / "source.pdf", [words, words, words])
+    preds = [
+        prediction(ocr, 0, 2, 3, "name"),
+        prediction(ocr, 0, 4, 7, "date"),
+        prediction(ocr, 2, 1, 1, "name"),
+    ]
+    highlighter = Highlighter(ocr)
+    highlighter.collect_positions([preds])
+    output_path = str(tmp_path / "highlighted.pdf")
+    highlighter.highlight_pdf(str(tmp_path / "source.pdf"), output_path)
+
+    def annotation_counts():
+        return [len(list(page.annots())) for page in fitz.open(output_path)]
+
+    assert annotation_counts() == [3, 0, 1]
+    size = (tmp_path / "highlighted.pdf").stat().st_size
+
+    updated = dict(preds[2], label="date")
+    changed = highlighter.update_highlights([[preds[0], preds[1], updated]], output_path)
+    assert changed == [2]
+    assert annotation_counts() == [3, 0, 1]
+    # incremental save appends to the file
+    assert (tmp_path / "highlighted.pdf").stat().st_size > size
+    assert highlighter.prediction_positions[1]["labels"] == {"date": 1}
+
+    changed = highlighter.update_highlights([[preds[1], updated]], output_path)
+    assert changed == [0]
+    assert annotation_counts() == [2, 0, 1]
+    assert highlighter.update_highlights([[preds[1], updated]], output_path) == []
+    assert highlighter.prediction_positions == highlighter.collect_positions(
+        [[preds[1], updated]], inplace=False
+    )
+
+    # a reviewer edit made in place is still diffed against the predictions behind the highlights
+    edited = [[dict(preds[1]), dict(updated)]]
+    assert highlighter.update_highlights(edited, output_path) == []
+    edited[0][1]["label"] = "name"
+    assert highlighter.update_highlights(edited, output_path) == [2]
+    assert highlighter.prediction_positions[1]["labels"] == {"name": 1}
+    edited[0][0]["end"] = ocr[0]["tokens"][4]["doc_offset"]["end"]
+    assert highlighter.update_highlights(edited, output_path) == [0]
+    assert annotation_counts() == [1, 0, 1]
+
+    # old results are found by page number, not by their place in prediction_positions
+    highlighter.prediction_positions.reverse()
+    edited[0][1]["label"] = "date"
+    assert highlighter.update_highlights(edited, output_path) == [2]
+    assert [page["labels"] for page in highlighter.prediction_positions] == [
+        {"date": 1}, {"date": 1}
+    ]
+    highlighter.prediction_positions = highlighter.collect_positions(edited, inplace=False)
+    with pytest.raises(Exception, match="replaced"):
+        highlighter.update_highlights(edited, output_path)
+
+    # table of contents pages shift every page of the PDF
+    highlighter.collect_positions(edited)
+    highlighter.highlight_pdf(str(tmp_path / "source.pdf"), output_path, include_toc=True)
+    with pytest.raises(Exception, match="table of contents"):
+        highlighter.update_highlights([[preds[0]]], output_path)
+
+
+@requires_fitz_116
+def test_highlight_low_confidence_regions(full_ondoc_ocr, invoice_pdf, tmp_path):
+    ondoc = copy.deepcopy(full_ondoc_ocr)
+    for page in ondoc:
+        for i, char in enumerate(page["chars"]):
+            char["confidence"] = 20 if i < 10 else 95
+    highlighter = Highlighter(ondoc)
+    highlighter.prediction_positions = highlighter.ocr_result.low_confidence_regions(50)
+    output_path = str(tmp_path / "review.pdf")
+    highlighter.highlight_pdf(
+        invoice_pdf, output_path, color_map=dict(low_confidence="RED"), include_toc=True
+    )
+    highlighted = fitz.open(output_path)
+    n_regions = [len(page.positions) for page in highlighter.prediction_positions]
+    assert [len(list(page.annots())) for page in highlighted] == [0] + n_regions
+    assert "low_confidence" in highlighted[0].getText()
@@ -0,0 +1,70 @@
+"""
+Test the stage timers and counters reported through Highlighter instrumentation
+"""
+import pytest
+from highlighter import Highlighter, MemoryCache, Recorder
+from .conftest import build_document, prediction, requires_fitz_116
+
+
+@pytest.mark.parametrize("engine", ["loop", "vectorized"])
+def test_collect_counters(full_ondoc_ocr, full_preds, engine):
+    events = []
+    recorder = Recorder(callback=lambda *event: events.append(event))
+    highlighter = Highlighter(full_ondoc_ocr, instrumentation=recorder)
+    highlighter.collect_positions(full_preds, engine=engine)
+
+    summary = recorder.summary()
+    assert summary["stages"]["collect"]["calls"] == 1
+    assert summary["stages"]["match"]["calls"] == len(highlighter.prediction_positions)
+    n_positions = sum(len(preds["positions"]) for preds in highlighter.prediction_positions)
+    assert summary["counters"]["positions"] == n_positions
+    assert summary["counters"]["tokens_scanned"] >= n_positions
+    assert recorder.page_counters["positions"][0] == len(
+        highlighter.prediction_positions[0]["positions"]
+    )
+    assert ("stage", "collect") in {event[:2] for event in events}
+    assert "positions" in recorder.report()
+
+
+def test_cache_counters(full_ondoc_ocr, full_preds):
+    recorder = Recorder()
+    highlighter = Highlighter(full_ondoc_ocr, cache=MemoryCache(), instrumentation=recorder)
+    highlighter.collect_positions(full_preds)
+    highlighter.collect_positions(full_preds)
+    assert recorder.counters["cache_misses"] == 1
+    assert recorder.counters["cache_hits"] == 1
+    # the cached result is not matched again
+    assert recorder.summary()["stages"]["collect"]["calls"] == 2
+    recorder.reset()
+    assert recorder.summary() == dict(stages={}, counters={})
+
+
+def test_disabled_by_default(full_ondoc_ocr, full_preds):
+    highlighter = Highlighter(full_ondoc_ocr)
+    assert not highlighter.instrumentation.enabled
+    assert highlighter.collect_positions(full_preds, inplace=False)
+
+
+@requires_fitz_116
+def test_render_stages(tmp_path):
+    pdf_path = str(tmp_path / "source.pdf")
+    ocr = build_document(pdf_path, [[f"word{i}" for i in range(10)]] * 2)
+    recorder = Recorder()
+    highlighter = Highlighter(ocr, instrumentation=recorder)
+    highlighter.collect_positions(
+        [[prediction(ocr, 0, 0, 1, "a"), prediction(ocr, 1, 2, 2, "b")]]
+    )
+    highlighter.render(
+        pdf_path,
+        [
+            dict(mode="highlight", output_path=str(tmp_path / "highlighted.pdf")),
+            dict(mode="redact", output_path=str(tmp_path / "redacted.pdf")),
+        ],
+    )
+    stages = recorder.summary()["stages"]
+    assert stages["open"]["calls"] == 2
+    assert stages["save"]["calls"] == 2
+    assert stages["apply_redactions"]["calls"] == len(highlighter.prediction_positions)
+    n_positions = sum(len(preds["positions"]) for preds in highlighter.prediction_positions)
+    assert recorder.counters["annotations"] == n_positions
+    assert recorder.counters["redactions"] == n_positions
@@ -0,0 +1,61 @@
+"""
+Test the label count index and the table of contents built from it
+"""
+import fitz
+from highlighter import Highlighter, LabelIndex, batch_label_summary
+from highlighter.batch import BatchResult
+from highlighter.toc import insert_toc
+from .conftest import build_document, prediction, requires_fitz_116
+
+
+@requires_fitz_116
+def test_label_index(tmp_path):
+    words = [f"word{i}" for i in range(10)]
+    ocr = build_document(str(tmp_path / "source.pdf"), [words, words, words])
+    preds = [
+        prediction(ocr, 0, 0, 1, "name"),
+        prediction(ocr, 0, 3, 3, "date"),
+        prediction(ocr, 2, 5, 6, "name"),
+    ]
+    highlighter = Highlighter(ocr)
+    highlighter.collect_positions([preds])
+    index = highlighter.label_index
+    assert index is highlighter.label_index
+    assert index.totals == dict(name=2, date=1)
+    assert index.pages == {0: dict(name=1, date=1), 2: dict(name=1)}
+    assert index.pages_with("name") == [0, 2]
+    assert index.to_dict()["totals"] == dict(name=2, date=1)
+    assert "Page 3: name (1)" in highlighter.get_toc_text("source.pdf")
+
+    # rebuilt when the positions change
+    highlighter.collect_positions([preds[2:]])
+    assert highlighter.label_index.pages == {2: dict(name=1)}
+
+
+def test_batch_label_summary():
+    results = [
+        BatchResult(0, "a.pdf", 1.0, labels=dict(name=2, date=1)),
+        BatchResult(1, "b.pdf", 1.0, labels=dict(name=1)),
+        BatchResult(2, "c.pdf", 1.0, error="Traceback"),
+    ]
+    assert batch_label_summary(results) == dict(
+        documents=2,
+        totals=dict(name=3, date=1),
+        document_counts=dict(name=2, date=1),
+    )
+
+
+@requires_fitz_116
+def test_multi_page_toc_links():
+    doc = fitz.open()
+    for _ in range(100):
+        doc.newPage(width=612, height=792)
+    index = LabelIndex({page_num: dict(name=1, date=page_num) for page_num in range(100)})
+    n_toc_pages = insert_toc(doc, index, "long.pdf")
+    assert n_toc_pages > 1
+    assert len(doc) == 100 + n_toc_pages
+    links = [link for i in range(n_toc_pages) for link in doc[i].getLinks()]
+    assert [link["page"] for link in links] == [
+        page_num + n_toc_pages for page_num in range(100)
+    ]
+    assert "Page 1: name (1), date (0)" in doc[0].getText()
@@ -1,6 +1,8 @@
 """
 Test OnDoc class object
 """
+import copy
+import numpy as np
 import pytest
 from highlighter import OnDoc
 
@@ -23,3 +25,146 @@ def test_ondoc_properties(full_ondoc_ocr):
     assert "text" and "page_num" and "size" in page_objects[0].keys()
     with pytest.raises(Exception):
         ocr.ocr_confidence() # Old OCR version doesn't include confidence
+
+
+def test_token_store(full_ondoc_ocr):
+    ocr = OnDoc(full_ondoc_ocr)
+    store = ocr.token_store
+    assert store is ocr.token_store
+    assert store.n_pages == 2
+    assert len(store) == sum(len(page["tokens"]) for page in full_ondoc_ocr)
+    starts, ends = store.offsets(1)
+    assert starts[0] == full_ondoc_ocr[1]["tokens"][0]["doc_offset"]["start"]
+    assert ends[-1] == full_ondoc_ocr[1]["tokens"][-1]["doc_offset"]["end"]
+    page_starts, _ = store.offsets(1, "page_offset")
+    assert page_starts[0] == full_ondoc_ocr[1]["tokens"][0]["page_offset"]["start"]
+    token = full_ondoc_ocr[0]["tokens"][3]["position"]
+    assert store.boxes(0)[3].tolist() == [
+        token["bbTop"], token["bbBot"], token["bbLeft"], token["bbRight"]
+    ]
+    x0, y0, x1, y1 = store.normalized_boxes(0, 612, 792)[3]
+    assert x0 == pytest.approx(token["bbLeft"] * 612 / 2550)
+    assert y1 == pytest.approx(token["bbBot"] * 792 / 3300)
+    assert store.confidences() is None
+
+
+def test_token_store_gathers_chars_lazily(full_ondoc_ocr):
+    ondoc = copy.deepcopy(full_ondoc_ocr)
+    for page in ondoc:
+        for char in page["chars"]:
+            char["confidence"] = 90
+    ondoc[1]["chars"][-1]["confidence"] = 10
+    store = OnDoc(ondoc).token_store
+    # matching never needs the characters, they are gathered on first use
+    assert store._load_chars is not None
+    assert store.char_bounds[-1] == sum(len(page["chars"]) for page in ondoc)
+    assert store.confidences(1)[-1] == 10 and store._load_chars is None
+
+
+def test_ocr_confidence(full_ondoc_ocr):
+    ondoc = copy.deepcopy(full_ondoc_ocr)
+    confidence = []
+    for page in ondoc:
+        for i, char in enumerate(page["chars"]):
+            char["confidence"] = i % 100
+            confidence.append(i % 100)
+    ocr = OnDoc(ondoc)
+    assert ocr.ocr_confidence() == np.mean(confidence)
+    assert ocr.ocr_confidence("median") == np.median(confidence)
+    assert len(ocr.token_store.confidences(1)) == len(ondoc[1]["chars"])
+
+
+def test_cached_properties(full_ondoc_ocr):
+    ocr = OnDoc(full_ondoc_ocr)
+    assert ocr.full_text is ocr.full_text
+    assert ocr.page_text is ocr.page_text
+    store, fingerprint = ocr.token_store, ocr.fingerprint
+    # replacing the OCR result drops everything derived from the old one
+    ocr.ondoc = full_ondoc_ocr[:1]
+    assert ocr.page_text == [full_ondoc_ocr[0]["pages"][0]["text"]]
+    assert ocr.full_text == ocr.page_text[0]
+    assert ocr.token_store is not store and ocr.token_store.n_pages == 1
+    assert ocr.fingerprint != fingerprint
+
+
+def test_page_offsets(full_ondoc_ocr):
+    ocr = OnDoc(full_ondoc_ocr)
+    for page_idx, text in enumerate(ocr.page_text):
+        start, end = ocr.page_span(page_idx)
+        assert ocr.full_text[start:end] == text
+    token = full_ondoc_ocr[1]["tokens"][5]
+    assert ocr.page_index(token["doc_offset"]["start"]) == 1
+    assert ocr.to_page_offset(token["doc_offset"]["start"]) == (
+        1,
+        token["page_offset"]["start"],
+    )
+    assert ocr.page_index(0) == 0
+    assert ocr.page_index(len(ocr.page_text[0])) == 0
+    assert ocr.page_index(len(ocr.full_text) - 1) == 1
+    with pytest.raises(Exception):
+        ocr.page_index(len(ocr.full_text))
+    with pytest.raises(IndexError):
+        ocr.page_span(2)
+
+
+def with_confidence(full_ondoc_ocr, low_chars):
+    """
+    Copy of the OCR result where the characters at the given (page index, char index) have a
+    confidence of 10 and every other character 90
+    """
+    ondoc = copy.deepcopy(full_ondoc_ocr)
+    for page_idx, page in enumerate(ondoc):
+        for i, char in enumerate(page["chars"]):
+            char["confidence"] = 10 if (page_idx, i) in low_chars else 90
+    return ondoc
+
+
+def test_confidence_stats(full_ondoc_ocr):
+    ondoc = with_confidence(full_ondoc_ocr, {(1, i) for i in range(100)})
+    ocr = OnDoc(ondoc)
+    pages = ocr.confidence_stats(percentiles=(5, 50))
+    for page_idx, page in enumerate(ondoc):
+        confidence = [char["confidence"] for char in page["chars"]]
+        assert pages["count"][page_idx] == len(confidence)
+        assert pages["mean"][page_idx] == pytest.approx(np.mean(confidence))
+        assert pages["p5"][page_idx] == pytest.approx(np.percentile(confidence, 5))
+    assert pages["p5"].tolist() == [90, 10] and pages["min"].tolist() == [90, 10]
+
+    blocks = ocr.confidence_stats("block")
+    assert len(blocks["block"]) == len(ocr.block_text)
+    assert blocks["count"].sum() == sum(len(page["chars"]) for page in ondoc)
+    first_block = len(ondoc[0]["blocks"])
+    assert blocks["page"][first_block] == 1 and blocks["min"][first_block] == 10
+    with pytest.raises(Exception):
+        ocr.confidence_stats("line")
+
+
+def test_low_confidence_regions(full_ondoc_ocr):
+    chars = full_ondoc_ocr[0]["chars"]
+    # the first three characters of the page and a single one further down
+    ocr = OnDoc(with_confidence(full_ondoc_ocr, {(0, 0), (0, 1), (0, 2), (0, 20)}))
+    regions = ocr.low_confidence_regions(threshold=50)
+    assert [page.page_num for page in regions] == [0]
+    assert regions[0].dimensions == [2550, 3300]
+    first, single = regions[0].positions
+    assert first.label == ("low_confidence", 3)
+    assert first.bbLeft == chars[0]["position"]["bbLeft"]
+    assert first.bbRight == chars[2]["position"]["bbRight"]
+    assert single.label == ("low_confidence", 1)
+    assert len(ocr.low_confidence_regions(threshold=50, min_chars=2)[0].positions) == 1
+    assert ocr.low_confidence_regions(threshold=5) == []
+
+
+def test_token_spans(full_ondoc_ocr):
+    ocr = OnDoc(full_ondoc_ocr)
+    # read from the token store, so only once it is built
+    assert ocr.token_spans() is None
+    ocr.token_store
+    assert ocr.token_spans() == [
+        (
+            page_idx,
+            min(token["doc_offset"]["start"] for token in page["tokens"]),
+            max(token["doc_offset"]["end"] for token in page["tokens"]),
+        )
+        for page_idx, page in enumerate(full_ondoc_ocr)
+    ]
@@ -0,0 +1,109 @@
+"""
+Test page-parallel rendering of a single PDF
+"""
+from collections import defaultdict
+import fitz
+from highlighter import Highlighter, ReplacementText
+from highlighter.parallel import MIN_PARALLEL_PAGES, split_pages
+from .conftest import requires_fitz_116
+
+
+def test_split_pages():
+    assert split_pages([0, 1, 2, 3, 4], 2) == [[0, 1, 2], [3, 4]]
+    assert split_pages([3, 9], 4) == [[3], [9]]
+    assert split_pages([], 4) == []
+
+
+def make_document(tmp_path, n_pages, pages_with_predictions, include_text=True):
+    doc = fitz.open()
+    prediction_positions = []
+    for page_num in range(n_pages):
+        page = doc.newPage(width=612, height=792)
+        page.insertText((72, 100), f"page {page_num} secret", fontsize=12)
+        if page_num not in pages_with_predictions:
+            continue
+        result = defaultdict(list)
+        result["dimensions"].extend([612, 792])
+        result["page_num"] = page_num
+        result["labels"] = defaultdict(int, secret=1)
+        position = dict(bbTop=88, bbBot=104, bbLeft=70, bbRight=200, label=("secret", 13))
+        if include_text:
+            position["full_text"] = f"page {page_num} secret"
+        result["positions"].append(position)
+        prediction_positions.append(result)
+    doc.setMetadata(dict(title="Contract 42", author="Legal"))
+    doc.setToC([[1, "Intro", 1], [1, "Appendix", n_pages], [2, "Exhibit", n_pages]])
+    pdf_path = str(tmp_path / "source.pdf")
+    doc.save(pdf_path)
+    highlighter = Highlighter([])
+    highlighter.prediction_positions = prediction_positions
+    return highlighter, pdf_path
+
+
+def outline(doc):
+    # bookmarks with their destinations, without the object numbers of the outline items
+    return [
+        [*entry[:3], {key: value for key, value in entry[3].items() if key != "xref"}]
+        for entry in doc.getToC(simple=False)
+    ]
+
+
+@requires_fitz_116
+def test_parallel_render_matches_serial(tmp_path):
+    pages = set(range(0, 2 * MIN_PARALLEL_PAGES, 2))
+    highlighter, pdf_path = make_document(tmp_path, 2 * MIN_PARALLEL_PAGES + 3, pages)
+    for workers in (None, 3):
+        highlighter.render(
+            pdf_path,
+            [
+                dict(mode="highlight", output_path=str(tmp_path / f"hl_{workers}.pdf")),
+                dict(mode="redact", output_path=str(tmp_path / f"red_{workers}.pdf")),
+            ],
+            workers=workers,
+        )
+    for name in ("hl", "red"):
+        serial = fitz.open(str(tmp_path / f"{name}_None.pdf"))
+        parallel = fitz.open(str(tmp_path / f"{name}_3.pdf"))
+        assert len(parallel) == len(serial)
+        # document-level data does not depend on the number of workers
+        assert parallel.metadata == serial.metadata
+        assert outline(parallel) == outline(serial)
+        assert parallel.getToC()[1] == [1, "Appendix", len(serial)]
+        for serial_page, parallel_page in zip(serial, parallel):
+            assert parallel_page.getText() == serial_page.getText()
+            assert len(list(parallel_page.annots())) == len(list(serial_page.annots()))
+    redacted = fitz.open(str(tmp_path / "red_3.pdf"))
+    assert "secret" not in redacted[0].getText()
+    assert "secret" in redacted[1].getText()
+    highlighted = fitz.open(str(tmp_path / "hl_3.pdf"))
+    assert len(list(highlighted[2].annots())) == 1
+
+
+@requires_fitz_116
+def test_parallel_replace_matches_serial(tmp_path):
+    pages = set(range(2 * MIN_PARALLEL_PAGES))
+    mappings = []
+    for include_text in (True, False):
+        highlighter, pdf_path = make_document(
+            tmp_path, 2 * MIN_PARALLEL_PAGES, pages, include_text
+        )
+        for workers in (None, 3):
+            replacements = ReplacementText(dict(secret="name"), seed=3)
+            output_path = str(tmp_path / f"replaced_{include_text}_{workers}.pdf")
+            highlighter.render(
+                pdf_path,
+                [dict(mode="replace", output_path=output_path, fill_text=replacements)],
+                workers=workers,
+            )
+            if include_text:
+                mappings.append(replacements.mapping)
+        serial = fitz.open(str(tmp_path / f"replaced_{include_text}_None.pdf"))
+        parallel = fitz.open(str(tmp_path / f"replaced_{include_text}_3.pdf"))
+        names = set()
+        for serial_page, parallel_page in zip(serial, parallel):
+            assert parallel_page.getText() == serial_page.getText()
+            names.add(serial_page.getText())
+        # values are drawn in this process, chunks do not each restart from the seed
+        assert len(names) == len(pages)
+    # and the mapping of the ReplacementText passed in is filled
+    assert mappings[1] == mappings[0] and len(mappings[0]) == len(pages)
@@ -0,0 +1,114 @@
+"""
+Test the asyncio pipeline against a local fake Indico client
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from types import SimpleNamespace
+import threading
+import fitz
+from highlighter.pipeline import AsyncPipeline, run_pipeline
+from .conftest import requires_fitz_116
+
+
+class Query:
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.__dict__.update(kwargs)
+
+
+FAKE_QUERIES = SimpleNamespace(
+    DocumentExtraction=type("DocumentExtraction", (Query,), {}),
+    JobStatus=type("JobStatus", (Query,), {}),
+    ModelGroupPredict=type("ModelGroupPredict", (Query,), {}),
+    RetrieveStorageObject=type("RetrieveStorageObject", (Query,), {}),
+)
+
+
+class FakeClient:
+    """
+    Returns the fixture payloads, jobs only succeed after a few polls
+    """
+
+    def __init__(self, ocr_result, predictions, polls=2, fail_predict=False):
+        self.ocr_result = ocr_result
+        self.predictions = predictions
+        self.polls = polls
+        self.fail_predict = fail_predict
+        self.jobs = dict()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def _job(self, result):
+        with self.lock:
+            job_id = str(len(self.jobs))
+            self.jobs[job_id] = [0, result]
+        return SimpleNamespace(id=job_id)
+
+    def call(self, request):
+        name = type(request).__name__
+        if name == "DocumentExtraction":
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return [self._job(dict(url="ocr"))]
+        if name == "RetrieveStorageObject":
+            return self.ocr_result
+        if name == "ModelGroupPredict":
+            return self._job(self.predictions)
+        job = self.jobs[request.id]
+        job[0] += 1
+        if job[0] <= self.polls:
+            return SimpleNamespace(status="PENDING", ready=False, result=None)
+        if job[1] is self.predictions:
+            with self.lock:
+                self.in_flight -= 1
+            if self.fail_predict:
+                return SimpleNamespace(status="FAILURE", ready=True, result="boom")
+        result = job[1] if request.wait else None
+        return SimpleNamespace(status="SUCCESS", ready=True, result=result)
+
+
+def test_pipeline_limits_concurrency_and_reports_errors(full_ondoc_ocr, full_preds):
+    client = FakeClient(full_ondoc_ocr, full_preds)
+    documents = [(f"missing_{i}.pdf", f"out_{i}.pdf") for i in range(6)]
+    results = run_pipeline(
+        client,
+        model_id=1,
+        documents=documents,
+        concurrency=2,
+        poll_interval=0.001,
+        executor=ThreadPoolExecutor(2),
+        queries=FAKE_QUERIES,
+    )
+    assert [result.pdf_path for result in results] == [pdf for pdf, _ in documents]
+    # OCR and predictions succeeded, rendering fails on the missing source PDF
+    assert not any(result.ok for result in results)
+    assert all("missing_" in result.error for result in results)
+    assert client.max_in_flight == 2
+
+    failing = FakeClient(full_ondoc_ocr, full_preds, fail_predict=True)
+    results = run_pipeline(
+        failing, 1, documents[:1], poll_interval=0.001, queries=FAKE_QUERIES
+    )
+    assert "FAILURE" in results[0].error
+
+
+@requires_fitz_116
+def test_pipeline_highlights(full_ondoc_ocr, full_preds, invoice_pdf, tmp_path):
+    pipeline = AsyncPipeline(
+        FakeClient(full_ondoc_ocr, full_preds),
+        model_id=1,
+        poll_interval=0.001,
+        queries=FAKE_QUERIES,
+    )
+    documents = [(invoice_pdf, str(tmp_path / f"out_{i}.pdf")) for i in range(3)]
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(
+            pipeline.run(documents, options=dict(include_toc=True))
+        )
+    finally:
+        loop.close()
+    assert all(result.ok for result in results)
+    assert len(fitz.open(documents[0][1])) == 3
@@ -0,0 +1,36 @@
+"""
+Test rasterized redaction outputs
+"""
+import fitz
+from highlighter import Highlighter
+from highlighter.rasterize import MIN_PARALLEL_RASTER_PAGES
+from .conftest import build_document, prediction, requires_fitz_116
+
+
+@requires_fitz_116
+def test_rasterized_redaction(tmp_path, capsys):
+    pdf_path = str(tmp_path / "source.pdf")
+    words = [f"word{i}" for i in range(10)]
+    n_pages = 2 * MIN_PARALLEL_RASTER_PAGES + 1
+    ocr = build_document(pdf_path, [words] * n_pages)
+    # every other page has a prediction
+    preds = [prediction(ocr, page_idx, 2, 3, "name") for page_idx in range(0, n_pages, 2)]
+    highlighter = Highlighter(ocr)
+    highlighter.collect_positions([preds])
+
+    for workers in (None, 2):
+        output_path = str(tmp_path / f"redacted_{workers}.pdf")
+        highlighter.redact_pdf(pdf_path, output_path, rasterize=True, dpi=72, workers=workers)
+        redacted = fitz.open(output_path)
+        assert len(redacted) == n_pages
+        for page_num, page in enumerate(redacted):
+            assert page.rect == fitz.Rect(0, 0, 612, 792)
+            if page_num % 2:
+                assert "word2" in page.getText()
+                assert not page.getImageList()
+            else:
+                # image-only page, nothing left to extract
+                assert not page.getText().strip()
+                assert len(page.getImageList()) == 1
+    # rasterized outputs are safe, no need to warn about converting them
+    assert "*Important*" not in capsys.readouterr().out
@@ -0,0 +1,48 @@
+"""
+Test the prediction_positions records
+"""
+import pickle
+import fitz
+from highlighter import Highlighter, PageResult, Position
+from .conftest import requires_fitz_116
+
+
+def test_position_mapping():
+    token_position = dict(bbTop=1, bbBot=5, bbLeft=2, bbRight=9, top=1, bottom=5)
+    position = Position.from_token(token_position, ("name", 4))
+    assert position.bbRight == 9
+    assert position["bbRight"] == 9 and position["bottom"] == 5
+    assert "label" in position and "full_text" not in position
+    assert position.to_dict() == dict(token_position, label=("name", 4))
+    assert len(position) == 7
+    assert pickle.loads(pickle.dumps(position)) == position
+    assert Position.coerce(position.to_dict()) == position
+
+
+def test_page_result_format(full_ondoc_ocr, full_preds):
+    highlighter = Highlighter(full_ondoc_ocr)
+    pages = highlighter.collect_positions(full_preds, inplace=False, include_pred_text=True)
+    assert all(isinstance(page, PageResult) for page in pages)
+    first = pages[0]
+    assert first["positions"] is first.positions
+    assert first.positions[1].full_text == "Amazon Web Services, Inc"
+    as_dict = first.to_dict()
+    assert as_dict["positions"][1]["full_text"] == "Amazon Web Services, Inc"
+    assert PageResult.coerce(as_dict) == first
+    assert pickle.loads(pickle.dumps(pages)) == pages
+    # pages without predictions have no positions key in the original format
+    assert "positions" not in PageResult([612, 792], 3).to_dict()
+
+
+@requires_fitz_116
+def test_render_dict_positions(full_ondoc_ocr, full_preds, invoice_pdf, tmp_path):
+    highlighter = Highlighter(full_ondoc_ocr)
+    highlighter.collect_positions(full_preds)
+    n_positions = sum(len(page.positions) for page in highlighter.prediction_positions)
+    # positions set by hand in the original dict format still render
+    highlighter.prediction_positions = [
+        page.to_dict() for page in highlighter.prediction_positions
+    ]
+    highlighter.highlight_pdf(invoice_pdf, str(tmp_path / "hl.pdf"))
+    highlighted = fitz.open(str(tmp_path / "hl.pdf"))
+    assert sum(len(list(page.annots())) for page in highlighted) == n_positions
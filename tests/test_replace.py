@@ -0,0 +1,105 @@
+"""
+Test the replacement text of redact_and_replace
+"""
+import pickle
+import fitz
+import pytest
+from highlighter import FakerProvider, Highlighter, ReplacementText, TextProvider
+from .conftest import requires_fitz_116
+
+
+class CountingProvider(TextProvider):
+    def __init__(self):
+        self.resolved = []
+        self.generated = 0
+
+    def resolve(self, kind):
+        self.resolved.append(kind)
+
+        def generate(length, n):
+            values = [f"{kind}{self.generated + i}" for i in range(n)]
+            self.generated += n
+            return values
+
+        return generate
+
+
+def test_pooled_values():
+    provider = CountingProvider()
+    replacements = ReplacementText(dict(name="name", date="date"), provider)
+    values = [replacements("name", 8) for _ in range(5)]
+    assert values == ["name0", "name1", "name2", "name3", "name4"]
+    # pools grow 1, 2, 4 at a time and each label is only resolved once
+    assert provider.generated == 7
+    assert provider.resolved == ["name"]
+    assert replacements("date", 4, "2020-01-01") == replacements("date", 4, "2020-01-01")
+    assert replacements("date", 4, "2021-01-01") != replacements("date", 4, "2020-01-01")
+    assert provider.resolved == ["name", "date"]
+
+
+def test_provider_must_resolve():
+    class Incomplete(TextProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_seeded_values():
+    fill_text = dict(name="name", number="numerify", code=lambda length: "X" * length)
+
+    def replace(replacements):
+        replacements.start_document()
+        return [
+            replacements("name", 10),
+            replacements("name", 10, "Jane Doe"),
+            replacements("number", 6),
+            replacements("code", 3),
+        ]
+
+    first = replace(ReplacementText(fill_text, seed=1))
+    assert first == replace(ReplacementText(fill_text, seed=1))
+    assert len(first[2]) == 6 and first[3] == "XXX"
+    # an original text gets the same value whatever was replaced before it
+    other = ReplacementText(fill_text, seed=1)
+    other("name", 10)
+    assert other("name", 10, "Jane Doe") == first[1]
+
+
+def test_seeding_is_private():
+    fill_text = dict(name="name")
+
+    def unseeded_after_seeded():
+        seeded = ReplacementText(fill_text, seed=1)
+        seeded.start_document()
+        seeded("name", 10)
+        unseeded = ReplacementText(fill_text)
+        return [unseeded("name", 10) for _ in range(3)]
+
+    # seeding one document must not make the next unseeded document predictable
+    assert unseeded_after_seeded() != unseeded_after_seeded()
+    seeded = FakerProvider()
+    seeded.seed(1)
+    assert seeded.fake is not FakerProvider().fake
+    assert pickle.loads(pickle.dumps(seeded)).fake is FakerProvider().fake
+
+
+@requires_fitz_116
+def test_reproducible_replace(full_ondoc_ocr, full_preds, invoice_pdf):
+    highlighter = Highlighter(full_ondoc_ocr)
+    highlighter.collect_positions(full_preds, include_pred_text=True)
+    fill_text = dict.fromkeys({pred["label"] for pred in full_preds[0]}, "name")
+
+    def page_text(seed):
+        replaced = highlighter.redact_and_replace(invoice_pdf, fill_text=fill_text, seed=seed)
+        return fitz.open(stream=replaced, filetype="pdf")[0].getText()
+
+    assert page_text(7) == page_text(7)
+    assert page_text(7) != page_text(8)
+    # a shared ReplacementText reuses its values for texts seen in earlier documents
+    shared = ReplacementText(fill_text)
+    highlighter.redact_and_replace(invoice_pdf, fill_text=shared)
+    mapping = dict(shared.mapping)
+    assert ("Vendor", "Amazon Web Services, Inc") in mapping
+    highlighter.redact_and_replace(invoice_pdf, fill_text=shared)
+    assert shared.mapping == mapping
@@ -0,0 +1,87 @@
+"""
+Test the compact OnDoc cache format
+"""
+import copy
+import pytest
+from highlighter import Highlighter, OnDoc
+from highlighter import storage
+
+
+def test_save_load_roundtrip(full_ondoc_ocr, full_preds, tmp_path):
+    path = tmp_path / "invoice.ondoc"
+    original = OnDoc(full_ondoc_ocr)
+    original.save(path)
+    loaded = OnDoc.load(path)
+    assert loaded.full_text == original.full_text
+    assert loaded.page_text == original.page_text
+    assert loaded.block_text == original.block_text
+    assert (loaded.token_store.positions == original.token_store.positions).all()
+    page = loaded.ondoc[0]
+    assert [token["text"] for token in page["tokens"]] == [
+        token["text"] for token in full_ondoc_ocr[0]["tokens"]
+    ]
+    assert page["tokens"][5]["position"] == full_ondoc_ocr[0]["tokens"][5]["position"]
+    expected = Highlighter(original).collect_positions(full_preds, inplace=False)
+    for engine in ("loop", "vectorized"):
+        positions = Highlighter(loaded).collect_positions(
+            full_preds, inplace=False, engine=engine
+        )
+        assert positions == expected
+    with pytest.raises(Exception):
+        loaded.ocr_confidence()
+
+
+def test_load_confidence(full_ondoc_ocr, tmp_path):
+    ondoc = copy.deepcopy(full_ondoc_ocr)
+    for page in ondoc:
+        for i, char in enumerate(page["chars"]):
+            char["confidence"] = i % 97
+    path = tmp_path / "confidence.ondoc"
+    OnDoc(ondoc).save(path)
+    assert OnDoc.load(path).ocr_confidence() == OnDoc(ondoc).ocr_confidence()
+
+
+def test_load_rejects_bad_files(full_ondoc_ocr, tmp_path):
+    path = tmp_path / "invoice.ondoc"
+    OnDoc(full_ondoc_ocr).save(path)
+    data = bytearray(path.read_bytes())
+    data[-10] ^= 0xFF
+    corrupted = tmp_path / "corrupted.ondoc"
+    corrupted.write_bytes(bytes(data))
+    with pytest.raises(Exception, match="Checksum"):
+        OnDoc.load(corrupted)
+    OnDoc.load(corrupted, verify=False)
+
+    data = bytearray(path.read_bytes())
+    data[len(storage.MAGIC)] = storage.FORMAT_VERSION + 1
+    newer = tmp_path / "newer.ondoc"
+    newer.write_bytes(bytes(data))
+    with pytest.raises(Exception, match="version"):
+        OnDoc.load(newer)
+    with pytest.raises(Exception):
+        OnDoc.load(tmp_path.parent / "missing.ondoc")
+
+
+def test_loaded_pages_are_built_on_demand(full_ondoc_ocr, full_preds, tmp_path, monkeypatch):
+    path = tmp_path / "invoice.ondoc"
+    OnDoc(full_ondoc_ocr).save(path)
+    loaded = OnDoc.load(path)
+    built = []
+    getitem = storage.CachedPages.__getitem__
+
+    def counting_getitem(pages, page_idx):
+        built.append(page_idx)
+        return getitem(pages, page_idx)
+
+    monkeypatch.setattr(storage.CachedPages, "__getitem__", counting_getitem)
+    expected = [getitem(loaded.ondoc, i)["pages"][0] for i in range(len(loaded.ondoc))]
+    assert loaded.page_results == expected
+    assert loaded.full_text == OnDoc(full_ondoc_ocr).full_text and loaded.block_text
+    Highlighter(loaded).collect_positions(full_preds, engine="vectorized")
+    assert built == []
+    # the loop engine only builds the pages that receive predictions
+    preds = [[pred for pred in full_preds[0] if pred["end"] < len(loaded.page_text[0])]]
+    Highlighter(loaded).collect_positions(preds)
+    assert built == [0]
+    chars = getitem(loaded.ondoc, 1)["chars"]
+    assert len(chars) == len(full_ondoc_ocr[1]["chars"]) and list(chars) == chars[:]
@@ -0,0 +1,44 @@
+"""
+Test streaming ondocument ingestion
+"""
+import io
+import json
+import pytest
+from highlighter import Highlighter, OnDoc
+from highlighter.stream import iter_ondoc_pages
+
+
+@pytest.fixture(scope="module")
+def ocr_json(full_ondoc_ocr, tmp_path_factory):
+    path = tmp_path_factory.mktemp("stream") / "ocr.json"
+    with open(path, "w") as f:
+        json.dump(full_ondoc_ocr, f, indent=1)
+    return path
+
+
+def test_iter_pages(full_ondoc_ocr, ocr_json):
+    raw = ocr_json.read_bytes()
+    for source in (ocr_json, raw, io.BytesIO(raw), io.StringIO(raw.decode())):
+        pages = list(iter_ondoc_pages(source, compact=False, chunk_size=100))
+        assert pages == full_ondoc_ocr
+    assert list(iter_ondoc_pages(b" [ ] ")) == []
+    with pytest.raises(Exception):
+        list(iter_ondoc_pages(b'[{"pages": []}'))
+    with pytest.raises(Exception):
+        list(iter_ondoc_pages(b'{"pages": []}'))
+
+
+def test_streamed_ondoc(full_ondoc_ocr, full_preds, ocr_json):
+    expected = Highlighter(full_ondoc_ocr).collect_positions(full_preds, inplace=False)
+    streamed = OnDoc.from_stream(ocr_json)
+    assert streamed.full_text == OnDoc(full_ondoc_ocr).full_text
+    assert streamed.block_text == OnDoc(full_ondoc_ocr).block_text
+    for engine in ("loop", "vectorized"):
+        positions = Highlighter(streamed).collect_positions(
+            full_preds, inplace=False, engine=engine
+        )
+        assert positions == expected
+    page = streamed.ondoc[1]
+    assert set(page) == {"pages", "tokens", "chars", "blocks"}
+    assert set(page["tokens"][0]) == {"doc_offset", "page_offset", "position", "text"}
+    assert "text" not in OnDoc.from_stream(ocr_json, keep_text=False).ondoc[0]["tokens"][0]